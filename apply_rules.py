@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+@name           apply_rules.py
+@author         yoshi0518
+@description    ルールに従って直近のメッセージのラベルを変更する
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import logging
+import os
+
+import lib.gmail
+import lib.rules
+
+
+##### 定数宣言 #####
+LOG_LEVEL = logging.INFO
+# LOG_LEVEL = logging.DEBUG
+LOG_MESSAGE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+PATH_RULES = "./config/rules.json" # ルールのファイル(ない場合はRULESを使う)
+RULES = [
+    {
+        "name": "invoice",
+        "match": {"from": ["@example.com"], "subject": ["請求書", "invoice"]},
+        "actions": {"add_labels": ["Invoice"], "archive": True},
+    },
+    {
+        "name": "chatwork",
+        "match": {"from": ["info@chatwork.com"], "labels": ["INBOX"]},
+        "actions": {"add_labels": ["Chatwork_eigyo"], "mark_read": True},
+        "stop": True,
+    },
+]
+
+
+if __name__ == "__main__":
+
+    # ロギング準備
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format=LOG_MESSAGE_FORMAT,
+        datefmt=LOG_DATE_FORMAT
+    )
+    logger = logging.getLogger(__name__)
+
+    # 処理開始
+    logger.info(__file__ + " start" + lib.gmail.location())
+
+    # Gmailオブジェクトを取得
+    gmail = lib.gmail.GmailClass()
+
+    # ルールを読み込み、ラベル名をラベルIDに変換できるようにする
+    rules = lib.rules.load_rules(PATH_RULES) if os.path.exists(PATH_RULES) else RULES
+    labels = gmail.get_labels()
+    if labels is None:
+        # ラベル名をラベルIDに変換できないため、ラベルを変更しない
+        logger.warning("no label data!")
+    else:
+        label_map = {label["name"]: label["id"] for label in labels}
+        engine = lib.rules.RuleEngineClass(rules, label_map=label_map)
+
+        # 直近1日のメッセージを1回ずつ取得してすべてのルールを判定し、ラベルをまとめて変更
+        result = engine.run(gmail, query="newer_than:1d")
+        logger.info("messages: " + str(result["messages"]) + lib.gmail.location())
+        logger.info("matched: " + str(result["matched"]) + lib.gmail.location())
+        logger.info("modified: " + str(result["modified"]) + lib.gmail.location())
+        if result["failed"]:
+            logger.warning("failed: " + str(result["failed"]) + lib.gmail.location())
+
+    # 処理終了
+    logger.info(__file__ + " end" + lib.gmail.location())
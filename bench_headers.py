@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+@name           bench_headers.py
+@author         yoshi0518
+@description    ヘッダーのみの取得のベンチマーク(get_messages と scan_headers)
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+from itertools import islice
+import logging
+import time
+import tracemalloc
+
+import lib.gmail
+
+
+##### 定数宣言 #####
+LOG_LEVEL = logging.INFO
+# LOG_LEVEL = logging.DEBUG
+LOG_MESSAGE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+QUERY = "newer_than:30d" # 対象のメッセージの検索クエリ
+COUNT = 200 # 取得するメッセージ数
+
+
+def bench(name, func, message_ids):
+    """
+    【処理内容】
+    メッセージを取得し、1秒あたりの取得数と最大メモリ使用量を出力する
+    【引数】
+    name：計測名
+    func：メッセージIDのリストを引数に取り、取得結果のリストを返す関数
+    message_ids：メッセージIDのリスト
+    【戻り値】
+    (1秒あたりの取得数, 最大メモリ使用量(バイト))
+    """
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    results = func(message_ids)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    logger.info(
+        f"{name}: {len(results)} messages {len(results) / elapsed:.1f} messages/sec peak {peak / 1024:.0f} KiB"
+        + lib.gmail.location()
+    )
+
+    return len(results) / elapsed, peak
+
+
+if __name__ == "__main__":
+
+    # ロギング準備
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format=LOG_MESSAGE_FORMAT,
+        datefmt=LOG_DATE_FORMAT
+    )
+    logger = logging.getLogger(__name__)
+
+    # 処理開始
+    logger.info(__file__ + " start" + lib.gmail.location())
+
+    # Gmailオブジェクトを取得
+    gmail = lib.gmail.GmailClass()
+
+    # メッセージIDを取得
+    message_ids = [message_id["id"] for message_id in islice(gmail.iter_message_ids(query=QUERY), COUNT)]
+    logger.info("message_ids: " + str(len(message_ids)) + lib.gmail.location())
+
+    # 現在の処理(1件ずつformat=fullで取得して辞書に変換)
+    current, current_peak = bench("get_messages", gmail.get_messages, message_ids)
+
+    # ヘッダーのみをバッチリクエストで取得
+    scanned, scanned_peak = bench("scan_headers", lambda ids: list(gmail.scan_headers(ids)), message_ids)
+
+    logger.info(
+        f"speedup: {scanned / current:.1f}x memory: {scanned_peak / max(current_peak, 1):.2f}x" + lib.gmail.location()
+    )
+
+    # 処理終了
+    logger.info(__file__ + " end" + lib.gmail.location())
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+@name           bench_template.py
+@author         yoshi0518
+@description    メッセージ作成のベンチマーク(create_message_files と テンプレート)
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import logging
+import time
+
+import lib.gmail
+import lib.template
+
+
+##### 定数宣言 #####
+LOG_LEVEL = logging.INFO
+# LOG_LEVEL = logging.DEBUG
+LOG_MESSAGE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+COUNT = 100 # 作成するメッセージ数
+
+
+def bench(name, func):
+    """
+    【処理内容】
+    メッセージをCOUNT件作成し、1秒あたりの作成数を出力する
+    【引数】
+    name：計測名
+    func：宛先の連番を引数に取り、メッセージを作成する関数
+    【戻り値】
+    1秒あたりの作成数
+    """
+
+    start = time.perf_counter()
+    for index in range(COUNT):
+        func(index)
+    elapsed = time.perf_counter() - start
+
+    logger.info(f"{name}: {COUNT / elapsed:.1f} messages/sec" + lib.gmail.location())
+
+    return COUNT / elapsed
+
+
+if __name__ == "__main__":
+
+    # ロギング準備
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format=LOG_MESSAGE_FORMAT,
+        datefmt=LOG_DATE_FORMAT
+    )
+    logger = logging.getLogger(__name__)
+
+    # 処理開始
+    logger.info(__file__ + " start" + lib.gmail.location())
+
+    # メッセージの作成のみ計測するため、認証は行わない
+    gmail = lib.gmail.GmailClass.__new__(lib.gmail.GmailClass)
+    gmail._logger = logging.getLogger(lib.gmail.__name__)
+
+    # メール本文ファイルを開く
+    with open("body.txt", "r", encoding="utf-8") as fp:
+        body = fp.read()
+
+    # 添付ファイルリスト
+    files = [
+        "./attach/sample.csv",
+        "./attach/sample.docx",
+        "./attach/sample.jpg",
+        "./attach/sample.pdf",
+        "./attach/sample.png",
+        "./attach/sample.pptx",
+        "./attach/sample.txt",
+        "./attach/sample.xlsx",
+    ]
+
+    # 現在の処理
+    current = bench(
+        "create_message_files",
+        lambda index: gmail.create_message_files(__file__, body, files, "from@example.com", f"to{index}@example.com"),
+    )
+
+    # テンプレート(作成時間を含む)
+    def render(index):
+        if index == 0:
+            render.template = lib.template.MessageTemplateClass(gmail, __file__, "$name\n" + body, "from@example.com", files)
+        return render.template.render(f"to{index}@example.com", name=f"to{index}")
+
+    templated = bench("MessageTemplateClass", render)
+
+    logger.info(f"speedup: {templated / current:.1f}x" + lib.gmail.location())
+
+    # 処理終了
+    logger.info(__file__ + " end" + lib.gmail.location())
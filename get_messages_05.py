@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+@name           get_messages_05.py
+@author         yoshi0518
+@description    メッセージを取得する(取得はスレッド、解析はプロセスで並列実行)
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import logging
+
+import lib.gmail
+import lib.pipeline
+
+
+##### 定数宣言 #####
+LOG_LEVEL = logging.INFO
+# LOG_LEVEL = logging.DEBUG
+LOG_MESSAGE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+if __name__ == "__main__":
+
+    # ロギング準備
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format=LOG_MESSAGE_FORMAT,
+        datefmt=LOG_DATE_FORMAT
+    )
+    logger = logging.getLogger(__name__)
+
+    # 処理開始
+    logger.info(__file__ + " start" + lib.gmail.location())
+
+    # Gmailオブジェクトを取得
+    gmail = lib.gmail.GmailClass()
+
+    # パイプラインを取得(取得16スレッド、解析はCPUコア数のプロセス)
+    pipeline = lib.pipeline.PipelineClass(gmail, io_workers=16)
+
+    # メッセージIDを取得しながら、メッセージを取得・解析
+    message_ids = (message_id["id"] for message_id in gmail.iter_message_ids(query="newer_than:7d"))
+
+    count = 0
+    for message in pipeline.get_messages(message_ids, fmt="raw"):
+        logger.debug("message: " + str(message) + lib.gmail.location())
+        count += 1
+
+    logger.info("count: " + str(count) + lib.gmail.location())
+
+    # 処理終了
+    logger.info(__file__ + " end" + lib.gmail.location())
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+@name           get_messages_06.py
+@author         yoshi0518
+@description    ラベルごとのメッセージを一覧の取得と重ねて取得する(ページサイズ・並列数は自動で調整)
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import logging
+
+import lib.gmail
+import lib.sweep
+
+
+##### 定数宣言 #####
+LOG_LEVEL = logging.INFO
+# LOG_LEVEL = logging.DEBUG
+LOG_MESSAGE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+if __name__ == "__main__":
+
+    # ロギング準備
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format=LOG_MESSAGE_FORMAT,
+        datefmt=LOG_DATE_FORMAT
+    )
+    logger = logging.getLogger(__name__)
+
+    # 処理開始
+    logger.info(__file__ + " start" + lib.gmail.location())
+
+    # Gmailオブジェクトを取得
+    gmail = lib.gmail.GmailClass()
+
+    # ラベルIDを取得
+    label_ids = gmail.get_label_ids(["Chatwork_eigyo", "Chatwork_soudan"])
+    logger.info("label_ids: " + str(label_ids) + lib.gmail.location())
+
+    # スイープを取得(ページサイズ100、4並列から開始)
+    sweep = lib.sweep.SweepClass(gmail, page_size=100, workers=4)
+
+    # ラベルごとにメッセージを取得
+    counts = {}
+    for label_id, message in sweep.sweep_labels(label_ids):
+        logger.debug("message: " + str(message) + lib.gmail.location())
+        counts[label_id] = counts.get(label_id, 0) + 1
+
+    logger.info("counts: " + str(counts) + lib.gmail.location())
+    logger.info("stats: " + str(sweep.stats) + " page_size: " + str(sweep.page_size) + " workers: " + str(sweep.workers) + lib.gmail.location())
+
+    # 処理終了
+    logger.info(__file__ + " end" + lib.gmail.location())
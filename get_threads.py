@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+@name           get_threads.py
+@author         yoshi0518
+@description    スレッドを取得し、会話を組み立てる
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import logging
+
+import lib.conversation
+import lib.gmail
+
+
+##### 定数宣言 #####
+LOG_LEVEL = logging.INFO
+# LOG_LEVEL = logging.DEBUG
+LOG_MESSAGE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+if __name__ == "__main__":
+
+    # ロギング準備
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format=LOG_MESSAGE_FORMAT,
+        datefmt=LOG_DATE_FORMAT
+    )
+    logger = logging.getLogger(__name__)
+
+    # 処理開始
+    logger.info(__file__ + " start" + lib.gmail.location())
+
+    # Gmailオブジェクトを取得
+    gmail = lib.gmail.GmailClass()
+
+    # スレッドIDを取得
+    thread_ids = gmail.get_thread_ids(count=10)
+    logger.info("thread_ids: " + str(thread_ids) + lib.gmail.location())
+
+    if thread_ids is None:
+        logger.warning("no result data!")
+    else:
+        # スレッドを取得して会話を組み立てる(1スレッド1リクエスト)
+        index = lib.conversation.ConversationIndexClass()
+        index.add_threads(gmail.get_threads([thread_id["id"] for thread_id in thread_ids]))
+
+        for conversation in index.get_conversations():
+            logger.info("conversation: " + conversation.thread_id + " " + str(conversation.subject) + lib.gmail.location())
+            for message in conversation.messages:
+                parent = index.get_parent(message)
+                parent_id = parent[1]["id"] if parent else None
+                logger.info("  " + message["id"] + " from: " + message.get("from", "") + " reply_to: " + str(parent_id) + lib.gmail.location())
+
+    # 処理終了
+    logger.info(__file__ + " end" + lib.gmail.location())
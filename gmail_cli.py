@@ -4,13 +4,16 @@
 @author         yoshi0518
 @description    Gmail送信CLI
 @created        2020/11/14
-@modified       2020/11/14
+@modified       2026/10/19
 """
 
 import logging
 from optparse import OptionParser
+import os
 
-import lib.gmail
+import lib.daemon
+import lib.profiler
+import lib.util
 
 
 ##### 定数宣言 #####
@@ -20,11 +23,128 @@ LOG_MESSAGE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
 LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
 
 
+def send_direct(options, body, files):
+    """
+    【処理内容】
+    Gmail APIでメッセージを送信する
+    【引数】
+    options：コマンドラインオプション
+    body：本文
+    files：添付ファイルのリスト
+    【戻り値】
+    message_id：メッセージID
+    """
+
+    # Gmail APIのライブラリはデーモンを利用しない場合のみ読み込む
+    with lib.profiler.phase("import"):
+        import lib.gmail
+        import lib.ledger
+
+    # Gmailオブジェクトを取得
+    gmail = lib.gmail.GmailClass(
+        user_id=options.user_id,
+        path_json=options.path_json,
+        path_pickle=options.path_pickle,
+    )
+
+    # メッセージを送信
+    if options.idempotency_key or options.ledger:
+        ledger = lib.ledger.SendLedgerClass(options.ledger or "send_ledger.db")
+        message_id = gmail.send_message_idempotent(
+            ledger,
+            options.subject,
+            body,
+            options.sender,
+            options.to,
+            cc=options.cc,
+            bcc=options.bcc,
+            files=files,
+            key=options.idempotency_key
+        )
+        ledger.close()
+    else:
+        message_id = gmail.send_message(
+            options.subject,
+            body,
+            options.sender,
+            options.to,
+            cc=options.cc,
+            bcc=options.bcc,
+            files=files
+        )
+
+    return message_id
+
+
+def send_daemon(options, body, files):
+    """
+    【処理内容】
+    デーモンにメッセージの送信を依頼する
+    【引数】
+    options：コマンドラインオプション
+    body：本文
+    files：添付ファイルのリスト
+    【戻り値】
+    message_id：メッセージID
+    """
+
+    client = lib.daemon.DaemonClientClass(options.daemon, token=options.daemon_token)
+
+    args = {
+        "subject": options.subject,
+        "body": body,
+        "sender": options.sender,
+        "to": options.to,
+        "cc": options.cc,
+        "bcc": options.bcc,
+        # デーモンの作業ディレクトリに依存しないよう絶対パスにする
+        "files": [os.path.abspath(file) for file in files] if files else None,
+    }
+    if options.idempotency_key or options.ledger:
+        args["idempotent"] = True
+        args["idempotency_key"] = options.idempotency_key
+        # 直接送信する場合と同じ台帳で重複を防止する(未指定の場合はデーモンの台帳)
+        if options.ledger:
+            args["ledger"] = os.path.abspath(options.ledger)
+
+    with lib.profiler.phase("daemon"):
+        return client.request("send", **args)
+
+
+def send(options, files):
+    """
+    【処理内容】
+    本文を読み込み、デーモンまたはGmail APIでメッセージを送信する
+    デーモンが起動していない場合はGmail APIで送信する
+    【引数】
+    options：コマンドラインオプション
+    files：添付ファイルのリスト
+    【戻り値】
+    message_id：メッセージID
+    """
+
+    # メール本文ファイルを開く
+    with lib.profiler.phase("read_body"):
+        with open(options.message_file, "r", encoding="utf-8") as fp:
+            body = fp.read()
+
+    # デーモンが起動していればデーモンに送信を依頼する
+    if options.daemon:
+        try:
+            return send_daemon(options, body, files)
+        except (ConnectionRefusedError, FileNotFoundError):
+            logger.info("daemon is not running: " + options.daemon + lib.util.location())
+
+    return send_direct(options, body, files)
+
+
 def main():
 
     usage = """
   %prog -s "subject" -m "message_file.txt" -f "from@example.com" -t "to@example.com"
     [options] -c "cc@example.com" -b "bcc@example.com" -u "me" -j "credentials.json" -p "token.pickle"
+    [options] -k "idempotency_key" -L "send_ledger.db" -d "./config/gmail_daemon.sock" -T "shared token"
+    [options] -P "profile.json" --profile_cprofile --profile_memory
     [args] "attach_file1" "asttach_file2"... """
 
     parser = OptionParser(usage=usage)
@@ -56,47 +176,68 @@ def main():
     # アクセストークンファイル
     parser.add_option("-p", "--path_pickle", action="store", type="string", dest="path_pickle", help="path_pickle", default="token.pickle")
 
+    # 冪等キー
+    parser.add_option("-k", "--idempotency_key", action="store", type="string", dest="idempotency_key", help="idempotency key (default: derived from the message)", default=None)
+
+    # 送信台帳ファイル(指定すると重複送信を防止する)
+    parser.add_option("-L", "--ledger", action="store", type="string", dest="ledger", help="send ledger file", default=None)
+
+    # デーモンの待ち受けアドレス(起動していればデーモンに送信を依頼する)
+    parser.add_option("-d", "--daemon", action="store", type="string", dest="daemon", help="daemon address (socket path or host:port)", default=None)
+
+    # デーモンの共有トークン(デーモンに指定した場合)
+    parser.add_option("-T", "--daemon_token", action="store", type="string", dest="daemon_token", help=f"daemon shared token (default: ${lib.daemon.TOKEN_ENV})", default=os.environ.get(lib.daemon.TOKEN_ENV))
+
+    # 処理時間のレポートファイル(指定すると計測する)
+    parser.add_option("-P", "--profile", action="store", type="string", dest="profile", help="profile report file (json)", default=None)
+
+    # 関数ごとの処理時間を計測する(cProfile)
+    parser.add_option("--profile_cprofile", action="store_true", dest="profile_cprofile", help="include cProfile stats in the report", default=False)
+
+    # メモリ確保を計測する(tracemalloc)
+    parser.add_option("--profile_memory", action="store_true", dest="profile_memory", help="include tracemalloc stats in the report", default=False)
+
     # 引数を取得
     options, files = parser.parse_args()
 
-    logger.debug("subject: " + str(options.subject) + lib.gmail.location())
-    logger.debug("message_file: " + str(options.message_file) + lib.gmail.location())
-    logger.debug("from: " + str(options.sender) + lib.gmail.location())
-    logger.debug("to: " + str(options.to) + lib.gmail.location())
-    logger.debug("cc: " + str(options.cc) + lib.gmail.location())
-    logger.debug("bcc: " + str(options.bcc) + lib.gmail.location())
-    logger.debug("user_id: " + str(options.user_id) + lib.gmail.location())
-    logger.debug("path_json: " + str(options.path_json) + lib.gmail.location())
-    logger.debug("path_pickle: " + str(options.path_pickle) + lib.gmail.location())
-    logger.debug("files: " + str(files) + lib.gmail.location())
-
-    # メール本文ファイルを開く
-    with open(options.message_file, "r", encoding="utf-8") as fp:
-        body = fp.read()
+    logger.debug("subject: " + str(options.subject) + lib.util.location())
+    logger.debug("message_file: " + str(options.message_file) + lib.util.location())
+    logger.debug("from: " + str(options.sender) + lib.util.location())
+    logger.debug("to: " + str(options.to) + lib.util.location())
+    logger.debug("cc: " + str(options.cc) + lib.util.location())
+    logger.debug("bcc: " + str(options.bcc) + lib.util.location())
+    logger.debug("user_id: " + str(options.user_id) + lib.util.location())
+    logger.debug("path_json: " + str(options.path_json) + lib.util.location())
+    logger.debug("path_pickle: " + str(options.path_pickle) + lib.util.location())
+    logger.debug("idempotency_key: " + str(options.idempotency_key) + lib.util.location())
+    logger.debug("ledger: " + str(options.ledger) + lib.util.location())
+    logger.debug("daemon: " + str(options.daemon) + lib.util.location())
+    logger.debug("profile: " + str(options.profile) + lib.util.location())
+    logger.debug("files: " + str(files) + lib.util.location())
 
     # 添付ファイル
     if not files:
         files = None
 
-    # Gmailオブジェクトを取得
-    gmail = lib.gmail.GmailClass(
-        user_id=options.user_id,
-        path_json=options.path_json,
-        path_pickle=options.path_pickle,
-    )
+    if not options.profile:
+        message_id = send(options, files)
+        logger.info("message_id: " + str(message_id) + lib.util.location())
+        return
 
-    # メッセージを送信
-    message_id = gmail.send_message(
-        options.subject,
-        body,
-        options.sender,
-        options.to,
-        cc=options.cc,
-        bcc=options.bcc,
-        files=files
-    )
+    # 処理時間を計測する
+    with lib.profiler.profile(
+        "gmail_cli",
+        path=options.profile,
+        cprofile=options.profile_cprofile,
+        memory=options.profile_memory,
+    ) as profiler:
+        message_id = send(options, files)
+
+    logger.info("message_id: " + str(message_id) + lib.util.location())
 
-    logger.info("message_id: " + message_id + lib.gmail.location())
+    for name, values in profiler.report["phases"].items():
+        logger.info(f"phase: {name} count: {values['count']} total: {values['total']:.3f}s" + lib.util.location())
+    logger.info(f"wall: {profiler.report['wall']:.3f}s unaccounted: {profiler.report['unaccounted']:.3f}s" + lib.util.location())
 
 
 if __name__ == "__main__":
@@ -110,9 +251,9 @@ if __name__ == "__main__":
     logger = logging.getLogger(__name__)
 
     # 処理開始
-    logger.info(__file__ + " start" + lib.gmail.location())
+    logger.info(__file__ + " start" + lib.util.location())
 
     main()
 
     # 処理終了
-    logger.info(__file__ + " end" + lib.gmail.location())
+    logger.info(__file__ + " end" + lib.util.location())
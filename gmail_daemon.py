@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+@name           gmail_daemon.py
+@author         yoshi0518
+@description    Gmail常駐プロセス(gmail_cli.py -d から利用する)
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import logging
+from optparse import OptionParser
+import os
+import signal
+import threading
+
+import lib.daemon
+import lib.gmail
+import lib.ledger
+import lib.util
+
+
+##### 定数宣言 #####
+LOG_LEVEL = logging.INFO
+# LOG_LEVEL = logging.DEBUG
+LOG_MESSAGE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+def main():
+
+    usage = """
+  %prog
+    [options] -a "./config/gmail_daemon.sock" -w 4 -L "send_ledger.db" -u "me" -j "credentials.json" -p "token.pickle"
+    [options] -a "127.0.0.1:8765" -T "shared token" (or GMAIL_DAEMON_TOKEN)
+    [options] -D "./attachments" -D "./config" """
+
+    parser = OptionParser(usage=usage)
+
+    # 待ち受けアドレス
+    parser.add_option("-a", "--address", action="store", type="string", dest="address", help="socket path or host:port", default=lib.daemon.DEFAULT_ADDRESS)
+
+    # 共有トークン(TCPで待ち受ける場合は必須)
+    parser.add_option("-T", "--token", action="store", type="string", dest="token", help=f"shared token (default: ${lib.daemon.TOKEN_ENV})", default=os.environ.get(lib.daemon.TOKEN_ENV))
+
+    # クライアントが添付ファイル・台帳に指定できるディレクトリ(複数指定可、未指定の場合は指定できない)
+    parser.add_option("-D", "--allowed_dir", action="append", type="string", dest="allowed_dirs", help="directory clients may use for files and ledgers", default=[])
+
+    # スレッド数
+    parser.add_option("-w", "--workers", action="store", type="int", dest="workers", help="workers", default=4)
+
+    # 送信台帳ファイル(冪等キー付きの送信に利用する)
+    parser.add_option("-L", "--ledger", action="store", type="string", dest="ledger", help="send ledger file", default="send_ledger.db")
+
+    # ユーザーID
+    parser.add_option("-u", "--user_id", action="store", type="string", dest="user_id", help="user_id", default="me")
+
+    # 認証情報jsonファイル
+    parser.add_option("-j", "--path_json", action="store", type="string", dest="path_json", help="path_json", default="credentials.json")
+
+    # アクセストークンファイル
+    parser.add_option("-p", "--path_pickle", action="store", type="string", dest="path_pickle", help="path_pickle", default="token.pickle")
+
+    # 引数を取得
+    options, _ = parser.parse_args()
+
+    logger.debug("address: " + str(options.address) + lib.util.location())
+    logger.debug("workers: " + str(options.workers) + lib.util.location())
+    logger.debug("ledger: " + str(options.ledger) + lib.util.location())
+    logger.debug("allowed_dirs: " + str(options.allowed_dirs) + lib.util.location())
+
+    # Gmailオブジェクトを取得(認証とサービスの作成は起動時の1回だけ行う)
+    gmail = lib.gmail.GmailClass(
+        user_id=options.user_id,
+        path_json=options.path_json,
+        path_pickle=options.path_pickle,
+    )
+    ledger = lib.ledger.SendLedgerClass(options.ledger)
+
+    server = lib.daemon.DaemonServerClass(gmail, options.address, workers=options.workers, ledger=ledger, token=options.token, allowed_dirs=options.allowed_dirs)
+
+    # SIGTERMで終了する(shutdownはserve_foreverとは別のスレッドから呼び出す)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ledger.close()
+
+
+if __name__ == "__main__":
+
+    # ロギング準備
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format=LOG_MESSAGE_FORMAT,
+        datefmt=LOG_DATE_FORMAT
+    )
+    logger = logging.getLogger(__name__)
+
+    # 処理開始
+    logger.info(__file__ + " start" + lib.util.location())
+
+    main()
+
+    # 処理終了
+    logger.info(__file__ + " end" + lib.util.location())
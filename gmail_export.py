@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+@name           gmail_export.py
+@author         yoshi0518
+@description    Gmailエクスポート CLI
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import logging
+from optparse import OptionParser
+
+import lib.export
+import lib.gmail
+
+
+##### 定数宣言 #####
+LOG_LEVEL = logging.INFO
+# LOG_LEVEL = logging.DEBUG
+LOG_MESSAGE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+def main():
+
+    usage = """
+  %prog -o "output_dir"
+    [options] -q "query" -l "label1,label2" -F "mbox" -n 5000 -w 8 -u "me" -j "credentials.json" -p "token.pickle" """
+
+    parser = OptionParser(usage=usage)
+
+    # 出力先ディレクトリ
+    parser.add_option("-o", "--output_dir", action="store", type="string", dest="output_dir", help="output directory")
+
+    # 検索クエリ
+    parser.add_option("-q", "--query", action="store", type="string", dest="query", help="query", default=None)
+
+    # ラベル名
+    parser.add_option("-l", "--labels", action="store", type="string", dest="labels", help="label names", default=None)
+
+    # 出力形式
+    parser.add_option("-F", "--format", action="store", type="choice", dest="fmt", help="mbox or jsonl", choices=list(lib.export.FORMATS), default="mbox")
+
+    # 1ファイルあたりのメッセージ数
+    parser.add_option("-n", "--shard_size", action="store", type="int", dest="shard_size", help="messages per shard", default=5000)
+
+    # スレッド数
+    parser.add_option("-w", "--workers", action="store", type="int", dest="workers", help="workers", default=8)
+
+    # 圧縮しない
+    parser.add_option("-r", "--no_compress", action="store_false", dest="compress", help="no gzip", default=True)
+
+    # ユーザーID
+    parser.add_option("-u", "--user_id", action="store", type="string", dest="user_id", help="user_id", default="me")
+
+    # 認証情報jsonファイル
+    parser.add_option("-j", "--path_json", action="store", type="string", dest="path_json", help="path_json", default="credentials.json")
+
+    # アクセストークンファイル
+    parser.add_option("-p", "--path_pickle", action="store", type="string", dest="path_pickle", help="path_pickle", default="token.pickle")
+
+    # 引数を取得
+    options, _ = parser.parse_args()
+
+    if options.output_dir is None:
+        parser.error("output_dir is required")
+
+    logger.debug("output_dir: " + str(options.output_dir) + lib.gmail.location())
+    logger.debug("query: " + str(options.query) + lib.gmail.location())
+    logger.debug("labels: " + str(options.labels) + lib.gmail.location())
+    logger.debug("format: " + str(options.fmt) + lib.gmail.location())
+    logger.debug("shard_size: " + str(options.shard_size) + lib.gmail.location())
+    logger.debug("workers: " + str(options.workers) + lib.gmail.location())
+    logger.debug("compress: " + str(options.compress) + lib.gmail.location())
+
+    # Gmailオブジェクトを取得
+    gmail = lib.gmail.GmailClass(
+        user_id=options.user_id,
+        path_json=options.path_json,
+        path_pickle=options.path_pickle,
+    )
+
+    # エクスポートオブジェクトを取得
+    export = lib.export.ExportClass(
+        gmail,
+        options.output_dir,
+        fmt=options.fmt,
+        shard_size=options.shard_size,
+        compress=options.compress,
+    )
+
+    # ラベルIDを取得
+    if options.labels:
+        label_ids = gmail.get_label_ids(options.labels.split(","))
+    else:
+        label_ids = [None]
+
+    # メッセージをエクスポート
+    for label_id in label_ids:
+        count = export.export(query=options.query, label_id=label_id, workers=options.workers)
+        logger.info("label_id: " + str(label_id) + " count: " + str(count) + lib.gmail.location())
+
+
+if __name__ == "__main__":
+
+    # ロギング準備
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format=LOG_MESSAGE_FORMAT,
+        datefmt=LOG_DATE_FORMAT
+    )
+    logger = logging.getLogger(__name__)
+
+    # 処理開始
+    logger.info(__file__ + " start" + lib.gmail.location())
+
+    main()
+
+    # 処理終了
+    logger.info(__file__ + " end" + lib.gmail.location())
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+@name           analytics.py
+@author         yoshi0518
+@description    取得したメッセージのヘッダーを列形式で集計する処理のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+from email.utils import getaddresses, mktime_tz, parseaddr, parsedate_tz
+import logging
+
+from .gmail import location
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+##### 定数宣言 #####
+SECONDS_PER_DAY = 86400 # 1日の秒数
+
+
+def parse_timestamp(message):
+    """
+    【処理内容】
+    メッセージの日時をUNIX時間に変換する
+    受信日時(internal_date)があれば優先し、なければDateヘッダーを使う
+    【引数】
+    message：メッセージの辞書
+    【戻り値】
+    UNIX時間(変換できない場合はNone)
+    """
+
+    if "internal_date" in message:
+        return int(message["internal_date"]) // 1000
+
+    parsed = parsedate_tz(message.get("date", ""))
+    if parsed is None:
+        return None
+
+    try:
+        return mktime_tz(parsed)
+    except (OverflowError, ValueError):
+        return None
+
+
+class MessageTableClass:
+    """
+    【クラス内容】
+    メッセージのヘッダーを列(NumPy配列)で保持し、集計をベクトル演算で行う
+    日時を変換できないメッセージはdate_validがFalseになり、日ごとの集計から除く(to_arrowではnull)
+    numpyが必要(to_arrowはpyarrowも必要)
+    """
+
+    ##### 変数宣言 #####
+    columns = None
+    date_valid = None
+    label_rows = None
+    labels = None
+    _logger = None
+
+
+    def __init__(self, messages):
+        """
+        【処理内容】
+        メッセージのリストから列形式の表を作成する
+        ラベルは(行番号, ラベル)の組に展開して保持する
+        【引数】
+        messages：メッセージの辞書のイテラブル
+            (GmailClass.get_messages、PipelineClass.get_messagesの結果など)
+        【戻り値】
+        なし
+        """
+
+        if np is None:
+            raise ImportError("numpy is required for MessageTableClass")
+
+        self._logger = logging.getLogger(__name__)
+
+        self._logger.debug("__init__ start" + location())
+
+        ids, thread_ids, dates, date_valid, senders, recipients, subjects, sizes = [], [], [], [], [], [], [], []
+        labels, label_rows = [], []
+
+        # 同じ送信元、宛先が繰り返し現れるため、アドレスの解析結果は使い回す
+        parsed_senders, parsed_recipients = {}, {}
+
+        for row, message in enumerate(messages):
+            sender = message.get("from", "")
+            if not sender in parsed_senders:
+                parsed_senders[sender] = parseaddr(sender)[1].lower()
+
+            recipient = message.get("to", "")
+            if not recipient in parsed_recipients:
+                parsed_recipients[recipient] = ",".join(
+                    address.lower() for _, address in getaddresses([recipient]) if address
+                )
+
+            ids.append(message["id"])
+            thread_ids.append(message.get("thread_id", ""))
+            timestamp = parse_timestamp(message)
+            dates.append(0 if timestamp is None else timestamp)
+            date_valid.append(not timestamp is None)
+            senders.append(parsed_senders[sender])
+            recipients.append(parsed_recipients[recipient])
+            subjects.append(message.get("subject", ""))
+            sizes.append(message.get("size", 0))
+
+            message_labels = message.get("label_ids", [])
+            labels.extend(message_labels)
+            label_rows.extend([row] * len(message_labels))
+
+        self.columns = {
+            "id": np.array(ids, dtype=object),
+            "thread_id": np.array(thread_ids, dtype=object),
+            "date": np.array(dates, dtype=np.int64),
+            "from": np.array(senders, dtype=object),
+            "to": np.array(recipients, dtype=object),
+            "subject": np.array(subjects, dtype=object),
+            "size": np.array(sizes, dtype=np.int64),
+        }
+        self.date_valid = np.array(date_valid, dtype=bool)
+        self.labels = np.array(labels, dtype=object)
+        self.label_rows = np.array(label_rows, dtype=np.int64)
+
+        self._logger.debug("rows: " + str(len(ids)) + location())
+
+        self._logger.debug("__init__ end" + location())
+
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+
+    def to_arrow(self):
+        """
+        【処理内容】
+        Arrowの表に変換する
+        【引数】
+        なし
+        【戻り値】
+        pyarrow.Table(ラベルはリスト型の列)
+        """
+
+        if pa is None:
+            raise ImportError("pyarrow is required for to_arrow")
+
+        order = np.argsort(self.label_rows, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(self.label_rows, minlength=len(self)))))
+        label_column = pa.ListArray.from_arrays(
+            pa.array(offsets, type=pa.int32()),
+            pa.array(self.labels[order].tolist(), type=pa.string()),
+        )
+
+        return pa.table({
+            "id": pa.array(self.columns["id"].tolist(), type=pa.string()),
+            "thread_id": pa.array(self.columns["thread_id"].tolist(), type=pa.string()),
+            "date": pa.array(self.columns["date"] * 1000, type=pa.timestamp("ms", tz="UTC"), mask=~self.date_valid),
+            "from": pa.array(self.columns["from"].tolist(), type=pa.string()),
+            "to": pa.array(self.columns["to"].tolist(), type=pa.string()),
+            "subject": pa.array(self.columns["subject"].tolist(), type=pa.string()),
+            "size": pa.array(self.columns["size"]),
+            "labels": label_column,
+        })
+
+
+    def top_senders(self, count=10):
+        """
+        【処理内容】
+        送信元ごとのメッセージ数を多い順に集計する
+        【引数】
+        count：取得数
+        【戻り値】
+        (送信元, メッセージ数)のリスト
+        """
+
+        senders, counts = np.unique(self.columns["from"].astype(str), return_counts=True)
+        order = np.argsort(-counts, kind="stable")[:count]
+
+        return list(zip(senders[order].tolist(), counts[order].tolist()))
+
+
+    def volume_by_label_day(self):
+        """
+        【処理内容】
+        ラベル、日(UTC)ごとのメッセージ数を集計する(日時を変換できないメッセージは除く)
+        【引数】
+        なし
+        【戻り値】
+        (ラベル, 日付(YYYY-MM-DD), メッセージ数)のリスト(ラベル、日付の昇順)
+        """
+
+        valid = self.date_valid[self.label_rows]
+        label_rows = self.label_rows[valid]
+        if len(label_rows) == 0:
+            return []
+
+        label_names, label_codes = np.unique(self.labels[valid].astype(str), return_inverse=True)
+        days = self.columns["date"][label_rows] // SECONDS_PER_DAY
+        first_day = days.min()
+        span = days.max() - first_day + 1
+
+        # ラベルと日を1つの整数キーにまとめて数える
+        keys, counts = np.unique(label_codes.astype(np.int64) * span + (days - first_day), return_counts=True)
+        dates = ((keys % span + first_day) * SECONDS_PER_DAY).astype("datetime64[s]").astype("datetime64[D]")
+
+        return list(zip(label_names[keys // span].tolist(), dates.astype(str).tolist(), counts.tolist()))
+
+
+    def volume_by_day(self):
+        """
+        【処理内容】
+        日(UTC)ごとのメッセージ数を集計する(日時を変換できないメッセージは除く)
+        【引数】
+        なし
+        【戻り値】
+        (日付(YYYY-MM-DD), メッセージ数)のリスト(日付の昇順)
+        """
+
+        days, counts = np.unique(self.columns["date"][self.date_valid] // SECONDS_PER_DAY, return_counts=True)
+        dates = (days * SECONDS_PER_DAY).astype("datetime64[s]").astype("datetime64[D]")
+
+        return list(zip(dates.astype(str).tolist(), counts.tolist()))
+
+
+    def size_distribution(self, bins=10, percentiles=(50, 90, 99)):
+        """
+        【処理内容】
+        サイズの分布を集計する
+        【引数】
+        bins：ヒストグラムの区間数(または区間の境界のリスト)
+        percentiles：パーセンタイルのリスト
+        【戻り値】
+        分布の辞書(count、total、mean、max、percentiles、histogram)
+        """
+
+        sizes = self.columns["size"]
+        if len(sizes) == 0:
+            return {"count": 0, "total": 0, "mean": 0.0, "max": 0, "percentiles": {}, "histogram": []}
+
+        counts, edges = np.histogram(sizes, bins=bins)
+
+        return {
+            "count": int(len(sizes)),
+            "total": int(sizes.sum()),
+            "mean": float(sizes.mean()),
+            "max": int(sizes.max()),
+            "percentiles": dict(zip(percentiles, np.percentile(sizes, percentiles).tolist())),
+            "histogram": list(zip(edges[:-1].tolist(), edges[1:].tolist(), counts.tolist())),
+        }
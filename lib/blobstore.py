@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+"""
+@name           blobstore.py
+@author         yoshi0518
+@description    RFC 822形式のメッセージをセグメントファイルに追記して保存する処理のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import base64
+from email import policy
+from email.parser import BytesHeaderParser, BytesParser
+import logging
+import mmap
+import os
+import struct
+import threading
+
+from .gmail import location
+
+
+##### 定数宣言 #####
+RECORD_MAGIC = b"GMB1" # セグメント内のレコードの先頭
+RECORD_HEADER = struct.Struct("<4sHI") # レコードのヘッダー(先頭, IDの長さ, 本文の長さ)
+INDEX_RECORD = struct.Struct("<HIQI") # 索引のレコード(IDの長さ, セグメント番号, 本文の位置, 本文の長さ)
+INDEX_FILE = "index.bin" # 索引のファイル名
+SEGMENT_FILE = "segment-{:06d}.dat" # セグメントのファイル名
+
+
+class BlobStoreClass:
+    """
+    【クラス内容】
+    RFC 822形式のメッセージを追記専用のセグメントファイルに保存する
+    メッセージIDから(セグメント, 位置, 長さ)を引く索引をメモリ上に持ち、
+    読み込みはmmapしたセグメントのmemoryviewを返す(コピーしない)
+    同じメッセージIDは上書きしない
+    複数のスレッドから共有できる
+    """
+
+    ##### 変数宣言 #####
+    _index = None
+    _index_fp = None
+    _lock = None
+    _logger = None
+    _maps = None
+    _path_dir = None
+    _segment = None
+    _segment_fp = None
+    _segment_size = None
+
+
+    def __init__(self, path_dir, segment_size=256 * 1024 * 1024):
+        """
+        【処理内容】
+        保存先を開き、索引を読み込む
+        索引に記録されていないレコードがあれば、セグメントから索引を作り直す
+        【引数】
+        path_dir：保存先のディレクトリ
+        segment_size：1セグメントの大きさの目安(バイト、超えたら次のセグメントに追記する)
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._logger.debug("__init__ start" + location())
+
+        self._path_dir = path_dir
+        self._segment_size = segment_size
+        self._index = {}
+        self._maps = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(path_dir, exist_ok=True)
+
+        self.load_index()
+        self.recover()
+
+        self._index_fp = open(os.path.join(path_dir, INDEX_FILE), "ab")
+        self._segment_fp = open(self.get_segment_path(self._segment), "ab")
+
+        self._logger.debug("messages: " + str(len(self._index)) + location())
+
+        self._logger.debug("__init__ end" + location())
+
+
+    def __len__(self):
+        return len(self._index)
+
+
+    def __contains__(self, message_id):
+        return message_id in self._index
+
+
+    def __iter__(self):
+        return iter(list(self._index))
+
+
+    def get_segment_path(self, segment):
+        """
+        【処理内容】
+        セグメントのファイルパスを取得する
+        【引数】
+        segment：セグメント番号
+        【戻り値】
+        ファイルパス
+        """
+
+        return os.path.join(self._path_dir, SEGMENT_FILE.format(segment))
+
+
+    def load_index(self):
+        """
+        【処理内容】
+        索引のファイルを読み込む(途中で切れたレコードは無視する)
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        self._segment = 0
+
+        path = os.path.join(self._path_dir, INDEX_FILE)
+        if not os.path.exists(path):
+            return
+
+        with open(path, "rb") as fp:
+            data = fp.read()
+
+        position = 0
+        while position + INDEX_RECORD.size <= len(data):
+            id_length, segment, offset, length = INDEX_RECORD.unpack_from(data, position)
+            position += INDEX_RECORD.size
+            if position + id_length > len(data):
+                break
+
+            self._index[data[position:position + id_length].decode("ascii")] = (segment, offset, length)
+            self._segment = max(self._segment, segment)
+            position += id_length
+
+        # 途中で切れたレコードを削除する
+        if position < len(data):
+            with open(path, "r+b") as fp:
+                fp.truncate(position)
+
+
+    def recover(self):
+        """
+        【処理内容】
+        索引に記録されていない最後のセグメントのレコードを読み込み、索引に追加する
+        途中で切れたレコードはセグメントから削除する
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        segment = self._segment
+        while os.path.exists(self.get_segment_path(segment + 1)):
+            segment += 1
+
+        recovered = []
+        for segment in range(self._segment, segment + 1):
+            path = self.get_segment_path(segment)
+            if not os.path.exists(path):
+                continue
+
+            ends = [offset + length for seg, offset, length in self._index.values() if seg == segment]
+            position = max(ends) if ends else 0
+
+            with open(path, "r+b") as fp:
+                size = fp.seek(0, os.SEEK_END)
+                fp.seek(position)
+                while position + RECORD_HEADER.size <= size:
+                    magic, id_length, length = RECORD_HEADER.unpack(fp.read(RECORD_HEADER.size))
+                    if magic != RECORD_MAGIC or position + RECORD_HEADER.size + id_length + length > size:
+                        break
+                    message_id = fp.read(id_length).decode("ascii")
+                    offset = position + RECORD_HEADER.size + id_length
+                    recovered.append((message_id, segment, offset, length))
+                    position = offset + length
+                    fp.seek(position)
+
+                if position < size:
+                    fp.truncate(position)
+
+            self._segment = segment
+
+        if recovered:
+            self._logger.info("recovered: " + str(len(recovered)) + location())
+            with open(os.path.join(self._path_dir, INDEX_FILE), "ab") as fp:
+                for message_id, segment, offset, length in recovered:
+                    self._index[message_id] = (segment, offset, length)
+                    fp.write(self.pack_index(message_id, segment, offset, length))
+
+
+    def pack_index(self, message_id, segment, offset, length):
+        """
+        【処理内容】
+        索引のレコードを作成する
+        【引数】
+        message_id：メッセージID
+        segment：セグメント番号
+        offset：本文の位置
+        length：本文の長さ
+        【戻り値】
+        索引のレコード(バイト列)
+        """
+
+        message_id = message_id.encode("ascii")
+
+        return INDEX_RECORD.pack(len(message_id), segment, offset, length) + message_id
+
+
+    def put(self, message_id, data):
+        """
+        【処理内容】
+        メッセージを追記する
+        セグメントに書き込んでから索引に記録するため、途中で終了しても次回の起動時に復旧できる
+        【引数】
+        message_id：メッセージID
+        data：RFC 822形式のメッセージ(バイト列)
+        【戻り値】
+        追記した場合はTrue(保存済みの場合はFalse)
+        """
+
+        with self._lock:
+            if message_id in self._index:
+                return False
+
+            position = self._segment_fp.tell()
+            if position > 0 and position + len(data) > self._segment_size:
+                self._segment_fp.close()
+                self._segment += 1
+                self._segment_fp = open(self.get_segment_path(self._segment), "ab")
+                position = 0
+
+            encoded_id = message_id.encode("ascii")
+            self._segment_fp.write(RECORD_HEADER.pack(RECORD_MAGIC, len(encoded_id), len(data)) + encoded_id)
+            self._segment_fp.write(data)
+            self._segment_fp.flush()
+
+            offset = position + RECORD_HEADER.size + len(encoded_id)
+            self._index_fp.write(self.pack_index(message_id, self._segment, offset, len(data)))
+            self._index_fp.flush()
+
+            self._index[message_id] = (self._segment, offset, len(data))
+
+        return True
+
+
+    def get(self, message_id):
+        """
+        【処理内容】
+        メッセージを取得する
+        返すmemoryviewはcloseを呼ぶ前に解放する(releaseするか参照をなくす)
+        【引数】
+        message_id：メッセージID
+        【戻り値】
+        RFC 822形式のメッセージのmemoryview(ない場合はNone)
+        """
+
+        entry = self._index.get(message_id)
+        if entry is None:
+            return None
+
+        segment, offset, length = entry
+
+        return memoryview(self.get_map(segment, offset + length))[offset:offset + length]
+
+
+    def get_map(self, segment, end):
+        """
+        【処理内容】
+        セグメントをmmapしたものを取得する
+        追記中のセグメントは、必要な位置まで読めない場合にmmapし直す
+        (古いmmapは、参照しているmemoryviewがなくなれば解放される)
+        【引数】
+        segment：セグメント番号
+        end：読み込む範囲の終わりの位置
+        【戻り値】
+        mmap
+        """
+
+        segment_map = self._maps.get(segment)
+        if segment_map is None or len(segment_map) < end:
+            with self._lock:
+                segment_map = self._maps.get(segment)
+                if segment_map is None or len(segment_map) < end:
+                    with open(self.get_segment_path(segment), "rb") as fp:
+                        segment_map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._maps[segment] = segment_map
+
+        return segment_map
+
+
+    def get_headers(self, message_id):
+        """
+        【処理内容】
+        メッセージのヘッダーのみを解析する(本文は読み込まない)
+        【引数】
+        message_id：メッセージID
+        【戻り値】
+        email.message.EmailMessage(ない場合はNone)
+        """
+
+        entry = self._index.get(message_id)
+        if entry is None:
+            return None
+
+        segment, offset, length = entry
+        segment_map = self.get_map(segment, offset + length)
+
+        # ヘッダーの終わりは最初の空行(本文に別の改行コードの空行があっても、先に現れた方を使う)
+        ends = [
+            end for end in (
+                segment_map.find(b"\r\n\r\n", offset, offset + length),
+                segment_map.find(b"\n\n", offset, offset + length),
+            ) if end >= 0
+        ]
+        end = min(ends) + 2 if ends else offset + length
+
+        with memoryview(segment_map)[offset:end] as view:
+            return BytesHeaderParser(policy=policy.default).parsebytes(view.tobytes())
+
+
+    def get_mime(self, message_id):
+        """
+        【処理内容】
+        メッセージを解析する
+        【引数】
+        message_id：メッセージID
+        【戻り値】
+        email.message.EmailMessage(ない場合はNone)
+        """
+
+        view = self.get(message_id)
+        if view is None:
+            return None
+
+        with view:
+            return BytesParser(policy=policy.default).parsebytes(view.tobytes())
+
+
+    def add_raw_messages(self, messages):
+        """
+        【処理内容】
+        GmailClass.get_raw_messagesで取得したメッセージを保存し、そのまま返す
+        索引付けやエクスポートと組み合わせて利用する
+        【引数】
+        messages：メッセージのイテラブル(rawにbase64urlエンコードしたRFC 822形式の本文)
+        【戻り値】
+        メッセージのジェネレータ
+        """
+
+        for message in messages:
+            self.put(message["id"], base64.urlsafe_b64decode(message["raw"]))
+            yield message
+
+
+    def fetch_missing(self, gmail, message_ids, workers=8):
+        """
+        【処理内容】
+        保存していないメッセージのみを取得して保存する
+        【引数】
+        gmail：GmailClassのオブジェクト
+        message_ids：メッセージIDのイテラブル
+        workers：スレッド数
+        【戻り値】
+        count：保存したメッセージ数
+        """
+
+        self._logger.debug("fetch_missing start" + location())
+
+        missing = (message_id for message_id in message_ids if not message_id in self._index)
+
+        count = 0
+        for _ in self.add_raw_messages(gmail.get_raw_messages(missing, workers=workers)):
+            count += 1
+
+        self._logger.debug("fetch_missing end" + location())
+
+        return count
+
+
+    def close(self):
+        """
+        【処理内容】
+        保存先を閉じる
+        memoryviewが残っているmmapは、参照がなくなった時点で解放される
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        with self._lock:
+            self._segment_fp.close()
+            self._index_fp.close()
+
+            for segment_map in self._maps.values():
+                try:
+                    segment_map.close()
+                except BufferError:
+                    pass
+            self._maps = {}
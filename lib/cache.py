@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+@name           cache.py
+@author         yoshi0518
+@description    添付ファイルのエンコード済みMIMEパートのキャッシュに関する処理のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+from collections import OrderedDict
+import email
+import hashlib
+import logging
+import os
+from pathlib import Path
+import threading
+
+from .gmail import location
+
+
+class AttachmentCacheClass:
+    """
+    【クラス内容】
+    エンコード済みの添付ファイルのMIMEパートをキャッシュする
+    ファイルのパス、更新日時、サイズが変わらなければファイルを読まずにキャッシュを返し、
+    変わった場合は内容のハッシュで引き直す
+    メモリ上とディスク上(任意)の2段で、それぞれ上限を超えたら古いものから削除する(LRU)
+    """
+
+    ##### 変数宣言 #####
+    _disk_bytes = None
+    _hashes = None
+    _lock = None
+    _logger = None
+    _max_bytes = None
+    _max_disk_bytes = None
+    _memory = None
+    _memory_bytes = None
+    _path_dir = None
+
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, path_dir=None, max_disk_bytes=1024 * 1024 * 1024):
+        """
+        【処理内容】
+        キャッシュの初期設定を行う
+        【引数】
+        max_bytes：メモリ上のキャッシュの上限(バイト)
+        path_dir：ディスク上のキャッシュのディレクトリ(Noneの場合はメモリ上のみ)
+        max_disk_bytes：ディスク上のキャッシュの上限(バイト)
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._logger.debug("__init__ start" + location())
+
+        self._max_bytes = max_bytes
+        self._max_disk_bytes = max_disk_bytes
+        self._path_dir = path_dir
+        self._hashes = {}
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        if not path_dir is None:
+            os.makedirs(path_dir, exist_ok=True)
+            self._disk_bytes = sum(entry.stat().st_size for entry in os.scandir(path_dir) if entry.name.endswith(".part"))
+
+        self._logger.debug("__init__ end" + location())
+
+
+    def get_part(self, file, create):
+        """
+        【処理内容】
+        添付ファイルのMIMEパートを取得する
+        【引数】
+        file：添付ファイル
+        create：MIMEパートを作成する関数(ファイル名、内容を引数に取る)
+        【戻り値】
+        添付ファイルのMIMEパート
+        """
+
+        path = os.path.realpath(file)
+        stat = os.stat(path)
+        stat_key = (path, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            key = self._hashes.get(stat_key)
+            if not key is None:
+                part = self.get(key)
+                if not part is None:
+                    self._logger.debug("cache hit: " + file + location())
+                    return part
+
+        # 更新された(または初めての)ファイルは内容のハッシュで引き直す
+        with open(path, "rb") as fp:
+            data = fp.read()
+        key = hashlib.sha256(data).hexdigest() + "_" + hashlib.sha256(Path(file).name.encode()).hexdigest()[:16]
+
+        with self._lock:
+            self._hashes = {k: v for k, v in self._hashes.items() if k[0] != path}
+            self._hashes[stat_key] = key
+
+            part = self.get(key)
+            if not part is None:
+                self._logger.debug("cache hit by hash: " + file + location())
+                return part
+
+        self._logger.debug("cache miss: " + file + location())
+
+        part = create(file, data)
+        part_bytes = part.as_bytes()
+
+        with self._lock:
+            self.put_memory(key, part, len(part_bytes))
+            self.put_disk(key, part_bytes)
+
+        return part
+
+
+    def get(self, key):
+        """
+        【処理内容】
+        メモリ上、ディスク上の順にキャッシュからMIMEパートを取得する(ロックは呼び出し元で取得する)
+        【引数】
+        key：キャッシュのキー
+        【戻り値】
+        MIMEパート(ない場合はNone)
+        """
+
+        part = self.get_memory(key)
+        if part is None:
+            part = self.get_disk(key)
+
+        return part
+
+
+    def get_memory(self, key):
+        """
+        【処理内容】
+        メモリ上のキャッシュからMIMEパートを取得する(ロックは呼び出し元で取得する)
+        【引数】
+        key：キャッシュのキー
+        【戻り値】
+        MIMEパート(ない場合はNone)
+        """
+
+        if not key in self._memory:
+            return None
+
+        self._memory.move_to_end(key)
+        return self._memory[key][0]
+
+
+    def put_memory(self, key, part, size):
+        """
+        【処理内容】
+        メモリ上のキャッシュにMIMEパートを保存し、上限を超えた分を古いものから削除する
+        (ロックは呼び出し元で取得する)
+        【引数】
+        key：キャッシュのキー
+        part：MIMEパート
+        size：MIMEパートのサイズ(バイト)
+        【戻り値】
+        なし
+        """
+
+        if size > self._max_bytes:
+            return
+
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+
+        self._memory[key] = (part, size)
+        self._memory_bytes += size
+
+        while self._memory_bytes > self._max_bytes:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+
+    def get_disk(self, key):
+        """
+        【処理内容】
+        ディスク上のキャッシュからMIMEパートを取得し、メモリ上のキャッシュに載せる
+        (ロックは呼び出し元で取得する)
+        【引数】
+        key：キャッシュのキー
+        【戻り値】
+        MIMEパート(ない場合はNone)
+        """
+
+        if self._path_dir is None:
+            return None
+
+        path_part = os.path.join(self._path_dir, key + ".part")
+        try:
+            with open(path_part, "rb") as fp:
+                part_bytes = fp.read()
+        except FileNotFoundError:
+            return None
+
+        # 最終利用日時を更新してLRUの順序に反映する
+        os.utime(path_part)
+
+        part = email.message_from_bytes(part_bytes)
+        self.put_memory(key, part, len(part_bytes))
+
+        return part
+
+
+    def put_disk(self, key, part_bytes):
+        """
+        【処理内容】
+        ディスク上のキャッシュにMIMEパートを保存し、上限を超えた分を古いものから削除する
+        (ロックは呼び出し元で取得する)
+        【引数】
+        key：キャッシュのキー
+        part_bytes：MIMEパートのバイト列
+        【戻り値】
+        なし
+        """
+
+        if self._path_dir is None or len(part_bytes) > self._max_disk_bytes:
+            return
+
+        path_part = os.path.join(self._path_dir, key + ".part")
+        with open(path_part + ".tmp", "wb") as fp:
+            fp.write(part_bytes)
+        os.replace(path_part + ".tmp", path_part)
+        self._disk_bytes += len(part_bytes)
+
+        if self._disk_bytes <= self._max_disk_bytes:
+            return
+
+        entries = sorted(
+            (entry for entry in os.scandir(self._path_dir) if entry.name.endswith(".part")),
+            key=lambda entry: entry.stat().st_mtime_ns,
+        )
+        self._disk_bytes = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self._disk_bytes <= self._max_disk_bytes:
+                break
+            self._disk_bytes -= entry.stat().st_size
+            os.remove(entry.path)
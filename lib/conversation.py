@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+@name           conversation.py
+@author         yoshi0518
+@description    スレッドから会話を組み立てる処理のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+from email.utils import formataddr, getaddresses
+import logging
+import re
+
+from .gmail import location, parse_message
+
+
+##### 定数宣言 #####
+MESSAGE_ID_PATTERN = re.compile(r"<[^<>\s]+>") # In-Reply-To、ReferencesのメッセージID
+
+
+def parse_message_ids(value):
+    """
+    【処理内容】
+    In-Reply-To、ReferencesヘッダーからメッセージIDを取り出す
+    【引数】
+    value：ヘッダーの値
+    【戻り値】
+    メッセージIDのリスト(出現順)
+    """
+
+    if not value:
+        return []
+
+    return MESSAGE_ID_PATTERN.findall(value)
+
+
+def get_parents(message):
+    """
+    【処理内容】
+    メッセージの返信元のメッセージIDを取得する
+    In-Reply-To を優先し、なければ References の最後を使う
+    【引数】
+    message：メッセージ
+    【戻り値】
+    メッセージIDのリスト
+    """
+
+    return parse_message_ids(message.get("in-reply-to")) or parse_message_ids(message.get("references"))[-1:]
+
+
+class ConversationClass:
+    """
+    【クラス内容】
+    1スレッド分の会話
+    メッセージは受信日時の古い順に並ぶ
+    """
+
+    ##### 変数宣言 #####
+    messages = None
+    thread_id = None
+
+
+    def __init__(self, thread):
+        """
+        【処理内容】
+        threads().getの結果から会話を作成する
+        【引数】
+        thread：threads().getの結果
+        【戻り値】
+        なし
+        """
+
+        self.thread_id = thread["id"]
+        self.messages = []
+
+        for message_detail in thread.get("messages", []):
+            message = parse_message(message_detail) if "payload" in message_detail else {
+                "id": message_detail["id"],
+                "thread_id": message_detail["threadId"],
+                "label_ids": message_detail.get("labelIds", []),
+            }
+            message["internal_date"] = int(message_detail.get("internalDate", 0))
+            message["snippet"] = message_detail.get("snippet", "")
+            self.messages.append(message)
+
+        self.messages.sort(key=lambda message: message["internal_date"])
+
+
+    @property
+    def subject(self):
+        """
+        【処理内容】
+        会話の件名(最初のメッセージの件名)を取得する
+        【引数】
+        なし
+        【戻り値】
+        件名
+        """
+
+        return self.messages[0].get("subject") if self.messages else None
+
+
+    @property
+    def participants(self):
+        """
+        【処理内容】
+        会話の参加者(From、To、Cc)を取得する
+        【引数】
+        なし
+        【戻り値】
+        参加者のリスト("名前 <アドレス>"、出現順、アドレスの大文字小文字を区別せずに重複なし)
+        """
+
+        # 名前にカンマを含む宛先("Doe, John" <j@example.com>)があるため、getaddressesで分ける
+        participants = {}
+        for message in self.messages:
+            for name, address in getaddresses([message.get(key) or "" for key in ("from", "to", "cc")]):
+                if address and not address.lower() in participants:
+                    participants[address.lower()] = formataddr((name, address))
+
+        return list(participants.values())
+
+
+class ConversationIndexClass:
+    """
+    【クラス内容】
+    会話をスレッドID、メッセージID(Message-ID)、返信元(In-Reply-To、References)で引けるようにする
+    """
+
+    ##### 変数宣言 #####
+    _by_message_id = None
+    _by_thread_id = None
+    _logger = None
+    _replies = None
+
+
+    def __init__(self):
+        """
+        【処理内容】
+        索引の初期設定を行う
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._by_thread_id = {}
+        self._by_message_id = {}
+        self._replies = {}
+
+
+    def add_threads(self, threads):
+        """
+        【処理内容】
+        スレッドから会話を作成し、索引に追加する
+        同じスレッドIDの会話は置き換える
+        【引数】
+        threads：threads().getの結果のイテラブル(GmailClass.get_threadsの結果など)
+        【戻り値】
+        conversations：追加した会話のリスト
+        """
+
+        self._logger.debug("add_threads start" + location())
+
+        conversations = []
+        for thread in threads:
+            conversation = ConversationClass(thread)
+
+            # 置き換える会話のメッセージは索引から除く(削除されたメッセージが残らないように)
+            if conversation.thread_id in self._by_thread_id:
+                self.remove_conversation(self._by_thread_id[conversation.thread_id])
+            self._by_thread_id[conversation.thread_id] = conversation
+
+            for message in conversation.messages:
+                if "message-id" in message:
+                    self._by_message_id[message["message-id"]] = (conversation, message)
+
+                for parent in get_parents(message):
+                    self._replies.setdefault(parent, {})[message["id"]] = message
+
+            conversations.append(conversation)
+
+        self._logger.debug("add_threads end" + location())
+
+        return conversations
+
+
+    def remove_conversation(self, conversation):
+        """
+        【処理内容】
+        会話とそのメッセージを索引から除く
+        【引数】
+        conversation：会話
+        【戻り値】
+        なし
+        """
+
+        if self._by_thread_id.get(conversation.thread_id) is conversation:
+            del self._by_thread_id[conversation.thread_id]
+
+        for message in conversation.messages:
+            entry = self._by_message_id.get(message.get("message-id"))
+            if not entry is None and entry[0] is conversation:
+                del self._by_message_id[message["message-id"]]
+
+            for parent in get_parents(message):
+                replies = self._replies.get(parent, {})
+                if replies.get(message["id"]) is message:
+                    del replies[message["id"]]
+                    if not replies:
+                        del self._replies[parent]
+
+
+    def get_conversation(self, thread_id):
+        """
+        【処理内容】
+        スレッドIDから会話を取得する
+        【引数】
+        thread_id：スレッドID
+        【戻り値】
+        会話(ない場合はNone)
+        """
+
+        return self._by_thread_id.get(thread_id)
+
+
+    def get_conversations(self):
+        """
+        【処理内容】
+        すべての会話を最終メッセージの新しい順に取得する
+        【引数】
+        なし
+        【戻り値】
+        会話のリスト
+        """
+
+        return sorted(
+            self._by_thread_id.values(),
+            key=lambda conversation: conversation.messages[-1]["internal_date"] if conversation.messages else 0,
+            reverse=True,
+        )
+
+
+    def get_message(self, message_id):
+        """
+        【処理内容】
+        メッセージID(Message-ID)からメッセージと会話を取得する
+        【引数】
+        message_id：メッセージID(<...@...>形式)
+        【戻り値】
+        (会話, メッセージ)(ない場合はNone)
+        """
+
+        return self._by_message_id.get(message_id)
+
+
+    def get_parent(self, message):
+        """
+        【処理内容】
+        メッセージの返信元を取得する
+        【引数】
+        message：メッセージ
+        【戻り値】
+        (会話, メッセージ)(ない場合はNone)
+        """
+
+        parents = parse_message_ids(message.get("in-reply-to")) or parse_message_ids(message.get("references"))
+        for parent in reversed(parents):
+            if parent in self._by_message_id:
+                return self._by_message_id[parent]
+
+        return None
+
+
+    def get_replies(self, message_id):
+        """
+        【処理内容】
+        メッセージへの返信を取得する
+        【引数】
+        message_id：メッセージID(<...@...>形式)
+        【戻り値】
+        返信のメッセージのリスト(受信日時の古い順)
+        """
+
+        return sorted(self._replies.get(message_id, {}).values(), key=lambda message: message["internal_date"])
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+"""
+@name           daemon.py
+@author         yoshi0518
+@description    常駐プロセス(デーモン)とクライアントに関する処理のモジュール
+                クライアントの起動を速くするため、Gmail APIのライブラリは読み込まない
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hmac
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+
+from .util import location
+
+
+##### 定数宣言 #####
+DEFAULT_ADDRESS = "./config/gmail_daemon.sock" # 待ち受けアドレス(Unixソケット)
+ACTIONS = ("ping", "send", "get_labels", "get_message_ids", "get_messages") # 受け付ける処理
+TOKEN_ENV = "GMAIL_DAEMON_TOKEN" # 共有トークンを設定する環境変数
+SOCKET_UMASK = 0o177 # Unixソケットを作成するときのumask(作成時点から所有者のみ読み書きできる)
+
+
+def parse_address(address):
+    """
+    【処理内容】
+    待ち受けアドレスをソケットの種類とアドレスに変換する
+    "host:port"形式はTCP、それ以外はUnixソケットのパスとして扱う
+    【引数】
+    address：待ち受けアドレス
+    【戻り値】
+    (ソケットの種類, アドレス)
+    """
+
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and not "/" in address:
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+    return socket.AF_UNIX, address
+
+
+def is_allowed_path(path, allowed_dirs):
+    """
+    【処理内容】
+    パスが許可したディレクトリの中にあるか判定する(シンボリックリンクは解決してから判定する)
+    【引数】
+    path：ファイルのパス
+    allowed_dirs：許可したディレクトリのリスト
+    【戻り値】
+    許可したディレクトリの中にある場合はTrue
+    """
+
+    path = os.path.realpath(path)
+    for allowed_dir in allowed_dirs:
+        allowed_dir = os.path.realpath(allowed_dir)
+        if os.path.commonpath([path, allowed_dir]) == allowed_dir:
+            return True
+
+    return False
+
+
+class DaemonHandlerClass(socketserver.StreamRequestHandler):
+    """
+    【クラス内容】
+    1行1件のJSONで受け取った処理を実行し、結果を1行のJSONで返す
+    """
+
+    def handle(self):
+        """
+        【処理内容】
+        接続が閉じられるまで処理を受け付ける
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                self.server.daemon_server.authenticate(request.get("token"))
+                result = self.server.daemon_server.dispatch(request["action"], request.get("args", {}))
+                response = {"ok": True, "result": result}
+            except Exception as error:
+                logging.getLogger(__name__).error(f"An error occurred: {error}" + location())
+                response = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class PoolMixIn:
+    """
+    【クラス内容】
+    接続を固定数のスレッドで処理する
+    スレッドを使い回すため、スレッドごとのGmailリソースが温まったまま残る
+    """
+
+    executor = None
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+class PoolUnixServer(PoolMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+class PoolTCPServer(PoolMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+
+
+class DaemonServerClass:
+    """
+    【クラス内容】
+    GmailClassのオブジェクトを保持したまま常駐し、送信・取得の処理を受け付ける
+    """
+
+    ##### 変数宣言 #####
+    _address = None
+    _allowed_dirs = None
+    _gmail = None
+    _ledger = None
+    _ledgers = None
+    _ledger_lock = None
+    _logger = None
+    _server = None
+    _service_lock = None
+    _token = None
+
+
+    def __init__(self, gmail, address=DEFAULT_ADDRESS, workers=4, ledger=None, token=None, allowed_dirs=None):
+        """
+        【処理内容】
+        待ち受けを開始する
+        TCPは同じホストの他のユーザーからも接続できるため、共有トークンの指定が必要
+        Unixソケットは所有者のみ接続できるように作成する
+        【引数】
+        gmail：GmailClassのオブジェクト
+        address：待ち受けアドレス(Unixソケットのパスまたは"host:port")
+        workers：処理を行うスレッド数
+        ledger：台帳(SendLedgerClassのオブジェクト、冪等キー付きの送信に利用する)
+        token：共有トークン(指定した場合、トークンが一致しない依頼は受け付けない)
+        allowed_dirs：クライアントが添付ファイル・台帳に指定できるディレクトリのリスト
+            (Noneの場合はクライアントはファイルを指定できない)
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._logger.debug("__init__ start" + location())
+
+        self._gmail = gmail
+        self._ledger = ledger
+        self._ledgers = {}
+        self._ledger_lock = threading.Lock()
+        self._address = address
+        self._token = token or None
+        self._allowed_dirs = list(allowed_dirs or [])
+        self._service_lock = threading.Lock()
+
+        family, server_address = parse_address(address)
+        if family == socket.AF_INET and self._token is None:
+            # ループバックアドレスでも同じホストの他のユーザーが接続できるため、認証なしでは待ち受けない
+            raise ValueError(f"refusing to listen on TCP without a token: {address}")
+
+        if family == socket.AF_UNIX:
+            if os.path.exists(server_address):
+                os.remove(server_address)
+            # bind後にchmodすると権限を変更するまでの間に接続できるため、umaskで作成時の権限を制限する
+            umask = os.umask(SOCKET_UMASK)
+            try:
+                self._server = PoolUnixServer(server_address, DaemonHandlerClass)
+            finally:
+                os.umask(umask)
+        else:
+            self._server = PoolTCPServer(server_address, DaemonHandlerClass)
+
+        self._server.executor = ThreadPoolExecutor(max_workers=workers)
+        self._server.daemon_server = self
+
+        self._logger.debug("__init__ end" + location())
+
+
+    def serve_forever(self):
+        """
+        【処理内容】
+        shutdownが呼ばれるまで処理を受け付ける
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        self._logger.info("listening: " + self._address + location())
+
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._server.executor.shutdown(wait=True)
+            for ledger in self._ledgers.values():
+                ledger.close()
+            family, server_address = parse_address(self._address)
+            if family == socket.AF_UNIX and os.path.exists(server_address):
+                os.remove(server_address)
+
+
+    def shutdown(self):
+        """
+        【処理内容】
+        処理の受け付けを終了する(serve_foreverとは別のスレッドから呼び出す)
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        self._server.shutdown()
+
+
+    def authenticate(self, token):
+        """
+        【処理内容】
+        依頼の共有トークンを確認する(共有トークンを指定していない場合は何もしない)
+        【引数】
+        token：依頼に含まれる共有トークン
+        【戻り値】
+        なし(一致しない場合はPermissionErrorを送出する)
+        """
+
+        if self._token is None:
+            return
+
+        if not isinstance(token, str) or not hmac.compare_digest(token.encode("utf-8"), self._token.encode("utf-8")):
+            raise PermissionError("invalid token")
+
+
+    def check_path(self, path):
+        """
+        【処理内容】
+        クライアントが指定したファイルが許可したディレクトリの中にあるか確認する
+        (認証情報などの任意のファイルを添付・作成させないため)
+        【引数】
+        path：ファイルのパス
+        【戻り値】
+        なし(許可していない場合はPermissionErrorを送出する)
+        """
+
+        if not isinstance(path, str) or not is_allowed_path(path, self._allowed_dirs):
+            raise PermissionError(f"path is not in the allowed directories: {path}")
+
+
+    def get_ledger(self, path=None):
+        """
+        【処理内容】
+        冪等キー付きの送信に使う台帳を取得する
+        クライアントが台帳のファイルを指定した場合は、そのファイルを開く(開いた台帳は使い回す)
+        【引数】
+        path：台帳のファイル(Noneの場合は起動時に指定した台帳、許可したディレクトリの中のみ指定できる)
+        【戻り値】
+        SendLedgerClassのオブジェクト
+        """
+
+        if path is None:
+            if self._ledger is None:
+                raise ValueError("the daemon was started without a ledger")
+            return self._ledger
+
+        self.check_path(path)
+
+        # 台帳はGmail APIのライブラリを読み込むため、必要になった時点で読み込む
+        from .ledger import SendLedgerClass
+
+        path = os.path.abspath(path)
+        with self._ledger_lock:
+            if not path in self._ledgers:
+                self._ledgers[path] = SendLedgerClass(path)
+
+            return self._ledgers[path]
+
+
+    def dispatch(self, action, args):
+        """
+        【処理内容】
+        受け付けた処理を実行する
+        【引数】
+        action：処理名
+        args：引数の辞書
+        【戻り値】
+        処理結果
+        """
+
+        self._logger.debug("action: " + str(action) + location())
+
+        if not action in ACTIONS:
+            raise ValueError(f"unsupported action: {action}")
+
+        if action == "ping":
+            return "pong"
+
+        if action == "send":
+            # 送信はスレッドごとのリソースを使うため並列に実行できる
+            for path in args.get("files") or []:
+                self.check_path(path)
+
+            key = args.pop("idempotency_key", None)
+            ledger_path = args.pop("ledger", None)
+            if args.pop("idempotent", False) or not key is None:
+                return self._gmail.send_message_idempotent(self.get_ledger(ledger_path), key=key, **args)
+            return self._gmail.send_message(**args)
+
+        # 取得は共通のリソースを使うため1件ずつ実行する
+        with self._service_lock:
+            return getattr(self._gmail, action)(**args)
+
+
+class DaemonClientClass:
+    """
+    【クラス内容】
+    デーモンに処理を依頼する
+    """
+
+    ##### 変数宣言 #####
+    _address = None
+    _timeout = None
+    _token = None
+
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=60, token=None):
+        """
+        【処理内容】
+        接続先を設定する
+        【引数】
+        address：デーモンの待ち受けアドレス
+        timeout：タイムアウト(秒)
+        token：共有トークン(デーモンに指定したもの)
+        【戻り値】
+        なし
+        """
+
+        self._address = address
+        self._timeout = timeout
+        self._token = token or None
+
+
+    def request(self, action, **args):
+        """
+        【処理内容】
+        デーモンに処理を依頼し、結果を受け取る
+        【引数】
+        action：処理名
+        args：引数
+        【戻り値】
+        処理結果
+        デーモンが起動していない場合はConnectionError、処理に失敗した場合はRuntimeErrorを送出する
+        """
+
+        family, address = parse_address(self._address)
+        if family == socket.AF_UNIX and not os.path.exists(address):
+            raise ConnectionRefusedError(f"daemon is not running: {self._address}")
+
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self._timeout)
+            sock.connect(address)
+
+            with sock.makefile("rwb") as fp:
+                request = {"action": action, "args": args}
+                if not self._token is None:
+                    request["token"] = self._token
+                fp.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+                fp.flush()
+                line = fp.readline()
+
+        if not line:
+            raise ConnectionError("daemon closed the connection")
+
+        response = json.loads(line)
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+
+        return response["result"]
+
+
+    def is_running(self):
+        """
+        【処理内容】
+        デーモンが起動しているか確認する
+        【引数】
+        なし
+        【戻り値】
+        起動している場合はTrue
+        """
+
+        try:
+            return self.request("ping") == "pong"
+        except (OSError, RuntimeError):
+            return False
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+@name           export.py
+@author         yoshi0518
+@description    メールボックスのエクスポートに関する処理のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import base64
+import gzip
+import json
+import logging
+import os
+import re
+import time
+
+from .gmail import location
+
+
+##### 定数宣言 #####
+FORMATS = ("mbox", "jsonl") # 出力形式
+MANIFEST_NAME = "manifest.json" # チェックポイントファイル名
+DONE_IDS_NAME = "done_ids.txt" # エクスポート済みメッセージIDファイル名(1行に "シャード名<TAB>メッセージID")
+FROM_LINE_PATTERN = re.compile(rb"^(>*From )", re.MULTILINE) # mboxrdでエスケープする行
+
+
+def to_mbox_entry(message):
+    """
+    【処理内容】
+    RFC 822形式のメッセージをmboxrd形式の1件分に変換する
+    【引数】
+    message：メッセージ(rawにbase64urlエンコードしたRFC 822形式の本文)
+    【戻り値】
+    mboxrd形式のバイト列
+    """
+
+    raw = base64.urlsafe_b64decode(message["raw"]).replace(b"\r\n", b"\n")
+    raw = FROM_LINE_PATTERN.sub(rb">\1", raw)
+    if not raw.endswith(b"\n"):
+        raw += b"\n"
+
+    received = time.gmtime(int(message.get("internalDate", 0)) / 1000)
+    from_line = b"From MAILER-DAEMON " + time.strftime("%a %b %d %H:%M:%S %Y", received).encode() + b"\n"
+
+    return from_line + raw + b"\n"
+
+
+def to_jsonl_entry(message):
+    """
+    【処理内容】
+    RFC 822形式のメッセージをJSON Lines形式の1件分に変換する
+    【引数】
+    message：メッセージ(rawにbase64urlエンコードしたRFC 822形式の本文)
+    【戻り値】
+    JSON Lines形式のバイト列
+    """
+
+    entry = {
+        "id": message["id"],
+        "threadId": message.get("threadId"),
+        "labelIds": message.get("labelIds", []),
+        "internalDate": message.get("internalDate"),
+        "raw": message["raw"],
+    }
+    return json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+class ExportClass:
+    """
+    【クラス内容】
+    メッセージを並列に取得し、分割・圧縮したmbox/JSONLファイルへ書き出す
+    シャードを閉じるたびにチェックポイントを保存し、中断後は続きから再開する
+    チェックポイント(manifest.json)に記録したシャードのみをエクスポート済みとみなす
+    """
+
+    ##### 変数宣言 #####
+    _compress = None
+    _done_ids = None
+    _fmt = None
+    _gmail = None
+    _logger = None
+    _manifest = None
+    _path_dir = None
+    _shard_size = None
+
+
+    def __init__(self, gmail, path_dir, fmt="mbox", shard_size=5000, compress=True):
+        """
+        【処理内容】
+        エクスポートに必要な初期設定を行う
+        出力先にチェックポイントがあれば読み込む
+        【引数】
+        gmail：GmailClassのオブジェクト
+        path_dir：出力先ディレクトリ
+        fmt：出力形式(mbox、jsonl)
+        shard_size：1ファイルあたりのメッセージ数
+        compress：gzip圧縮するか
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._logger.debug("__init__ start" + location())
+
+        if not fmt in FORMATS:
+            raise ValueError(f"unsupported format: {fmt}")
+
+        self._gmail = gmail
+        self._path_dir = path_dir
+        self._fmt = fmt
+        self._shard_size = shard_size
+        self._compress = compress
+
+        os.makedirs(path_dir, exist_ok=True)
+        self.load_checkpoint()
+
+        self._logger.debug("__init__ end" + location())
+
+
+    def load_checkpoint(self):
+        """
+        【処理内容】
+        チェックポイントを読み込む
+        完了していないシャードは書き込み途中のため削除する
+        エクスポート済みメッセージIDは、チェックポイントに記録したシャードのもののみを使う
+        (done_ids.txtへの追記後、manifest.jsonの置き換え前に中断した場合の分は除く)
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        self._logger.debug("load_checkpoint start" + location())
+
+        path_manifest = os.path.join(self._path_dir, MANIFEST_NAME)
+        if os.path.exists(path_manifest):
+            with open(path_manifest, "r", encoding="utf-8") as fp:
+                self._manifest = json.load(fp)
+
+            if self._manifest["format"] != self._fmt:
+                raise ValueError("format does not match the existing export: " + self._manifest["format"])
+            if self._manifest.get("compress", self._compress) != self._compress:
+                raise ValueError("compress does not match the existing export: " + str(self._manifest["compress"]))
+        else:
+            self._manifest = {"format": self._fmt, "compress": self._compress, "count": 0, "shards": []}
+
+        # チェックポイントに記録されたシャードのメッセージIDのみを読み込む
+        shard_names = {shard["name"] for shard in self._manifest["shards"]}
+        self._done_ids = set()
+        stale = 0
+        path_done_ids = os.path.join(self._path_dir, DONE_IDS_NAME)
+        if os.path.exists(path_done_ids):
+            with open(path_done_ids, "r", encoding="utf-8") as fp:
+                for line in fp:
+                    shard_name, _, message_id = line.strip().rpartition("\t")
+                    if not message_id:
+                        continue
+                    if shard_name in shard_names:
+                        self._done_ids.add(message_id)
+                    else:
+                        stale += 1
+
+        # 記録されていないシャードの行は、同じ名前のシャードを作り直す前に除く
+        if stale:
+            self._logger.info("remove stale done_ids: " + str(stale) + location())
+            self.save_done_ids()
+
+        # チェックポイントに記録されていないシャードを削除
+        for name in os.listdir(self._path_dir):
+            if name.startswith("shard_") and not name in shard_names:
+                self._logger.info("remove incomplete shard: " + name + location())
+                os.remove(os.path.join(self._path_dir, name))
+
+        self._logger.debug("done_ids: " + str(len(self._done_ids)) + location())
+
+        self._logger.debug("load_checkpoint end" + location())
+
+
+    def save_done_ids(self):
+        """
+        【処理内容】
+        エクスポート済みメッセージIDファイルを、チェックポイントに記録したシャードの分だけで作り直す
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        shard_names = {shard["name"] for shard in self._manifest["shards"]}
+        path_done_ids = os.path.join(self._path_dir, DONE_IDS_NAME)
+        with open(path_done_ids, "r", encoding="utf-8") as fp:
+            lines = [line for line in fp if line.strip().rpartition("\t")[0] in shard_names]
+
+        with open(path_done_ids + ".tmp", "w", encoding="utf-8") as fp:
+            fp.write("".join(lines))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(path_done_ids + ".tmp", path_done_ids)
+
+
+    def save_checkpoint(self, shard_name, shard_ids):
+        """
+        【処理内容】
+        書き込みが完了したシャードをチェックポイントに記録する
+        メッセージIDをシャード名とともに追記してから、manifest.jsonを置き換える
+        (manifest.jsonに記録されるまでは、追記したメッセージIDはエクスポート済みとみなさない)
+        【引数】
+        shard_name：シャードのファイル名
+        shard_ids：シャードに含まれるメッセージIDのリスト
+        【戻り値】
+        なし
+        """
+
+        self._logger.debug("save_checkpoint start" + location())
+
+        with open(os.path.join(self._path_dir, DONE_IDS_NAME), "a", encoding="utf-8") as fp:
+            fp.write("".join(shard_name + "\t" + message_id + "\n" for message_id in shard_ids))
+            fp.flush()
+            os.fsync(fp.fileno())
+
+        self._done_ids.update(shard_ids)
+        self._manifest["shards"].append({"name": shard_name, "count": len(shard_ids)})
+        self._manifest["count"] += len(shard_ids)
+
+        # 書き込み途中で中断してもチェックポイントが壊れないよう置き換える
+        path_manifest = os.path.join(self._path_dir, MANIFEST_NAME)
+        with open(path_manifest + ".tmp", "w", encoding="utf-8") as fp:
+            json.dump(self._manifest, fp, ensure_ascii=False, indent=2)
+        os.replace(path_manifest + ".tmp", path_manifest)
+
+        self._logger.debug("save_checkpoint end" + location())
+
+
+    def open_shard(self):
+        """
+        【処理内容】
+        次のシャードファイルを開く
+        【引数】
+        なし
+        【戻り値】
+        shard_name：シャードのファイル名
+        fp：ファイルオブジェクト
+        """
+
+        shard_name = f"shard_{len(self._manifest['shards']):05d}.{self._fmt}"
+        if self._compress:
+            shard_name += ".gz"
+            fp = gzip.open(os.path.join(self._path_dir, shard_name), "wb")
+        else:
+            fp = open(os.path.join(self._path_dir, shard_name), "wb")
+
+        self._logger.debug("shard_name: " + shard_name + location())
+
+        return shard_name, fp
+
+
+    def export(self, query=None, label_id=None, workers=8):
+        """
+        【処理内容】
+        メッセージをエクスポートする
+        エクスポート済みのメッセージは取得しない
+        【引数】
+        query：検索クエリ
+            https://support.google.com/mail/answer/7190
+        label_id：ラベルID
+        workers：スレッド数
+        【戻り値】
+        count：今回エクスポートしたメッセージ数
+        """
+
+        self._logger.debug("export start" + location())
+
+        to_entry = to_mbox_entry if self._fmt == "mbox" else to_jsonl_entry
+
+        message_ids = (
+            message_id["id"]
+            for message_id in self._gmail.iter_message_ids(query=query, label_id=label_id)
+            if not message_id["id"] in self._done_ids
+        )
+
+        count = 0
+        shard_name, fp = None, None
+        shard_ids = []
+        try:
+            for message in self._gmail.get_raw_messages(message_ids, workers=workers):
+                if fp is None:
+                    shard_name, fp = self.open_shard()
+
+                fp.write(to_entry(message))
+                shard_ids.append(message["id"])
+                count += 1
+
+                if len(shard_ids) >= self._shard_size:
+                    fp.close()
+                    self.save_checkpoint(shard_name, shard_ids)
+                    self._logger.info(f"exported: {self._manifest['count']}" + location())
+                    shard_name, fp = None, None
+                    shard_ids = []
+
+            if not fp is None:
+                fp.close()
+                self.save_checkpoint(shard_name, shard_ids)
+                fp = None
+
+        finally:
+            # 中断した場合、書き込み途中のシャードは次回の再開時に削除される
+            if not fp is None:
+                fp.close()
+
+        self._logger.info(f"exported: {self._manifest['count']}" + location())
+
+        self._logger.debug("export end" + location())
+
+        return count
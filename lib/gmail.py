@@ -4,27 +4,40 @@
 @author         yoshi0518
 @description    Gmail操作に関する処理のモジュール
 @created        2020/11/12
-@modified       2020/11/12
+@modified       2026/10/19
 """
 
 import base64
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from email.mime.application import MIMEApplication
 from email.mime.audio import MIMEAudio
 from email.mime.base import MIMEBase
 from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-import inspect
+from functools import lru_cache
+import hashlib
+import json
+import keyword
 import logging
 import mimetypes
 import os
 from pathlib import Path
 import pickle
+import threading
+import time
 
 from apiclient import errors
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+import httplib2
+
+from .httpcache import build_caching_http
+from .profiler import phase, profile
+from .recipients import RecipientListClass
+from .util import location
 
 
 ##### 定数宣言 #####
@@ -34,36 +47,223 @@ SCOPES = [ # Gmail APIのスコープ
     "https://www.googleapis.com/auth/gmail.labels",
     "https://www.googleapis.com/auth/gmail.modify",
 ]
+IDEMPOTENCY_HEADER = "X-Idempotency-Key" # 冪等キーを記録するヘッダー
+RETRY_STATUSES = (429, 500, 502, 503, 504) # 再試行するHTTPステータス
+BATCH_MODIFY_SIZE = 1000 # batchModifyで1回に処理できるメッセージ数
+SCAN_HEADERS = ("From", "Subject", "Date") # ヘッダーのみの取得(scan_headers)で取得するヘッダー
+SCAN_FIELDS = "id,threadId,internalDate,payload/headers" # ヘッダーのみの取得(scan_headers)で取得するフィールド
+BATCH_SIZE = 50 # バッチリクエストに含めるリクエスト数(最大100)
+THREAD_HEADERS = [ # スレッド取得時(format=metadata)に取得するヘッダー
+    "From", "To", "Cc", "Subject", "Date", "Message-ID", "In-Reply-To", "References",
+]
+THREAD_FIELDS = ( # スレッド取得時(format=metadata)に取得するフィールド
+    "id,historyId,messages(id,threadId,labelIds,internalDate,snippet,sizeEstimate,payload/headers)"
+)
 
 
-def location():
+def decode_base64url_data(data):
     """
     【処理内容】
-    location関数を実行したファイル名、行数を取得する
+    base64urlのデコード
     【引数】
-    なし
+    data：エンコードする文字列
     【戻り値】
-    ファイル名、行数
+    エンコードした文字列
     """
+    decoded_bytes = base64.urlsafe_b64decode(data)
+    decoded_message = decoded_bytes.decode("UTF-8")
+    return decoded_message
+
 
-    frame = inspect.currentframe().f_back
-    fname = os.path.basename(frame.f_code.co_filename)
-    line = frame.f_lineno
-    return f" ({fname}:{line})"
+def make_idempotency_key(subject, body, sender, to, cc=None, bcc=None, files=None):
+    """
+    【処理内容】
+    メッセージの内容から冪等キーを作成する
+    同じ内容のメッセージを意図して複数回送信する場合は、呼び出し元でキーを指定する
+    【引数】
+    subject：件名
+    body：本文
+    sender：送信元
+    to：宛先
+    cc：カーボンコピー
+    bcc：ブラインドカーボンコピー
+    files：添付ファイル(パスではなく内容から作成するため、同じパスに作り直したファイルは別のキーになる)
+    【戻り値】
+    冪等キー(SHA-256の16進文字列の先頭32文字)
+    """
 
+    digests = []
+    for file in files or []:
+        digest = hashlib.sha256()
+        with open(file, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1024 * 1024), b""):
+                digest.update(chunk)
+        digests.append([os.path.basename(file), digest.hexdigest()])
 
-def decode_base64url_data(data):
+    content = json.dumps([subject, body, sender, to, cc, bcc, digests], ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+
+
+def is_throttled(error):
     """
     【処理内容】
-    base64urlのデコード
+    HttpErrorが実行回数の制限・一時的なエラーによるものか判定する
     【引数】
-    data：エンコードする文字列
+    error：HttpError
     【戻り値】
-    エンコードした文字列
+    再試行すべき場合はTrue
     """
-    decoded_bytes = base64.urlsafe_b64decode(data)
-    decoded_message = decoded_bytes.decode("UTF-8")
-    return decoded_message
+
+    status = error.resp.status
+    if status in RETRY_STATUSES:
+        return True
+
+    # 403でも実行回数の制限によるものは再試行する
+    return status == 403 and b"ateLimitExceeded" in (error.content or b"")
+
+
+@lru_cache(maxsize=None)
+def make_header_record(headers):
+    """
+    【処理内容】
+    ヘッダーのみの取得(scan_headers)の結果を格納するnamedtupleを作成する
+    フィールドはid、thread_id、internal_dateとヘッダー(小文字、"-"は"_"に置換、予約語は末尾に"_"(from_など))
+    【引数】
+    headers：ヘッダー名のタプル
+    【戻り値】
+    namedtupleのクラス
+    """
+
+    names = [header.lower().replace("-", "_") for header in headers]
+    names = [name + "_" if keyword.iskeyword(name) else name for name in names]
+
+    return namedtuple("HeaderRecord", ["id", "thread_id", "internal_date"] + names, rename=True)
+
+
+def parse_message(message_detail):
+    """
+    【処理内容】
+    messages().getで取得したメッセージを辞書に変換する
+    ヘッダーは小文字のキー、本文はtext/plainのパートをデコードして格納する
+    format=metadataで取得した場合、本文は格納しない
+    【引数】
+    message_detail：messages().getの結果
+    【戻り値】
+    message：メッセージの辞書
+    """
+
+    message = {}
+    payload = message_detail["payload"]
+
+    message["id"] = message_detail["id"]
+    message["thread_id"] = message_detail["threadId"]
+    message["label_ids"] = message_detail.get("labelIds", [])
+    if "internalDate" in message_detail:
+        message["internal_date"] = int(message_detail["internalDate"])
+    # 本文のサイズはマルチパートの場合0になるため、メッセージ全体の推定サイズを使う
+    message["size"] = message_detail.get("sizeEstimate", payload.get("body", {}).get("size", 0))
+
+    for header in payload["headers"]:
+        message[header["name"].lower()] = header["value"]
+
+    # テキストメールの場合
+    if "data" in payload.get("body", {}):
+        message["body"] = decode_base64url_data(payload["body"]["data"])
+
+    # HTMLメールの場合
+    elif "parts" in payload:
+        body = None
+
+        for part in payload["parts"]:
+
+            if "parts" in part:
+                for part_child in part["parts"]:
+                    if part_child["mimeType"] == "text/plain":
+                        body = part_child["body"]["data"]
+                        break
+
+                break
+            else:
+                if part["mimeType"] == "text/plain":
+                    body = part["body"]["data"]
+                    break
+
+        if not body is None:
+            message["body"] = decode_base64url_data(body)
+
+    return message
+
+
+class RateLimitClass:
+    """
+    【クラス内容】
+    トークンバケットで単位時間あたりの実行回数を制限する
+    複数のスレッドから共有できる
+    """
+
+    ##### 変数宣言 #####
+    _burst = None
+    _lock = None
+    _rate = None
+    _tokens = None
+    _updated = None
+
+
+    def __init__(self, rate, burst=1):
+        """
+        【処理内容】
+        実行回数の制限を設定する
+        【引数】
+        rate：1秒あたりの実行回数
+        burst：連続して実行できる回数
+        【戻り値】
+        なし
+        """
+
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+
+    def set_rate(self, rate):
+        """
+        【処理内容】
+        1秒あたりの実行回数を変更する
+        【引数】
+        rate：1秒あたりの実行回数
+        【戻り値】
+        なし
+        """
+
+        with self._lock:
+            self._rate = rate
+
+
+    def acquire(self):
+        """
+        【処理内容】
+        実行できるまで待機する
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait_seconds = (1 - self._tokens) / self._rate
+
+            time.sleep(wait_seconds)
 
 
 class GmailClass:
@@ -73,19 +273,24 @@ class GmailClass:
     """
 
     ##### 変数宣言 #####
+    _attachment_cache = None
     _creds = None
+    _local = None
     _logger = None
+    _response_cache = None
     _service = None
     _user_id = None
 
 
-    def __init__(self, user_id="me", path_json="credentials.json", path_pickle="token.pickle"):
+    def __init__(self, user_id="me", path_json="credentials.json", path_pickle="token.pickle", attachment_cache=None, response_cache=None):
         """
         【処理内容】
         Gmail操作に必要な初期設定を行う
         【引数】
         path_json：認証情報jsonファイル
         path_pickle：アクセストークンファイル
+        attachment_cache：添付ファイルキャッシュ(AttachmentCacheClassのオブジェクト)
+        response_cache：レスポンスキャッシュ(ResponseCacheClassのオブジェクト、ラベル・ヘッダーの取得をキャッシュする)
         【戻り値】
         なし
         """
@@ -95,6 +300,9 @@ class GmailClass:
         self._logger.debug("__init__ start" + location())
 
         self._user_id = user_id
+        self._local = threading.local()
+        self._attachment_cache = attachment_cache
+        self._response_cache = response_cache
 
         # アクセストークンを取得
         self.get_credential(path_json=path_json, path_pickle=path_pickle)
@@ -121,19 +329,21 @@ class GmailClass:
 
         self._logger.debug("get_credential start" + location())
 
-        if os.path.exists(path_pickle):
-            with open(path_pickle, "rb") as token:
-                self._creds = pickle.load(token)
+        with phase("auth"):
+            if os.path.exists(path_pickle):
+                with open(path_pickle, "rb") as token:
+                    self._creds = pickle.load(token)
 
-        if not self._creds or not self._creds.valid:
-            if self._creds and self._creds.expired and self._creds.refresh_token:
-                self._creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(path_json, SCOPES)
-                self._creds = flow.run_local_server()
-                # self._creds = flow.run_console()
-            with open(path_pickle, "wb") as token:
-                pickle.dump(self._creds, token)
+            if not self._creds or not self._creds.valid:
+                if self._creds and self._creds.expired and self._creds.refresh_token:
+                    with phase("auth.refresh"):
+                        self._creds.refresh(Request())
+                else:
+                    flow = InstalledAppFlow.from_client_secrets_file(path_json, SCOPES)
+                    self._creds = flow.run_local_server()
+                    # self._creds = flow.run_console()
+                with open(path_pickle, "wb") as token:
+                    pickle.dump(self._creds, token)
 
         self._logger.debug("get_credential end" + location())
 
@@ -151,7 +361,7 @@ class GmailClass:
         try:
             self._logger.debug("get_service start" + location())
 
-            self._service = build("gmail", "v1", credentials=self._creds, cache_discovery=False)
+            self._service = self.build_service()
 
             self._logger.debug("get_service end" + location())
 
@@ -159,6 +369,92 @@ class GmailClass:
             self._logger.error(f"An error occurred: {error}")
 
 
+    def build_service(self):
+        """
+        【処理内容】
+        Gmailにアクセスするリソースを新しく生成する
+        レスポンスは圧縮して転送し、response_cacheを指定した場合はキャッシュする
+        【引数】
+        なし
+        【戻り値】
+        service：Gmailにアクセスするリソース
+        """
+
+        with phase("build"):
+            http = build_caching_http(self._creds, self._response_cache)
+
+            return build("gmail", "v1", http=http, cache_discovery=False)
+
+
+    def get_thread_service(self):
+        """
+        【処理内容】
+        スレッドごとにGmailにアクセスするリソースを取得する
+        httplib2はスレッドセーフではないため、ワーカースレッドでは個別のリソースを利用する
+        【引数】
+        なし
+        【戻り値】
+        service：Gmailにアクセスするリソース
+        """
+
+        if threading.current_thread() is threading.main_thread():
+            return self._service
+
+        if not hasattr(self._local, "service"):
+            self._local.service = self.build_service()
+
+        return self._local.service
+
+
+    def execute_concurrent(self, func, items, workers=8, rate_limit=None):
+        """
+        【処理内容】
+        要素ごとに関数を並列実行し、完了した順に結果を返す
+        実行中の件数はworkersの2倍までに抑えるため、itemsはジェネレータでもよい
+        【引数】
+        func：要素を引数に取る関数
+        items：要素のイテラブル
+        workers：スレッド数
+        rate_limit：実行回数の制限(RateLimitClassのオブジェクト)
+        【戻り値】
+        (要素, 結果)のジェネレータ
+        エラー(HttpError、タイムアウトなどの通信エラー)が発生した要素の結果はNone
+        """
+
+        self._logger.debug("execute_concurrent start" + location())
+
+        def call(item):
+            try:
+                if not rate_limit is None:
+                    rate_limit.acquire()
+                return func(item)
+            except errors.HttpError as error:
+                self._logger.error(f"An error occurred: {error}")
+                return None
+            except (OSError, httplib2.HttpLib2Error) as error:
+                # 通信エラーで他の要素の結果を失わないよう、要素ごとに扱う
+                self._logger.error(f"An error occurred: {error!r} item: {item!r}")
+                return None
+
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            while True:
+                for item in items:
+                    futures[executor.submit(call, item)] = item
+                    if len(futures) >= workers * 2:
+                        break
+
+                if not futures:
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield futures.pop(future), future.result()
+
+        self._logger.debug("execute_concurrent end" + location())
+
+
     def get_labels(self):
         """
         【処理内容】
@@ -262,6 +558,141 @@ class GmailClass:
             self._logger.error(f"An error occurred: {error}")
 
 
+    def iter_message_ids(self, query=None, label_id=None, page_size=500):
+        """
+        【処理内容】
+        メッセージIDをページ単位で取得し、1件ずつ返す
+        【引数】
+        query：検索クエリ
+            https://support.google.com/mail/answer/7190
+        label_id：ラベルID
+        page_size：1ページあたりの取得数(最大500)
+        【戻り値】
+        メッセージID(id, threadId)のジェネレータ
+        """
+
+        self._logger.debug("iter_message_ids start" + location())
+
+        params = {"userId": self._user_id, "maxResults": page_size}
+        if not query is None:
+            params["q"] = query
+        if not label_id is None:
+            params["labelIds"] = label_id
+
+        while True:
+            res = self._service.users().messages().list(**params).execute()
+
+            for message_id in res.get("messages", []):
+                yield message_id
+
+            if not "nextPageToken" in res:
+                break
+            params["pageToken"] = res["nextPageToken"]
+
+        self._logger.debug("iter_message_ids end" + location())
+
+
+    def list_messages(self, query=None, label_id=None, page_token=None, page_size=100):
+        """
+        【処理内容】
+        メッセージIDを1ページ取得する
+        ワーカースレッドから呼び出せる
+        【引数】
+        query：検索クエリ
+            https://support.google.com/mail/answer/7190
+        label_id：ラベルID
+        page_token：ページトークン(最初のページはNone)
+        page_size：1ページあたりの取得数(最大500)
+        【戻り値】
+        messages().listの結果(messages、nextPageToken)
+        """
+
+        params = {"userId": self._user_id, "maxResults": page_size}
+        if not query is None:
+            params["q"] = query
+        if not label_id is None:
+            params["labelIds"] = label_id
+        if not page_token is None:
+            params["pageToken"] = page_token
+
+        return self.get_thread_service().users().messages().list(**params).execute()
+
+
+    def get_message(self, message_id, fmt="full"):
+        """
+        【処理内容】
+        メッセージを取得する
+        ワーカースレッドから呼び出せる
+        【引数】
+        message_id：メッセージID
+        fmt：取得形式(full、raw、metadata)
+        【戻り値】
+        messages().getの結果
+        """
+
+        return self.get_thread_service().users().messages().get(userId=self._user_id, id=message_id, format=fmt).execute()
+
+
+    def get_raw_message(self, message_id):
+        """
+        【処理内容】
+        RFC 822形式のメッセージを取得する
+        ワーカースレッドから呼び出せる
+        【引数】
+        message_id：メッセージID
+        【戻り値】
+        message：メッセージ(rawにbase64urlエンコードしたRFC 822形式の本文)
+        """
+
+        return (
+            self.get_thread_service().users().messages().get(
+                userId=self._user_id, id=message_id, format="raw"
+            ).execute()
+        )
+
+
+    def get_raw_messages(self, message_ids, workers=8):
+        """
+        【処理内容】
+        RFC 822形式のメッセージを並列に取得する
+        【引数】
+        message_ids：メッセージIDのイテラブル
+        workers：スレッド数
+        【戻り値】
+        メッセージのジェネレータ(取得した順)
+        取得に失敗したメッセージは返さない
+        """
+
+        self._logger.debug("get_raw_messages start" + location())
+
+        for message_id, message in self.execute_concurrent(self.get_raw_message, message_ids, workers):
+            if message is None:
+                self._logger.warning("failed to get message: " + message_id + location())
+                continue
+            yield message
+
+        self._logger.debug("get_raw_messages end" + location())
+
+
+    def get_message_content(self, message_id, fmt="full"):
+        """
+        【処理内容】
+        メッセージをJSONのまま(解析せずに)取得する
+        JSONの解析を別プロセスで行うために利用する
+        ワーカースレッドから呼び出せる
+        【引数】
+        message_id：メッセージID
+        fmt：取得形式(full、raw、metadata)
+        【戻り値】
+        content：レスポンスのJSON(バイト列)
+        """
+
+        request = self.get_thread_service().users().messages().get(userId=self._user_id, id=message_id, format=fmt)
+        request.postproc = lambda resp, content: content
+
+        return request.execute()
+
+
     def get_messages(self, message_ids):
         """
         【処理内容】
@@ -279,8 +710,6 @@ class GmailClass:
             for message_id in message_ids:
                 self._logger.debug("message_id: " + message_id + location())
 
-                message = {}
-
                 # メッセージを取得
                 message_detail = (
                     self._service.users().messages().get(userId=self._user_id, id=message_id).execute()
@@ -288,51 +717,263 @@ class GmailClass:
 
                 self._logger.debug("message_detail: " + str(message_detail) + location())
 
-                message["id"] = message_detail["id"]
-                message["label_ids"] = message_detail["labelIds"]
-                message["size"] = message_detail["payload"]["body"]["size"]
+                message = parse_message(message_detail)
 
-                for header in message_detail["payload"]["headers"]:
-                    message[header["name"].lower()] = header["value"]
+                messages.append(message)
 
-                # テキストメールの場合
-                if 'data' in message_detail['payload']['body']:
-                    message["body"] = decode_base64url_data(message_detail["payload"]["body"]["data"])
+            self._logger.debug("get_messages end" + location())
+
+            return messages
+
+        except errors.HttpError as error:
+            self._logger.error(f"An error occurred: {error}")
 
-                # HTMLメールの場合
-                else:
-                    parts = message_detail['payload']['parts']
 
-                    for part in parts:
+    def get_thread_ids(self, query=None, label_id=None, count=100):
+        """
+        【処理内容】
+        スレッドIDを取得する
+        【引数】
+        query：検索クエリ
+            https://support.google.com/mail/answer/7190
+        label_id：ラベルID
+        count：取得数
+        【戻り値】
+        thread_ids：スレッドID(id, snippet, historyId)のリスト
+        """
 
-                        if 'parts' in part:
-                            for part_child in part["parts"]:
-                                if part_child["mimeType"] == "text/plain":
-                                    body = part_child["body"]["data"]
-                                    break
+        try:
+            self._logger.debug("get_thread_ids start" + location())
 
-                            break
-                        else:
-                            if part["mimeType"] == "text/plain":
-                                body = part["body"]["data"]
-                                break
+            params = {"userId": self._user_id, "maxResults": count}
+            if not query is None:
+                params["q"] = query
+            if not label_id is None:
+                params["labelIds"] = label_id
 
-                    message["body"] = decode_base64url_data(body)
+            res = self._service.users().threads().list(**params).execute()
 
-                messages.append(message)
+            if res.get("resultSizeEstimate", 0) == 0:
+                return None
 
-            self._logger.debug("get_messages end" + location())
+            self._logger.debug("get_thread_ids end" + location())
 
-            return messages
+            return res["threads"]
 
         except errors.HttpError as error:
             self._logger.error(f"An error occurred: {error}")
 
 
-    def send_message(self, subject, body, sender, to, cc=None, bcc=None, files=None):
+    def get_thread(self, thread_id, fmt="metadata"):
+        """
+        【処理内容】
+        スレッドに含まれるメッセージを1回のリクエストで取得する
+        format=metadataの場合は会話の組み立てに必要なヘッダーとフィールドのみ取得する
+        ワーカースレッドから呼び出せる
+        【引数】
+        thread_id：スレッドID
+        fmt：取得形式(metadata、full、minimal)
+        【戻り値】
+        thread：threads().getの結果
+        """
+
+        params = {"userId": self._user_id, "id": thread_id, "format": fmt}
+        if fmt == "metadata":
+            params["metadataHeaders"] = THREAD_HEADERS
+            params["fields"] = THREAD_FIELDS
+
+        return self.get_thread_service().users().threads().get(**params).execute()
+
+
+    def get_threads(self, thread_ids, fmt="metadata", workers=8):
+        """
+        【処理内容】
+        スレッドを並列に取得する
+        【引数】
+        thread_ids：スレッドIDのイテラブル
+        fmt：取得形式(metadata、full、minimal)
+        workers：スレッド数
+        【戻り値】
+        スレッドのジェネレータ(取得した順)
+        取得に失敗したスレッドは返さない
+        """
+
+        self._logger.debug("get_threads start" + location())
+
+        get_thread = lambda thread_id: self.get_thread(thread_id, fmt=fmt)
+        for thread_id, thread in self.execute_concurrent(get_thread, thread_ids, workers):
+            if thread is None:
+                self._logger.warning("failed to get thread: " + thread_id + location())
+                continue
+            yield thread
+
+        self._logger.debug("get_threads end" + location())
+
+
+    def get_header_batch(self, message_ids, headers=SCAN_HEADERS):
+        """
+        【処理内容】
+        メッセージのヘッダーを1回のバッチリクエストで取得する
+        ワーカースレッドから呼び出せる
+        【引数】
+        message_ids：メッセージIDのリスト(最大100件、重複したIDは1回のみ取得する)
+        headers：取得するヘッダー名のタプル
+        【戻り値】
+        (messages().getの結果のリスト, 失敗したメッセージIDとHttpErrorのリスト)
+        """
+
+        service = self.get_thread_service()
+        responses, failures = [], []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                responses.append(response)
+            else:
+                failures.append((request_id, exception))
+
+        # リソースの作成は重いため、バッチごとに1回のみ行う
+        messages = service.users().messages()
+        batch = service.new_batch_http_request(callback=callback)
+        for message_id in dict.fromkeys(message_ids):
+            batch.add(
+                messages.get(
+                    userId=self._user_id,
+                    id=message_id,
+                    format="metadata",
+                    metadataHeaders=list(headers),
+                    fields=SCAN_FIELDS,
+                ),
+                request_id=message_id,
+            )
+        batch.execute()
+
+        return responses, failures
+
+
+    def scan_headers(self, message_ids, headers=SCAN_HEADERS, batch_size=BATCH_SIZE, workers=4, retries=3, backoff=1.0):
+        """
+        【処理内容】
+        メッセージのヘッダーのみを取得する
+        format=metadataで指定したヘッダーのみをバッチリクエストで取得し、
+        解析済みのJSONから辞書を作らずにnamedtupleを作成する
+        【引数】
+        message_ids：メッセージIDのイテラブル
+        headers：取得するヘッダー名のタプル
+        batch_size：1回のバッチリクエストに含めるメッセージ数(最大100)
+        workers：スレッド数
+        retries：制限(429など)された場合の再試行回数
+        backoff：再試行までの待機秒数(再試行ごとに2倍)
+        【戻り値】
+        namedtuple(id、thread_id、internal_date、ヘッダー)のジェネレータ(取得した順、重複したIDは1回のみ)
+        ヘッダーがない場合はNone、取得に失敗したメッセージは返さない
+        """
+
+        self._logger.debug("scan_headers start" + location())
+
+        headers = tuple(headers)
+        record = make_header_record(headers)
+        positions = {header.lower(): index for index, header in enumerate(headers)}
+        empty = [None] * len(headers)
+
+        def batches(ids):
+            chunk = []
+            for message_id in ids:
+                # 同じIDが重複するとバッチリクエストに追加できないため、1回のみ取得する
+                if message_id in seen:
+                    continue
+                seen.add(message_id)
+                chunk.append(message_id)
+                if len(chunk) >= batch_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+        get_batch = lambda chunk: self.get_header_batch(chunk, headers)
+        pending = message_ids
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                time.sleep(backoff * 2 ** (attempt - 1))
+
+            seen = set()
+
+            retry_ids = []
+            for chunk, result in self.execute_concurrent(get_batch, batches(pending), workers):
+                if result is None:
+                    retry_ids.extend(chunk)
+                    continue
+
+                responses, failures = result
+                for response in responses:
+                    values = empty[:]
+                    for header in response.get("payload", {}).get("headers", ()):
+                        index = positions.get(header["name"].lower())
+                        if not index is None and values[index] is None:
+                            values[index] = header["value"]
+                    yield record(response["id"], response["threadId"], int(response.get("internalDate", 0)), *values)
+
+                for message_id, error in failures:
+                    if is_throttled(error):
+                        retry_ids.append(message_id)
+                    else:
+                        self._logger.warning(f"failed to get message: {message_id} {error}" + location())
+
+            if not retry_ids:
+                break
+            if attempt == retries:
+                self._logger.warning("failed to get messages: " + str(len(retry_ids)) + location())
+                break
+
+            self._logger.warning(f"retry {attempt + 1}/{retries}: {len(retry_ids)} messages" + location())
+            pending = retry_ids
+
+        self._logger.debug("scan_headers end" + location())
+
+
+    def modify_labels(self, message_ids, add_label_ids=None, remove_label_ids=None):
+        """
+        【処理内容】
+        メッセージのラベルをまとめて追加・削除する(batchModify)
+        1回のリクエストで最大1000件ずつ処理する
+        ワーカースレッドから呼び出せる
+        【引数】
+        message_ids：メッセージIDのリスト
+        add_label_ids：追加するラベルIDのリスト
+        remove_label_ids：削除するラベルIDのリスト
+        【戻り値】
+        count：処理したメッセージ数(エラーの場合はNone)
+        """
+
+        self._logger.debug("modify_labels start" + location())
+
+        message_ids = list(message_ids)
+        body = {"addLabelIds": list(add_label_ids or []), "removeLabelIds": list(remove_label_ids or [])}
+
+        count = 0
+        try:
+            for start in range(0, len(message_ids), BATCH_MODIFY_SIZE):
+                ids = message_ids[start:start + BATCH_MODIFY_SIZE]
+                self.get_thread_service().users().messages().batchModify(
+                    userId=self._user_id, body=dict(body, ids=ids)
+                ).execute()
+                count += len(ids)
+
+        except errors.HttpError as error:
+            # それまでのリクエストで処理したメッセージは変更済み
+            self._logger.error(f"An error occurred: {error} (modified: {count}/{len(message_ids)})")
+            return None
+
+        self._logger.debug("modify_labels end" + location())
+
+        return count
+
+
+    def send_message(self, subject, body, sender, to, cc=None, bcc=None, files=None, outbox=None, validate=True, key=None):
         """
         【処理内容】
         メッセージを送信する
+        outboxを指定した場合は送信せずに送信待ちに追加する(OutboxWorkerClassが送信する)
+        validateを指定した場合は送信前に宛先を正規化・重複除去し、不正なアドレスがあれば送信しない
         【引数】
         subject：件名
         body：本文
@@ -341,10 +982,19 @@ class GmailClass:
         cc：カーボンコピー
         bcc：ブラインドカーボンコピー
         files：添付ファイル
+        outbox：キュー(OutboxClassのオブジェクト)
+        validate：宛先を検証する(不正なアドレスがある場合はValueError)
+        key：送信待ちに追加する場合の冪等キー(OutboxClass.enqueueを参照)
         【戻り値】
-        message_id：メッセージID
+        message_id：メッセージID(outboxを指定した場合はキューのID)
         """
 
+        if validate:
+            to, cc, bcc = self.validate_recipients(to, cc, bcc)
+
+        if not outbox is None:
+            return outbox.enqueue(subject, body, sender, to, cc, bcc, files, key=key)
+
         try:
             self._logger.debug("send_message start" + location())
 
@@ -361,19 +1011,429 @@ class GmailClass:
             else:
                 message = self.create_message(subject, body, sender, to, cc, bcc)
 
-            sent_message = (
-                self._service.users().messages().send(userId=self._user_id, body=message).execute()
-            )
+            message_id = self.send_encoded_message(message)
 
             self._logger.debug("send_message end" + location())
 
-            return sent_message["id"]
+            return message_id
+
+        except errors.HttpError as error:
+            self._logger.error(f"An error occurred: {error}")
+
+
+    def validate_recipients(self, to, cc=None, bcc=None):
+        """
+        【処理内容】
+        宛先を正規化・重複除去・検証する(RecipientListClass)
+        【引数】
+        to：宛先
+        cc：カーボンコピー
+        bcc：ブラインドカーボンコピー
+        【戻り値】
+        (宛先, カーボンコピー, ブラインドカーボンコピー)(宛先は文字列(ない場合は空文字)、カーボンコピー・ブラインドカーボンコピーはない場合None)
+        """
+
+        recipients = RecipientListClass(to, cc, bcc)
+        if recipients.invalid:
+            raise ValueError("invalid addresses: " + ", ".join(f"{field}: {address}" for field, address in recipients.invalid))
+        if not len(recipients):
+            raise ValueError("no recipients")
+
+        if recipients.duplicates:
+            self._logger.info("duplicate recipients removed: " + str(recipients.duplicates) + location())
+
+        return recipients.get_header("to") or "", recipients.get_header("cc"), recipients.get_header("bcc")
+
+
+    def send_message_idempotent(self, ledger, subject, body, sender, to, cc=None, bcc=None, files=None, key=None, retries=3, backoff=1.0, validate=True):
+        """
+        【処理内容】
+        冪等キーで重複を防ぎながらメッセージを送信する
+        冪等キーを台帳とX-Idempotency-Keyヘッダーに記録し、送信済みのキーは送信しない
+        送信結果が不明な失敗(タイムアウト、5xx)の後は、送信済みメッセージを確認してから再送する
+        【引数】
+        ledger：台帳(SendLedgerClassのオブジェクト)
+        subject：件名
+        body：本文
+        sender：送信元
+        to：宛先
+        cc：カーボンコピー
+        bcc：ブラインドカーボンコピー
+        files：添付ファイル
+        key：冪等キー(Noneの場合はメッセージの内容から作成)
+        retries：再試行回数
+        backoff：再試行までの待機秒数(再試行ごとに2倍)
+        validate：宛先を検証する(不正なアドレスがある場合はValueError)
+        【戻り値】
+        message_id：メッセージID(送信できなかった場合はNone)
+        """
+
+        self._logger.debug("send_message_idempotent start" + location())
+
+        if validate:
+            to, cc, bcc = self.validate_recipients(to, cc, bcc)
+
+        if key is None:
+            key = make_idempotency_key(subject, body, sender, to, cc, bcc, files)
+        self._logger.debug("key: " + key + location())
+
+        record = ledger.get(key)
+        if not record is None and not record["message_id"] is None:
+            self._logger.info("already sent: " + key + " message_id: " + record["message_id"] + location())
+            return record["message_id"]
+
+        # 前回の送信結果が不明な場合は、送信済みか確認してから送信する
+        ambiguous = not record is None
+        record = ledger.reserve(key)
+        if record is None:
+            # 他のスレッド・プロセスが送信中(または送信済み)のため送信しない
+            self._logger.warning("in flight: " + key + location())
+            return None
+
+        headers = {IDEMPOTENCY_HEADER: key}
+        try:
+            if files:
+                message = self.create_message_files(subject, body, files, sender, to, cc, bcc, headers=headers)
+            else:
+                message = self.create_message(subject, body, sender, to, cc, bcc, headers=headers)
+        except Exception:
+            self.unreserve(ledger, key, ambiguous)
+            raise
+
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                time.sleep(backoff * 2 ** (attempt - 1))
+
+            try:
+                if ambiguous:
+                    message_id = self.find_sent_message(key, since=record["created"])
+                    if not message_id is None:
+                        self._logger.info("found sent message: " + key + " message_id: " + message_id + location())
+                        ledger.complete(key, message_id)
+                        return message_id
+
+                message_id = self.send_encoded_message(message)
+                ledger.complete(key, message_id)
+
+                self._logger.debug("send_message_idempotent end" + location())
+
+                return message_id
+
+            except errors.HttpError as error:
+                if not error.resp.status in RETRY_STATUSES:
+                    self._logger.error(f"An error occurred: {error}")
+                    self.unreserve(ledger, key, ambiguous)
+                    return None
+
+                # 429は送信されていないが、5xxは送信されている可能性がある
+                ambiguous = ambiguous or error.resp.status >= 500
+                self._logger.warning(f"retry {attempt + 1}/{retries}: {error}" + location())
+
+            except (OSError, httplib2.HttpLib2Error) as error:
+                ambiguous = True
+                self._logger.warning(f"retry {attempt + 1}/{retries}: {error}" + location())
+
+            except Exception:
+                self.unreserve(ledger, key, ambiguous)
+                raise
+
+        self._logger.error("failed to send: " + key + location())
+        ledger.unlock(key)
+
+        return None
+
+
+    def unreserve(self, ledger, key, ambiguous):
+        """
+        【処理内容】
+        送信できなかった冪等キーの送信中の記録を解放する
+        送信されていないことが確定した場合は記録を削除し、不明な場合は記録を残して期限のみ解除する
+        【引数】
+        ledger：台帳(SendLedgerClassのオブジェクト)
+        key：冪等キー
+        ambiguous：送信されている可能性がある
+        【戻り値】
+        なし
+        """
+
+        if ambiguous:
+            ledger.unlock(key)
+        else:
+            ledger.release(key)
+
+
+    def find_sent_message(self, key, since=None, count=None):
+        """
+        【処理内容】
+        送信済みメッセージから冪等キーが一致するメッセージを探す
+        ヘッダーのみ(format=metadata)をバッチリクエストで取得して確認する
+        ワーカースレッドから呼び出せる
+        【引数】
+        key：冪等キー
+        since：この日時(UNIX時間)以降に送信したメッセージを探す
+        count：確認するメッセージ数の上限(Noneの場合、sinceを指定すれば以降のすべて、指定しなければ50件)
+        【戻り値】
+        message_id：メッセージID(ない場合はNone)
+        """
+
+        service = self.get_thread_service()
+
+        query = "in:sent"
+        if not since is None:
+            # 時刻のずれを考慮して少し前から探す
+            query += f" after:{int(since) - 300}"
+        if count is None and since is None:
+            count = 50
+
+        params = {"userId": self._user_id, "q": query, "maxResults": min(count or 500, 500)}
+        checked = 0
+        while True:
+            res = service.users().messages().list(**params).execute()
+            message_ids = [message_id["id"] for message_id in res.get("messages", [])]
+            if not count is None:
+                message_ids = message_ids[:count - checked]
+
+            for start in range(0, len(message_ids), BATCH_SIZE):
+                responses, failures = self.get_header_batch(message_ids[start:start + BATCH_SIZE], (IDEMPOTENCY_HEADER,))
+                for message_id, error in failures:
+                    self._logger.warning(f"failed to get message: {message_id} {error}" + location())
+
+                for message_detail in responses:
+                    for header in message_detail.get("payload", {}).get("headers", ()):
+                        # 長いヘッダーは折り返されるため、空白を除いて比較する
+                        if header["name"].lower() == IDEMPOTENCY_HEADER.lower() and "".join(header["value"].split()) == key:
+                            return message_detail["id"]
+
+            checked += len(message_ids)
+            if not "nextPageToken" in res or (not count is None and checked >= count):
+                return None
+            params["pageToken"] = res["nextPageToken"]
+
+
+    def send_encoded_message(self, message):
+        """
+        【処理内容】
+        エンコード済みのメッセージを送信する
+        ワーカースレッドから呼び出せる
+        【引数】
+        message：エンコードしたMIMEText
+        【戻り値】
+        message_id：メッセージID
+        """
+
+        sent_message = (
+            self.get_thread_service().users().messages().send(userId=self._user_id, body=message).execute()
+        )
+
+        return sent_message["id"]
+
+
+    def create_draft(self, subject, body, sender, to, cc=None, bcc=None, files=None, validate=True):
+        """
+        【処理内容】
+        下書きを作成する
+        【引数】
+        subject：件名
+        body：本文
+        sender：送信元
+        to：宛先
+        cc：カーボンコピー
+        bcc：ブラインドカーボンコピー
+        files：添付ファイル
+        validate：宛先を検証する(不正なアドレスがある場合はValueError)
+        【戻り値】
+        draft_id：下書きID
+        """
+
+        if validate:
+            to, cc, bcc = self.validate_recipients(to, cc, bcc)
+
+        try:
+            self._logger.debug("create_draft start" + location())
+
+            if files:
+                message = self.create_message_files(subject, body, files, sender, to, cc, bcc)
+            else:
+                message = self.create_message(subject, body, sender, to, cc, bcc)
+
+            draft_id = self.create_encoded_draft(message)
+
+            self._logger.debug("create_draft end" + location())
+
+            return draft_id
+
+        except errors.HttpError as error:
+            self._logger.error(f"An error occurred: {error}")
+
+
+    def create_encoded_draft(self, message):
+        """
+        【処理内容】
+        エンコード済みのメッセージから下書きを作成する
+        ワーカースレッドから呼び出せる
+        【引数】
+        message：エンコードしたMIMEText
+        【戻り値】
+        draft_id：下書きID
+        """
+
+        draft = (
+            self.get_thread_service().users().drafts().create(userId=self._user_id, body={"message": message}).execute()
+        )
+
+        return draft["id"]
+
+
+    def create_drafts(self, messages, workers=8):
+        """
+        【処理内容】
+        エンコード済みのメッセージから下書きを並列に作成する
+        送信前にMIMEの作成とアップロードを済ませておくために利用する
+        【引数】
+        messages：エンコードしたMIMETextのイテラブル
+            (MessageTemplateClass.renderの結果など)
+        workers：スレッド数
+        【戻り値】
+        draft_ids：下書きIDのリスト(messagesと同じ順、作成に失敗したものはNone)
+        """
+
+        self._logger.debug("create_drafts start" + location())
+
+        draft_ids = []
+        create = lambda item: self.create_encoded_draft(item[1])
+        for (index, _), draft_id in self.execute_concurrent(create, enumerate(messages), workers):
+            # 完了した順に返るため、メッセージの順の位置に格納する
+            if index >= len(draft_ids):
+                draft_ids.extend([None] * (index + 1 - len(draft_ids)))
+            draft_ids[index] = draft_id
+
+        self._logger.debug("create_drafts end" + location())
+
+        return draft_ids
+
+
+    def update_draft(self, draft_id, subject, body, sender, to, cc=None, bcc=None, files=None, validate=True):
+        """
+        【処理内容】
+        下書きを更新する
+        【引数】
+        draft_id：下書きID
+        subject：件名
+        body：本文
+        sender：送信元
+        to：宛先
+        cc：カーボンコピー
+        bcc：ブラインドカーボンコピー
+        files：添付ファイル
+        validate：宛先を検証する(不正なアドレスがある場合はValueError)
+        【戻り値】
+        draft_id：下書きID
+        """
+
+        if validate:
+            to, cc, bcc = self.validate_recipients(to, cc, bcc)
+
+        try:
+            self._logger.debug("update_draft start" + location())
+
+            self._logger.debug("draft_id: " + draft_id + location())
+
+            if files:
+                message = self.create_message_files(subject, body, files, sender, to, cc, bcc)
+            else:
+                message = self.create_message(subject, body, sender, to, cc, bcc)
+
+            draft = self._service.users().drafts().update(
+                userId=self._user_id,
+                id=draft_id,
+                body={"id": draft_id, "message": message}
+            ).execute()
+
+            self._logger.debug("update_draft end" + location())
+
+            return draft["id"]
+
+        except errors.HttpError as error:
+            self._logger.error(f"An error occurred: {error}")
+
+
+    def get_drafts(self, query=None, count=100):
+        """
+        【処理内容】
+        下書きを取得する
+        【引数】
+        query：検索クエリ
+            https://support.google.com/mail/answer/7190
+        count：取得数
+        【戻り値】
+        drafts：下書き(id、message)のリスト
+        """
+
+        try:
+            self._logger.debug("get_drafts start" + location())
+
+            params = {"userId": self._user_id, "maxResults": count}
+            if not query is None:
+                params["q"] = query
+
+            res = self._service.users().drafts().list(**params).execute()
+
+            if res.get("resultSizeEstimate", 0) == 0:
+                return None
+
+            self._logger.debug("get_drafts end" + location())
+
+            return res["drafts"]
 
         except errors.HttpError as error:
             self._logger.error(f"An error occurred: {error}")
 
 
-    def create_message(self, subject, body, sender, to, cc=None, bcc=None):
+    def send_draft(self, draft_id):
+        """
+        【処理内容】
+        下書きを送信する
+        ワーカースレッドから呼び出せる
+        【引数】
+        draft_id：下書きID
+        【戻り値】
+        message_id：メッセージID
+        """
+
+        sent_message = (
+            self.get_thread_service().users().drafts().send(userId=self._user_id, body={"id": draft_id}).execute()
+        )
+
+        return sent_message["id"]
+
+
+    def send_drafts(self, draft_ids, workers=4, rate=None):
+        """
+        【処理内容】
+        下書きを並列に送信する
+        【引数】
+        draft_ids：下書きIDのイテラブル
+        workers：スレッド数
+        rate：1秒あたりの送信数(Noneの場合は制限しない)
+        【戻り値】
+        sent：下書きIDをキー、メッセージIDを値とする辞書(送信に失敗したものは値がNone)
+        """
+
+        self._logger.debug("send_drafts start" + location())
+
+        rate_limit = None if rate is None else RateLimitClass(rate, burst=workers)
+
+        sent = {}
+        for draft_id, message_id in self.execute_concurrent(self.send_draft, draft_ids, workers, rate_limit):
+            sent[draft_id] = message_id
+            self._logger.debug("draft_id: " + draft_id + " message_id: " + str(message_id) + location())
+
+        self._logger.debug("send_drafts end" + location())
+
+        return sent
+
+
+    def create_message(self, subject, body, sender, to, cc=None, bcc=None, headers=None):
         """
         【処理内容】
         添付ファイルなしMIMETextをbase64エンコードする
@@ -384,25 +1444,33 @@ class GmailClass:
         to：宛先
         cc：カーボンコピー
         bcc：ブラインドカーボンコピー
+        headers：追加するヘッダーの辞書
         【戻り値】
         エンコードしたMIMEText
         """
 
         self._logger.debug("create_message start" + location())
 
-        enc = "utf-8"
-        message = MIMEText(body.encode(enc), _charset=enc)
-        message["subject"] = subject
-        message["from"] = sender
-        message["to"] = to
+        with phase("mime"):
+            enc = "utf-8"
+            message = MIMEText(body.encode(enc), _charset=enc)
+            message["subject"] = subject
+            message["from"] = sender
+            message["to"] = to
 
-        if cc:
-            message["cc"] = cc
+            if cc:
+                message["cc"] = cc
 
-        if bcc:
-            message["bcc"] = bcc
+            if bcc:
+                message["bcc"] = bcc
 
-        encode_message = base64.urlsafe_b64encode(message.as_bytes())
+            for name, value in (headers or {}).items():
+                message[name] = value
+
+            message_bytes = message.as_bytes()
+
+        with phase("base64"):
+            encode_message = base64.urlsafe_b64encode(message_bytes)
 
         self._logger.debug("encode_message: " + str(encode_message) + location())
 
@@ -411,7 +1479,7 @@ class GmailClass:
         return {"raw": encode_message.decode()}
 
 
-    def create_message_files(self, subject, body, files, sender, to, cc=None, bcc=None):
+    def create_message_files(self, subject, body, files, sender, to, cc=None, bcc=None, headers=None):
         """
         【処理内容】
         添付ファイルありMIMETextをbase64エンコードする
@@ -424,63 +1492,103 @@ class GmailClass:
         to：宛先
         cc：カーボンコピー
         bcc：ブラインドカーボンコピー
+        headers：追加するヘッダーの辞書
         【戻り値】
         エンコードしたMIMEText
         """
 
         self._logger.debug("create_message_files start" + location())
 
-        message = MIMEMultipart()
-        message["subject"] = subject
-        message["from"] = sender
-        message["to"] = to
-
-        if cc:
-            message["cc"] = cc
-
-        if bcc:
-            message["bcc"] = bcc
+        with phase("mime"):
+            message = MIMEMultipart()
+            message["subject"] = subject
+            message["from"] = sender
+            message["to"] = to
 
-        enc = "utf-8"
-        msg = MIMEText(body.encode(enc), _charset=enc)
-        message.attach(msg)
+            if cc:
+                message["cc"] = cc
 
-        for index, file in enumerate(files):
+            if bcc:
+                message["bcc"] = bcc
 
-            content_type, encoding = mimetypes.guess_type(file)
+            for name, value in (headers or {}).items():
+                message[name] = value
 
-            if content_type is None or encoding is not None:
-                content_type = "application/octet-stream"
-            main_type, sub_type = content_type.split("/", 1)
-
-            self._logger.debug("file" + str(index + 1) + ": " + file + location())
-            self._logger.debug("content_type: " + str(content_type) + location())
-            self._logger.debug("encoding: " + str(encoding) + location())
-            self._logger.debug("main_type: " + str(main_type) + location())
-            self._logger.debug("sub_type: " + str(sub_type) + location())
+            enc = "utf-8"
+            msg = MIMEText(body.encode(enc), _charset=enc)
+            message.attach(msg)
 
-            if main_type == "text" or main_type == "application":
-                with open(file, "rb") as fp:
-                    msg = MIMEApplication(fp.read(), _subtype=sub_type)
-            elif main_type == "image":
-                with open(file, "rb") as fp:
-                    msg = MIMEImage(fp.read(), _subtype=sub_type)
-            elif main_type == "audio":
-                with open(file, "rb") as fp:
-                    msg = MIMEAudio(fp.read(), _subtype=sub_type)
-            else:
-                with open(file, "rb") as fp:
-                    msg = MIMEBase(main_type, sub_type)
-                    msg.set_payload(fp.read())
+            for index, file in enumerate(files):
+                self._logger.debug("file" + str(index + 1) + ": " + file + location())
+                with phase("mime.attachment"):
+                    message.attach(self.get_attachment(file))
 
-            p = Path(file)
-            msg.add_header("Content-Disposition", "attachment", filename=p.name)
-            message.attach(msg)
+            message_bytes = message.as_bytes()
 
-        encode_message = base64.urlsafe_b64encode(message.as_bytes())
+        with phase("base64"):
+            encode_message = base64.urlsafe_b64encode(message_bytes)
 
         # self._logger.debug("encode_message: " + str(encode_message) + location())
 
         self._logger.debug("create_message_files end" + location())
 
         return {"raw": encode_message.decode()}
+
+
+    def get_attachment(self, file):
+        """
+        【処理内容】
+        添付ファイルのMIMEパートを取得する
+        添付ファイルキャッシュが設定されている場合はキャッシュを利用する
+        【引数】
+        file：添付ファイル
+        【戻り値】
+        添付ファイルのMIMEパート
+        """
+
+        if self._attachment_cache is None:
+            return self.create_attachment(file)
+
+        return self._attachment_cache.get_part(file, self.create_attachment)
+
+
+    def create_attachment(self, file, data=None):
+        """
+        【処理内容】
+        添付ファイルのMIMEパートを作成する
+        【引数】
+        file：添付ファイル
+        data：添付ファイルの内容(Noneの場合はファイルから読み込む)
+        【戻り値】
+        添付ファイルのMIMEパート
+        """
+
+        content_type, encoding = mimetypes.guess_type(file)
+
+        if content_type is None or encoding is not None:
+            content_type = "application/octet-stream"
+        main_type, sub_type = content_type.split("/", 1)
+
+        self._logger.debug("content_type: " + str(content_type) + location())
+        self._logger.debug("encoding: " + str(encoding) + location())
+        self._logger.debug("main_type: " + str(main_type) + location())
+        self._logger.debug("sub_type: " + str(sub_type) + location())
+
+        if data is None:
+            with open(file, "rb") as fp:
+                data = fp.read()
+
+        if main_type == "text" or main_type == "application":
+            msg = MIMEApplication(data, _subtype=sub_type)
+        elif main_type == "image":
+            msg = MIMEImage(data, _subtype=sub_type)
+        elif main_type == "audio":
+            msg = MIMEAudio(data, _subtype=sub_type)
+        else:
+            msg = MIMEBase(main_type, sub_type)
+            msg.set_payload(data)
+
+        p = Path(file)
+        msg.add_header("Content-Disposition", "attachment", filename=p.name)
+
+        return msg
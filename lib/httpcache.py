@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+@name           httpcache.py
+@author         yoshi0518
+@description    HTTPレスポンスの圧縮転送とキャッシュ(ETag、有効期限)に関する処理のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+from collections import OrderedDict
+import logging
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.http import build_http
+import httplib2
+
+from .profiler import phase
+from .util import location
+
+
+##### 定数宣言 #####
+# キャッシュする URL の正規表現と有効期限(秒)
+# 有効期限が切れた後、ETagがあれば条件付きリクエスト(If-None-Match)で確認する
+DEFAULT_TTLS = [
+    (r"/users/[^/]+/labels(\?|$)", 300), # ラベルの一覧
+    (r"/users/[^/]+/labels/[^/?]+(\?|$)", 300), # ラベル
+    (r"/users/[^/]+/(messages|threads)/[^/?]+\?(.*&)?format=metadata", 60), # メッセージ・スレッドのヘッダー
+]
+SEND_PATTERN = re.compile(r"/send$") # 既存のリソースを変更しない書き込み
+COLLECTION_PATTERN = re.compile(r"(.*?/users/[^/]+/[^/]+)") # 書き込み先のコレクション(/gmail/v1/users/{userId}/{collection})
+
+
+class ResponseCacheClass:
+    """
+    【クラス内容】
+    GETのレスポンスをURLごとにキャッシュする(メモリ上、LRU)
+    複数のスレッド(スレッドごとのリソース)から共有できる
+    URLにはユーザーID(me)しか含まれないため、アカウントごとに別のオブジェクトを使う
+    """
+
+    ##### 変数宣言 #####
+    stats = None
+    _entries = None
+    _lock = None
+    _logger = None
+    _max_entries = None
+    _ttls = None
+
+
+    def __init__(self, ttls=None, max_entries=10000):
+        """
+        【処理内容】
+        キャッシュの初期設定を行う
+        【引数】
+        ttls：(URLの正規表現, 有効期限(秒))のリスト(Noneの場合はDEFAULT_TTLS)
+            最初に一致したものを使い、一致しないURLはキャッシュしない
+            有効期限0は毎回ETagで確認する
+        max_entries：キャッシュする件数の上限
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._ttls = [(re.compile(pattern), ttl) for pattern, ttl in (DEFAULT_TTLS if ttls is None else ttls)]
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "bytes_saved": 0}
+
+
+    def get_ttl(self, uri):
+        """
+        【処理内容】
+        URLの有効期限を取得する
+        【引数】
+        uri：URL
+        【戻り値】
+        有効期限(秒)(キャッシュしないURLの場合はNone)
+        """
+
+        for pattern, ttl in self._ttls:
+            if pattern.search(uri):
+                return ttl
+
+        return None
+
+
+    def get(self, uri):
+        """
+        【処理内容】
+        キャッシュを取得する
+        【引数】
+        uri：URL
+        【戻り値】
+        (レスポンスヘッダーの辞書, 本文, ETag, 有効期限(UNIX時間))(ない場合はNone)
+        """
+
+        with self._lock:
+            entry = self._entries.get(uri)
+            if not entry is None:
+                self._entries.move_to_end(uri)
+
+        return entry
+
+
+    def put(self, uri, headers, content, ttl):
+        """
+        【処理内容】
+        レスポンスをキャッシュする
+        【引数】
+        uri：URL
+        headers：レスポンスヘッダーの辞書
+        content：本文
+        ttl：有効期限(秒)
+        【戻り値】
+        なし
+        """
+
+        with self._lock:
+            self._entries[uri] = (headers, content, headers.get("etag"), time.time() + ttl)
+            self._entries.move_to_end(uri)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+    def touch(self, uri, ttl):
+        """
+        【処理内容】
+        変更がなかったキャッシュの有効期限を延長する
+        【引数】
+        uri：URL
+        ttl：有効期限(秒)
+        【戻り値】
+        なし
+        """
+
+        with self._lock:
+            entry = self._entries.get(uri)
+            if not entry is None:
+                self._entries[uri] = entry[:3] + (time.time() + ttl,)
+
+
+    def invalidate(self, path_prefix=None):
+        """
+        【処理内容】
+        キャッシュを削除する
+        【引数】
+        path_prefix：URLのパスの先頭(Noneの場合はすべて)
+        【戻り値】
+        削除した件数
+        """
+
+        with self._lock:
+            if path_prefix is None:
+                count = len(self._entries)
+                self._entries.clear()
+            else:
+                uris = [uri for uri in self._entries if urlsplit(uri).path.startswith(path_prefix)]
+                for uri in uris:
+                    del self._entries[uri]
+                count = len(uris)
+
+        if count:
+            self._logger.debug("invalidate: " + str(path_prefix) + " " + str(count) + location())
+
+        return count
+
+
+class CachingHttpClass:
+    """
+    【クラス内容】
+    httplib2.Http互換のオブジェクトをラップし、圧縮転送とレスポンスのキャッシュを行う
+    googleapiclientのbuildにhttpとして渡す
+    """
+
+    ##### 変数宣言 #####
+    _cache = None
+    _http = None
+
+
+    def __init__(self, http, cache=None):
+        """
+        【処理内容】
+        ラップするオブジェクトを設定する
+        【引数】
+        http：httplib2.Http互換のオブジェクト(認証済み)
+        cache：キャッシュ(ResponseCacheClassのオブジェクト、Noneの場合は圧縮転送のみ)
+        【戻り値】
+        なし
+        """
+
+        self._http = http
+        self._cache = cache
+
+
+    def __getattr__(self, name):
+        return getattr(self._http, name)
+
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=httplib2.DEFAULT_MAX_REDIRECTS, connection_type=None, **kwargs):
+        """
+        【処理内容】
+        リクエストを送信する(httplib2.Http.requestと同じ)
+        Googleのサーバーはユーザーエージェントに"gzip"を含む場合のみ圧縮して返すため、付け加える
+        キャッシュが有効期限内ならリクエストせずに返し、期限切れでETagがあれば条件付きリクエストを送る
+        GET以外のリクエストが成功した場合は、同じコレクション(messages、labelsなど)のキャッシュを削除する
+        【引数】
+        httplib2.Http.requestと同じ
+        【戻り値】
+        (レスポンス, 本文)
+        """
+
+        headers = dict(headers or {})
+        headers.setdefault("accept-encoding", "gzip")
+        user_agent = headers.get("user-agent", "")
+        if not "gzip" in user_agent:
+            headers["user-agent"] = (user_agent + " (gzip)").strip()
+
+        ttl = None if self._cache is None or method != "GET" else self._cache.get_ttl(uri)
+        if ttl is None:
+            with phase("network"):
+                response, content = self._http.request(
+                    uri, method, body=body, headers=headers, redirections=redirections, connection_type=connection_type, **kwargs
+                )
+            if not self._cache is None and method != "GET" and response.status < 300:
+                self.invalidate_collection(uri)
+            return response, content
+
+        entry = self._cache.get(uri)
+        if not entry is None:
+            cached_headers, cached_content, etag, expires = entry
+            if time.time() < expires:
+                self._cache.stats["hits"] += 1
+                self._cache.stats["bytes_saved"] += len(cached_content)
+                return httplib2.Response(cached_headers), cached_content
+            if not etag is None:
+                headers["if-none-match"] = etag
+
+        with phase("network"):
+            response, content = self._http.request(
+                uri, method, body=body, headers=headers, redirections=redirections, connection_type=connection_type, **kwargs
+            )
+
+        if response.status == 304 and not entry is None:
+            self._cache.stats["revalidated"] += 1
+            self._cache.stats["bytes_saved"] += len(entry[1])
+            self._cache.touch(uri, ttl)
+            return httplib2.Response(entry[0]), entry[1]
+
+        self._cache.stats["misses"] += 1
+        if response.status == 200 and (ttl > 0 or "etag" in response):
+            self._cache.put(uri, dict(response), content, ttl)
+
+        return response, content
+
+
+    def invalidate_collection(self, uri):
+        """
+        【処理内容】
+        書き込み先のコレクションのキャッシュを削除する
+        送信(.../send)は既存のリソースを変更しないため削除しない
+        コレクションが分からないURL(バッチリクエストの/batch/gmail/v1など)は削除しない
+        (バッチリクエストで書き込みは行わないため)
+        【引数】
+        uri：書き込み先のURL
+        【戻り値】
+        なし
+        """
+
+        path = urlsplit(uri).path
+        if SEND_PATTERN.search(path):
+            return
+
+        match = COLLECTION_PATTERN.match(path)
+        if match is None:
+            return
+
+        self._cache.invalidate(match.group(1))
+
+
+def build_caching_http(credentials, cache=None):
+    """
+    【処理内容】
+    認証情報を付けて、圧縮転送・キャッシュを行うhttpオブジェクトを作成する
+    【引数】
+    credentials：認証情報
+    cache：キャッシュ(ResponseCacheClassのオブジェクト、Noneの場合は圧縮転送のみ)
+    【戻り値】
+    CachingHttpClassのオブジェクト
+    """
+
+    return CachingHttpClass(AuthorizedHttp(credentials, http=build_http()), cache)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+@name           ledger.py
+@author         yoshi0518
+@description    送信の重複防止(冪等キー)に関する処理のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+from .gmail import location
+
+
+##### 定数宣言 #####
+STATUS_PENDING = "pending" # 送信中(送信結果が不明)
+STATUS_SENT = "sent" # 送信済み
+LEASE = 600 # 送信中の記録を他の送信者が引き継げるまでの秒数
+
+
+class SendLedgerClass:
+    """
+    【クラス内容】
+    冪等キーと送信したメッセージIDの対応を記録する台帳(SQLite)
+    複数のスレッドから共有できる
+    """
+
+    ##### 変数宣言 #####
+    _conn = None
+    _lock = None
+    _logger = None
+
+
+    def __init__(self, path_db="send_ledger.db"):
+        """
+        【処理内容】
+        台帳を開き、テーブルがなければ作成する
+        【引数】
+        path_db：台帳のファイル
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._logger.debug("__init__ start" + location())
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path_db, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sends (
+                key TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                message_id TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                lease_until REAL NOT NULL DEFAULT 0
+            )
+        """)
+        # 送信中の期限(lease_until)がない台帳に列を追加する
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sends)")]
+        if not "lease_until" in columns:
+            self._conn.execute("ALTER TABLE sends ADD COLUMN lease_until REAL NOT NULL DEFAULT 0")
+        self._conn.commit()
+
+        self._logger.debug("__init__ end" + location())
+
+
+    def close(self):
+        """
+        【処理内容】
+        台帳を閉じる
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        self._conn.close()
+
+
+    def get(self, key):
+        """
+        【処理内容】
+        冪等キーの記録を取得する
+        【引数】
+        key：冪等キー
+        【戻り値】
+        記録の辞書(key、status、message_id、created、updated、lease_until)(ない場合はNone)
+        """
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, status, message_id, created, updated, lease_until FROM sends WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return dict(zip(("key", "status", "message_id", "created", "updated", "lease_until"), row))
+
+
+    def reserve(self, key, lease=LEASE):
+        """
+        【処理内容】
+        送信前に冪等キーを送信中として記録する
+        記録済みの場合は、送信中の期限が切れた記録(前回の送信結果が不明なもの)のみ引き継ぐ
+        他のスレッド・プロセスが同じキーを送信中の場合は記録できない
+        【引数】
+        key：冪等キー
+        lease：送信中の期限(秒、送信と再試行にかかる時間より長くする)
+        【戻り値】
+        記録の辞書(他の送信者が送信中・送信済みの場合はNone)
+        """
+
+        now = time.time()
+        with self._lock, self._conn:
+            reserved = self._conn.execute(
+                "INSERT OR IGNORE INTO sends (key, status, created, updated, lease_until) VALUES (?, ?, ?, ?, ?)",
+                (key, STATUS_PENDING, now, now, now + lease),
+            ).rowcount == 1
+            if not reserved:
+                reserved = self._conn.execute(
+                    "UPDATE sends SET updated = ?, lease_until = ? WHERE key = ? AND status = ? AND lease_until < ?",
+                    (now, now + lease, key, STATUS_PENDING, now),
+                ).rowcount == 1
+
+        return self.get(key) if reserved else None
+
+
+    def complete(self, key, message_id):
+        """
+        【処理内容】
+        冪等キーを送信済みとして記録する
+        【引数】
+        key：冪等キー
+        message_id：メッセージID
+        【戻り値】
+        なし
+        """
+
+        self._logger.debug("key: " + key + " message_id: " + message_id + location())
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sends (key, status, message_id, created, updated) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET status = excluded.status,"
+                " message_id = excluded.message_id, updated = excluded.updated",
+                (key, STATUS_SENT, message_id, now, now),
+            )
+
+
+    def unlock(self, key):
+        """
+        【処理内容】
+        送信結果が不明なまま諦めた冪等キーの送信中の期限を解除する
+        記録は残すため、次の送信者は送信済みか確認してから送信する
+        【引数】
+        key：冪等キー
+        【戻り値】
+        なし
+        """
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE sends SET lease_until = 0, updated = ? WHERE key = ? AND status = ?",
+                (time.time(), key, STATUS_PENDING),
+            )
+
+
+    def release(self, key):
+        """
+        【処理内容】
+        送信しなかったことが確定した冪等キーの記録を削除する
+        【引数】
+        key：冪等キー
+        【戻り値】
+        なし
+        """
+
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sends WHERE key = ? AND status = ?", (key, STATUS_PENDING))
@@ -0,0 +1,626 @@
+# -*- coding: utf-8 -*-
+"""
+@name           outbox.py
+@author         yoshi0518
+@description    送信待ちメッセージのキュー(送信箱)と送信ワーカーに関する処理のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from .gmail import RateLimitClass, location
+from .recipients import RecipientListClass, interleave_domains
+
+
+##### 定数宣言 #####
+STATUS_QUEUED = "queued" # 送信待ち
+STATUS_SENDING = "sending" # 送信中
+STATUS_SENT = "sent" # 送信済み
+STATUS_DEAD = "dead" # 送信を諦めた(デッドレター)
+STATUSES = (STATUS_QUEUED, STATUS_SENDING, STATUS_SENT, STATUS_DEAD)
+LEASE = 600 # 送信中のメッセージを他のプロセスが送信待ちに戻せるまでの秒数
+COLUMNS = ("id", "key", "payload", "status", "attempts", "next_attempt", "message_id", "error", "created", "updated")
+
+
+class OutboxClass:
+    """
+    【クラス内容】
+    送信待ちのメッセージを保持するキュー(SQLite)
+    プロセスが終了しても送信待ち・送信結果が残る
+    複数のスレッド・プロセスから共有できる(取り出しは排他的に行う)
+    """
+
+    ##### 変数宣言 #####
+    _conn = None
+    _lease = None
+    _lock = None
+    _logger = None
+
+
+    def __init__(self, path_db="outbox.db", lease=LEASE):
+        """
+        【処理内容】
+        キューを開き、テーブルがなければ作成する
+        【引数】
+        path_db：キューのファイル
+        lease：送信中のメッセージを送信待ちに戻せるまでの秒数(1件の送信にかかる時間より長くする)
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._logger.debug("__init__ start" + location())
+
+        self._lease = lease
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path_db, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                message_id TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status, next_attempt)")
+        self._conn.commit()
+
+        self._logger.debug("__init__ end" + location())
+
+
+    def close(self):
+        """
+        【処理内容】
+        キューを閉じる
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        self._conn.close()
+
+
+    def enqueue(self, subject, body, sender, to, cc=None, bcc=None, files=None, key=None, send_at=None):
+        """
+        【処理内容】
+        メッセージを送信待ちに追加する
+        同じ冪等キーのメッセージが追加済みの場合は追加しない
+        (冪等キーを指定しない場合は毎回追加する)
+        【引数】
+        subject：件名
+        body：本文
+        sender：送信元
+        to：宛先
+        cc：カーボンコピー
+        bcc：ブラインドカーボンコピー
+        files：添付ファイル(送信時に読み込むため、絶対パスで記録する)
+        key：冪等キー(Noneの場合は新しいキーを作成する)
+            再実行しても二重に追加しないようにする場合は、呼び出し元で決まったキーを指定する
+        send_at：送信する日時(UNIX時間、Noneの場合はすぐに送信する)
+        【戻り値】
+        item_id：キューのID
+        """
+
+        key, payload = self.make_payload(subject, body, sender, to, cc, bcc, files, key)
+
+        now = time.time()
+        with self._lock, self._conn:
+            item_id = self.insert(key, payload, send_at or now, now)
+
+        self._logger.debug("enqueue: " + str(item_id) + " key: " + key + location())
+
+        return item_id
+
+
+    def enqueue_bulk(self, subject, body, sender, recipients, files=None, domain_interval=0.0, send_at=None, key=None):
+        """
+        【処理内容】
+        宛先ごとに1通ずつ、ドメインが交互になる順に送信待ちに追加する(1回のトランザクション)
+        宛先は正規化・重複除去・検証し、不正なアドレスは追加しない
+        同じドメインの2通目以降はdomain_intervalずつ送信する日時を遅らせ、受信側のサーバーによる制限を避ける
+        【引数】
+        subject：件名
+        body：本文
+        sender：送信元
+        recipients：宛先(カンマ区切りの文字列またはそのリスト)
+        files：添付ファイル
+        domain_interval：同じドメインへの送信間隔(秒)
+        send_at：最初に送信する日時(UNIX時間、Noneの場合はすぐに送信する)
+        key：一括送信の冪等キー(指定した場合は「キー:宛先」を各メッセージの冪等キーにし、再実行しても二重に追加しない)
+        【戻り値】
+        item_ids：キューのIDのリスト(追加した順)
+        invalid：不正なアドレスのリスト
+        """
+
+        recipient_list = RecipientListClass(recipients)
+        invalid = [address for _, address in recipient_list.invalid]
+        if invalid:
+            self._logger.warning("invalid addresses: " + str(len(invalid)) + location())
+
+        now = time.time()
+        start = send_at or now
+        item_ids = []
+        with self._lock, self._conn:
+            for rounds, address in interleave_domains(recipient_list.group_by_domain()):
+                item_key, payload = self.make_payload(
+                    subject, body, sender, address, files=files, key=None if key is None else f"{key}:{address}"
+                )
+                item_ids.append(self.insert(item_key, payload, start + rounds * domain_interval, now))
+
+        self._logger.debug("enqueue_bulk: " + str(len(item_ids)) + location())
+
+        return item_ids, invalid
+
+
+    def make_payload(self, subject, body, sender, to, cc=None, bcc=None, files=None, key=None):
+        """
+        【処理内容】
+        キューに記録するメッセージの内容(JSON)と冪等キーを作成する
+        【引数】
+        enqueueと同じ
+        【戻り値】
+        (冪等キー, JSON文字列)
+        """
+
+        if files:
+            files = [os.path.abspath(file) for file in files]
+        if key is None:
+            key = uuid.uuid4().hex
+
+        payload = json.dumps({
+            "subject": subject,
+            "body": body,
+            "sender": sender,
+            "to": to,
+            "cc": cc,
+            "bcc": bcc,
+            "files": files or None,
+        }, ensure_ascii=False)
+
+        return key, payload
+
+
+    def insert(self, key, payload, next_attempt, now):
+        """
+        【処理内容】
+        送信待ちの行を追加する(同じ冪等キーの行がある場合は追加しない)
+        ロックを取得し、トランザクション内で呼び出す
+        【引数】
+        key：冪等キー
+        payload：JSON文字列
+        next_attempt：送信する日時(UNIX時間)
+        now：現在の日時(UNIX時間)
+        【戻り値】
+        item_id：キューのID
+        """
+
+        self._conn.execute(
+            "INSERT OR IGNORE INTO outbox (key, payload, status, next_attempt, created, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (key, payload, STATUS_QUEUED, next_attempt, now, now),
+        )
+
+        return self._conn.execute("SELECT id FROM outbox WHERE key = ?", (key,)).fetchone()[0]
+
+
+    def claim(self, count=1):
+        """
+        【処理内容】
+        送信する日時になった送信待ちのメッセージを取り出し、送信中にする
+        他のプロセスと同じメッセージを取り出さないよう、書き込みのロックを取得してから検索する
+        取り出した日時(updated)から送信中の期限を数える
+        【引数】
+        count：取り出す件数の上限
+        【戻り値】
+        items：キューの項目の辞書のリスト(payloadは辞書に変換済み)
+        """
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM outbox WHERE status = ? AND next_attempt <= ?"
+                " ORDER BY next_attempt, id LIMIT ?",
+                (STATUS_QUEUED, now, count),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE outbox SET status = ?, updated = ? WHERE id = ?",
+                [(STATUS_SENDING, now, row[0]) for row in rows],
+            )
+
+        return [self.to_item(row, STATUS_SENDING) for row in rows]
+
+
+    def to_item(self, row, status=None):
+        """
+        【処理内容】
+        テーブルの行をキューの項目の辞書に変換する
+        【引数】
+        row：テーブルの行
+        status：状態(指定した場合は置き換える)
+        【戻り値】
+        item：キューの項目の辞書
+        """
+
+        item = dict(zip(COLUMNS, row))
+        item["payload"] = json.loads(item["payload"])
+        if not status is None:
+            item["status"] = status
+
+        return item
+
+
+    def complete(self, item_id, message_id):
+        """
+        【処理内容】
+        送信済みにする
+        【引数】
+        item_id：キューのID
+        message_id：メッセージID
+        【戻り値】
+        なし
+        """
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, message_id = ?, error = NULL, attempts = attempts + 1, updated = ?"
+                " WHERE id = ?",
+                (STATUS_SENT, message_id, time.time(), item_id),
+            )
+
+
+    def retry(self, item_id, error, delay):
+        """
+        【処理内容】
+        送信に失敗したメッセージを、待機後に再送するよう送信待ちに戻す
+        【引数】
+        item_id：キューのID
+        error：エラー内容
+        delay：再送までの待機秒数
+        【戻り値】
+        なし
+        """
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, error = ?, attempts = attempts + 1, next_attempt = ?, updated = ?"
+                " WHERE id = ?",
+                (STATUS_QUEUED, error, now + delay, now, item_id),
+            )
+
+
+    def dead(self, item_id, error):
+        """
+        【処理内容】
+        送信を諦めたメッセージをデッドレターにする
+        【引数】
+        item_id：キューのID
+        error：エラー内容
+        【戻り値】
+        なし
+        """
+
+        self._logger.warning("dead: " + str(item_id) + " " + str(error) + location())
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, error = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (STATUS_DEAD, error, time.time(), item_id),
+            )
+
+
+    def requeue(self, item_id=None):
+        """
+        【処理内容】
+        デッドレターを送信待ちに戻す(試行回数はリセットする)
+        【引数】
+        item_id：キューのID(Noneの場合はすべてのデッドレター)
+        【戻り値】
+        戻した件数
+        """
+
+        now = time.time()
+        query = "UPDATE outbox SET status = ?, attempts = 0, next_attempt = ?, updated = ? WHERE status = ?"
+        params = (STATUS_QUEUED, now, now, STATUS_DEAD)
+        if not item_id is None:
+            query += " AND id = ?"
+            params += (item_id,)
+
+        with self._lock, self._conn:
+            return self._conn.execute(query, params).rowcount
+
+
+    def recover(self):
+        """
+        【処理内容】
+        送信中のまま期限(lease)が切れたメッセージ(送信中に終了したプロセスのもの)を送信待ちに戻す
+        期限内のメッセージは他のプロセスが送信中の可能性があるため戻さない
+        再送は冪等キーで重複が防止される
+        【引数】
+        なし
+        【戻り値】
+        戻した件数
+        """
+
+        now = time.time()
+        with self._lock, self._conn:
+            count = self._conn.execute(
+                "UPDATE outbox SET status = ?, updated = ? WHERE status = ? AND updated < ?",
+                (STATUS_QUEUED, now, STATUS_SENDING, now - self._lease),
+            ).rowcount
+
+        if count:
+            self._logger.info("recovered: " + str(count) + location())
+
+        return count
+
+
+    def get(self, item_id):
+        """
+        【処理内容】
+        キューの項目を取得する
+        【引数】
+        item_id：キューのID
+        【戻り値】
+        item：キューの項目の辞書(ない場合はNone)
+        """
+
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(COLUMNS)} FROM outbox WHERE id = ?", (item_id,)).fetchone()
+
+        return None if row is None else self.to_item(row)
+
+
+    def get_items(self, status=None, count=100):
+        """
+        【処理内容】
+        キューの項目を取得する
+        【引数】
+        status：状態(Noneの場合はすべて)
+        count：取得数
+        【戻り値】
+        items：キューの項目の辞書のリスト(IDの昇順)
+        """
+
+        query = f"SELECT {', '.join(COLUMNS)} FROM outbox"
+        params = ()
+        if not status is None:
+            query += " WHERE status = ?"
+            params = (status,)
+
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id LIMIT ?", params + (count,)).fetchall()
+
+        return [self.to_item(row) for row in rows]
+
+
+    def count_by_status(self):
+        """
+        【処理内容】
+        状態ごとの件数を取得する
+        【引数】
+        なし
+        【戻り値】
+        状態をキー、件数を値とする辞書
+        """
+
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(rows)
+
+        return counts
+
+
+class OutboxWorkerClass:
+    """
+    【クラス内容】
+    送信待ちのメッセージを複数のスレッドで送信する
+    送信は冪等キー付き(GmailClass.send_message_idempotent)で行い、失敗した場合は間隔を空けて再送する
+    """
+
+    ##### 変数宣言 #####
+    _backoff = None
+    _gmail = None
+    _ledger = None
+    _logger = None
+    _max_attempts = None
+    _outbox = None
+    _poll_interval = None
+    _rate_limit = None
+    _stop = None
+    _threads = None
+    _workers = None
+
+
+    def __init__(self, gmail, outbox, ledger, workers=4, rate=None, max_attempts=5, backoff=30.0, poll_interval=1.0):
+        """
+        【処理内容】
+        送信ワーカーの初期設定を行う
+        【引数】
+        gmail：GmailClassのオブジェクト
+        outbox：キュー(OutboxClassのオブジェクト)
+        ledger：台帳(SendLedgerClassのオブジェクト)
+        workers：スレッド数
+        rate：1秒あたりの送信数の上限(Noneの場合は制限しない)
+        max_attempts：デッドレターにするまでの試行回数
+        backoff：再送までの待機秒数(試行ごとに2倍)
+        poll_interval：送信待ちがない場合の確認間隔(秒)
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._logger.debug("__init__ start" + location())
+
+        self._gmail = gmail
+        self._outbox = outbox
+        self._ledger = ledger
+        self._workers = workers
+        self._rate_limit = None if rate is None else RateLimitClass(rate)
+        self._max_attempts = max_attempts
+        self._backoff = backoff
+        self._poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+        self._logger.debug("__init__ end" + location())
+
+
+    def start(self, until_empty=False):
+        """
+        【処理内容】
+        送信を開始する
+        【引数】
+        until_empty：送信待ち・送信中がなくなったら終了する
+        【戻り値】
+        なし
+        """
+
+        self._logger.debug("start" + location())
+
+        self._outbox.recover()
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self.work, args=(until_empty,), name=f"outbox-{index}", daemon=True)
+            for index in range(self._workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+
+    def stop(self):
+        """
+        【処理内容】
+        送信を終了する(送信中のメッセージは送信を終えてから終了する)
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        self._stop.set()
+        self.join()
+
+
+    def join(self):
+        """
+        【処理内容】
+        すべてのスレッドの終了を待つ
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        for thread in self._threads:
+            thread.join()
+
+        self._logger.debug("stopped" + location())
+
+
+    def run(self):
+        """
+        【処理内容】
+        送信待ちがなくなるまで送信する
+        再送待ちのメッセージがある場合は、再送を終えるまで待機する
+        【引数】
+        なし
+        【戻り値】
+        状態ごとの件数の辞書
+        """
+
+        self.start(until_empty=True)
+        self.join()
+
+        return self._outbox.count_by_status()
+
+
+    def work(self, until_empty):
+        """
+        【処理内容】
+        1スレッド分の送信処理
+        【引数】
+        until_empty：送信待ち・送信中がなくなったら終了する
+        【戻り値】
+        なし
+        """
+
+        while not self._stop.is_set():
+            items = self._outbox.claim()
+
+            if not items:
+                # 送信中のまま終了したプロセスのメッセージを、期限が切れたら引き継ぐ
+                self._outbox.recover()
+                if until_empty:
+                    counts = self._outbox.count_by_status()
+                    if counts[STATUS_QUEUED] == 0 and counts[STATUS_SENDING] == 0:
+                        return
+                self._stop.wait(self._poll_interval)
+                continue
+
+            if not self._rate_limit is None:
+                self._rate_limit.acquire()
+
+            self.process(items[0])
+
+
+    def process(self, item):
+        """
+        【処理内容】
+        キューの項目を1件送信し、結果をキューに記録する
+        【引数】
+        item：キューの項目の辞書
+        【戻り値】
+        message_id：メッセージID(送信できなかった場合はNone)
+        """
+
+        self._logger.debug("process: " + str(item["id"]) + location())
+
+        try:
+            message_id = self._gmail.send_message_idempotent(
+                self._ledger, key=item["key"], retries=0, **item["payload"]
+            )
+            error = "send failed"
+        except ValueError as exception:
+            # 宛先が不正な場合は、再送しても送信できない
+            self._outbox.dead(item["id"], f"{type(exception).__name__}: {exception}")
+            return None
+        except Exception as exception:
+            message_id = None
+            error = f"{type(exception).__name__}: {exception}"
+
+        if not message_id is None:
+            self._outbox.complete(item["id"], message_id)
+            return message_id
+
+        # 台帳に記録が残っていない場合は、送信されていないことが確定した失敗(4xxなど)のため再送しない
+        if self._ledger.get(item["key"]) is None and error == "send failed":
+            self._outbox.dead(item["id"], "rejected")
+        elif item["attempts"] + 1 >= self._max_attempts:
+            self._outbox.dead(item["id"], error)
+        else:
+            delay = self._backoff * 2 ** item["attempts"]
+            self._logger.warning(f"retry {item['id']} in {delay}s: {error}" + location())
+            self._outbox.retry(item["id"], error, delay)
+
+        return None
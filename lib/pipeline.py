@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+@name           pipeline.py
+@author         yoshi0518
+@description    メッセージの取得と解析を並列に行うパイプラインのモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import base64
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import email
+from email import policy
+import json
+import logging
+import os
+
+from .gmail import location, parse_message
+
+
+##### 定数宣言 #####
+FORMATS = ("full", "raw") # 取得形式
+
+
+def parse_raw_message(message_detail):
+    """
+    【処理内容】
+    format=rawで取得したメッセージを、parse_messageと同じ形式の辞書に変換する
+    【引数】
+    message_detail：messages().get(format=raw)の結果
+    【戻り値】
+    message：メッセージの辞書
+    """
+
+    mime = email.message_from_bytes(base64.urlsafe_b64decode(message_detail["raw"]), policy=policy.default)
+
+    message = {}
+    message["id"] = message_detail["id"]
+    message["thread_id"] = message_detail["threadId"]
+    message["label_ids"] = message_detail.get("labelIds", [])
+    if "internalDate" in message_detail:
+        message["internal_date"] = int(message_detail["internalDate"])
+    message["size"] = message_detail.get("sizeEstimate", 0)
+
+    for name, value in mime.items():
+        message[name.lower()] = str(value)
+
+    part = mime.get_body(preferencelist=("plain",))
+    if not part is None:
+        try:
+            message["body"] = part.get_content()
+        except (KeyError, LookupError):
+            pass
+
+    return message
+
+
+def parse_content(content, fmt="full"):
+    """
+    【処理内容】
+    JSONのまま取得したメッセージを解析する
+    プロセスプールで実行する
+    【引数】
+    content：レスポンスのJSON(バイト列)
+    fmt：取得形式(full、raw)
+    【戻り値】
+    message：メッセージの辞書
+    """
+
+    message_detail = json.loads(content)
+
+    if fmt == "raw":
+        return parse_raw_message(message_detail)
+
+    return parse_message(message_detail)
+
+
+class PipelineClass:
+    """
+    【クラス内容】
+    メッセージの取得(I/O)をスレッド、JSONの解析とbase64url・MIMEのデコードをプロセスで並列に行う
+    各段の処理中の件数には上限があり、取り出した順に解析結果を返す
+    プロセスを起動するため、スクリプトから利用する場合は if __name__ == "__main__": の中で実行する
+    """
+
+    ##### 変数宣言 #####
+    _gmail = None
+    _io_workers = None
+    _logger = None
+    _processes = None
+    _queue_size = None
+
+
+    def __init__(self, gmail, io_workers=8, processes=None, queue_size=None):
+        """
+        【処理内容】
+        パイプラインの初期設定を行う
+        【引数】
+        gmail：GmailClassのオブジェクト
+        io_workers：取得を行うスレッド数
+        processes：解析を行うプロセス数(Noneの場合はCPUコア数)
+        queue_size：解析中のメッセージ数の上限(Noneの場合はプロセス数の4倍)
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._logger.debug("__init__ start" + location())
+
+        self._gmail = gmail
+        self._io_workers = io_workers
+        self._processes = processes or os.cpu_count() or 1
+        self._queue_size = queue_size or self._processes * 4
+
+        self._logger.debug("__init__ end" + location())
+
+
+    def get_messages(self, message_ids, fmt="full"):
+        """
+        【処理内容】
+        メッセージを並列に取得・解析する
+        【引数】
+        message_ids：メッセージIDのイテラブル
+        fmt：取得形式(full、raw)
+        【戻り値】
+        メッセージの辞書のジェネレータ(GmailClass.get_messagesと同じ形式)
+        取得・解析に失敗したメッセージは返さない
+        """
+
+        self._logger.debug("get_messages start" + location())
+
+        if not fmt in FORMATS:
+            raise ValueError(f"unsupported format: {fmt}")
+
+        fetch = lambda message_id: self._gmail.get_message_content(message_id, fmt=fmt)
+
+        def pop():
+            # 1件の解析の失敗(文字コードの不正など)で全体が止まらないよう、メッセージごとに扱う
+            message_id, future = pending.popleft()
+            try:
+                return future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as error:
+                self._logger.warning(f"failed to parse message: {message_id} {error!r}" + location())
+                return None
+
+        with ProcessPoolExecutor(max_workers=self._processes) as executor:
+            pending = deque()
+
+            for message_id, content in self._gmail.execute_concurrent(fetch, message_ids, self._io_workers):
+                if content is None:
+                    self._logger.warning("failed to get message: " + message_id + location())
+                    continue
+
+                pending.append((message_id, executor.submit(parse_content, content, fmt)))
+
+                # 解析中の件数が上限に達したら、取得済みの順に取り出す
+                while len(pending) >= self._queue_size or (pending and pending[0][1].done()):
+                    message = pop()
+                    if not message is None:
+                        yield message
+
+            while pending:
+                message = pop()
+                if not message is None:
+                    yield message
+
+        self._logger.debug("get_messages end" + location())
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+@name           profiler.py
+@author         yoshi0518
+@description    処理時間の計測(フェーズごとの時間、cProfile、tracemalloc)に関する処理のモジュール
+                gmail_cli.pyのクライアントからも使うため、標準ライブラリのみ読み込む
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+from contextlib import contextmanager
+import cProfile
+import datetime
+import json
+import logging
+import platform
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+from .util import location
+
+
+##### 定数宣言 #####
+REPORT_VERSION = 1 # レポートの形式のバージョン
+TOP_FUNCTIONS = 30 # レポートに含める関数の数(cProfile)
+TOP_ALLOCATIONS = 20 # レポートに含めるメモリ確保の箇所の数(tracemalloc)
+
+_active = None # 計測中のProfilerClassのオブジェクト
+_local = threading.local() # スレッドごとのフェーズの入れ子の深さ
+
+
+@contextmanager
+def phase(name):
+    """
+    【処理内容】
+    計測中であれば、withブロックの処理時間をフェーズとして記録する
+    計測中でなければ何もしない
+    【引数】
+    name：フェーズ名(auth、build、mime、base64、networkなど)
+    【戻り値】
+    なし
+    """
+
+    profiler = _active
+    if profiler is None:
+        yield
+        return
+
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        profiler.record(name, time.perf_counter() - start, depth == 0 and threading.current_thread() is profiler.thread)
+
+
+@contextmanager
+def profile(name="profile", path=None, cprofile=False, memory=False):
+    """
+    【処理内容】
+    withブロックの処理時間を計測し、レポートを作成する
+    with profile("send", path="report.json") as profiler:
+        gmail.send_message(...)
+    【引数】
+    name：レポートの名前
+    path：レポートの保存先(JSON、Noneの場合は保存しない)
+    cprofile：cProfileで関数ごとの時間を記録する
+    memory：tracemallocでメモリ確保を記録する
+    【戻り値】
+    ProfilerClassのオブジェクト(withブロックの終了後にreportでレポートを取得できる)
+    """
+
+    profiler = ProfilerClass(name, cprofile=cprofile, memory=memory)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        if not path is None:
+            profiler.save(path)
+
+
+class ProfilerClass:
+    """
+    【クラス内容】
+    フェーズごとの処理時間と、任意でcProfile・tracemallocの結果を記録する
+    同時に計測できるのは1つのみ(ワーカースレッドのフェーズも記録する)
+    """
+
+    ##### 変数宣言 #####
+    name = None
+    report = None
+    thread = None
+    _accounted = None
+    _cprofile = None
+    _lock = None
+    _logger = None
+    _memory = None
+    _phases = None
+    _profile = None
+    _started = None
+    _start_time = None
+
+
+    def __init__(self, name="profile", cprofile=False, memory=False):
+        """
+        【処理内容】
+        計測の初期設定を行う
+        【引数】
+        name：レポートの名前
+        cprofile：cProfileで関数ごとの時間を記録する
+        memory：tracemallocでメモリ確保を記録する
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self.name = name
+        self._cprofile = cprofile
+        self._memory = memory
+        self._phases = {}
+        self._accounted = 0.0
+        self._lock = threading.Lock()
+
+
+    def start(self):
+        """
+        【処理内容】
+        計測を開始する
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        global _active
+
+        if not _active is None:
+            raise RuntimeError("another profiler is running")
+
+        self._logger.debug("start: " + self.name + location())
+
+        self.thread = threading.current_thread()
+        self._started = datetime.datetime.now().astimezone().isoformat(timespec="seconds")
+
+        if self._memory:
+            tracemalloc.start()
+        if self._cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+        _active = self
+        self._start_time = time.perf_counter()
+
+
+    def stop(self):
+        """
+        【処理内容】
+        計測を終了し、レポートを作成する
+        【引数】
+        なし
+        【戻り値】
+        report：レポートの辞書
+        """
+
+        global _active
+
+        wall = time.perf_counter() - self._start_time
+        _active = None
+
+        if not self._profile is None:
+            self._profile.disable()
+
+        self.report = {
+            "version": REPORT_VERSION,
+            "name": self.name,
+            "started": self._started,
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "wall": wall,
+            "phases": {name: dict(values) for name, values in sorted(self._phases.items())},
+            # 計測したスレッドで、どのフェーズにも含まれない時間
+            "unaccounted": max(0.0, wall - self._accounted),
+        }
+
+        if not self._profile is None:
+            self.report["functions"] = self.get_functions()
+
+        if self._memory:
+            self.report["memory"] = self.get_memory()
+            tracemalloc.stop()
+
+        self._logger.debug("stop: " + self.name + location())
+
+        return self.report
+
+
+    def record(self, name, seconds, top_level):
+        """
+        【処理内容】
+        フェーズの処理時間を記録する
+        【引数】
+        name：フェーズ名
+        seconds：処理時間(秒)
+        top_level：計測したスレッドの最も外側のフェーズ(unaccountedの計算に使う)
+        【戻り値】
+        なし
+        """
+
+        with self._lock:
+            values = self._phases.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            values["count"] += 1
+            values["total"] += seconds
+            values["max"] = max(values["max"], seconds)
+            if top_level:
+                self._accounted += seconds
+
+
+    def get_functions(self):
+        """
+        【処理内容】
+        cProfileの結果から累積時間の長い関数を取得する
+        【引数】
+        なし
+        【戻り値】
+        関数ごとの辞書(function、calls、tottime、cumtime)のリスト
+        """
+
+        stats = pstats.Stats(self._profile)
+        functions = []
+        for (file, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            functions.append({
+                "function": f"{file}:{line}({function})",
+                "calls": calls,
+                "tottime": tottime,
+                "cumtime": cumtime,
+            })
+
+        functions.sort(key=lambda values: values["cumtime"], reverse=True)
+
+        return functions[:TOP_FUNCTIONS]
+
+
+    def get_memory(self):
+        """
+        【処理内容】
+        tracemallocの結果からメモリ確保の多い箇所を取得する
+        【引数】
+        なし
+        【戻り値】
+        メモリの辞書(current、peak、top)
+        """
+
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
+
+        return {
+            "current": current,
+            "peak": peak,
+            "top": [
+                {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "size": stat.size, "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+            ],
+        }
+
+
+    def save(self, path):
+        """
+        【処理内容】
+        レポートをJSONで保存する
+        【引数】
+        path：保存先
+        【戻り値】
+        なし
+        """
+
+        with open(path, "w", encoding="utf-8") as fp:
+            json.dump(self.report, fp, ensure_ascii=False, indent=2)
+
+        self._logger.info("profile: " + path + location())
+
+
+def load_report(path):
+    """
+    【処理内容】
+    保存したレポートを読み込む
+    【引数】
+    path：レポートのファイル
+    【戻り値】
+    report：レポートの辞書
+    """
+
+    with open(path, "r", encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def compare_reports(base, current):
+    """
+    【処理内容】
+    2つのレポートのフェーズごとの処理時間を比較する
+    【引数】
+    base：比較元のレポート
+    current：比較先のレポート
+    【戻り値】
+    (フェーズ名, 比較元の時間, 比較先の時間, 差, 比率)のリスト(wall、unaccountedを含む)
+    比率は比較元が0の場合None
+    """
+
+    rows = []
+    names = sorted(set(base["phases"]) | set(current["phases"]))
+    values = [(name, base["phases"].get(name, {}).get("total", 0.0), current["phases"].get(name, {}).get("total", 0.0)) for name in names]
+    values += [(key, base[key], current[key]) for key in ("unaccounted", "wall")]
+
+    for name, base_seconds, current_seconds in values:
+        ratio = current_seconds / base_seconds if base_seconds else None
+        rows.append((name, base_seconds, current_seconds, current_seconds - base_seconds, ratio))
+
+    return rows
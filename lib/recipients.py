@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+@name           recipients.py
+@author         yoshi0518
+@description    宛先(To、Cc、Bcc)の解析・正規化・重複除去・検証とドメインごとの振り分けに関する処理のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+from email.utils import formataddr, getaddresses
+import logging
+import re
+
+from .util import location
+
+
+##### 定数宣言 #####
+FIELDS = ("to", "cc", "bcc") # 宛先の項目(重複した場合は前の項目を優先する)
+ADDRESS_PATTERN = re.compile( # メールアドレスの書式(ドメインはIDNA変換後に判定する)
+    r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+    r"@([A-Za-z0-9]([A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z0-9-]{2,63}"
+)
+COMMENT_PATTERN = re.compile(r"\([^()]*\)") # アドレスのみの形式のコメント(j@example.com (John))
+MAX_LOCAL_LENGTH = 64 # ローカル部の最大長
+MAX_ADDRESS_LENGTH = 254 # メールアドレスの最大長
+
+
+def normalize_address(address):
+    """
+    【処理内容】
+    メールアドレスを正規化する
+    前後の空白を除き、ドメインを小文字にしてIDNA(xn--)に変換する(ローカル部はそのまま)
+    【引数】
+    address：メールアドレス
+    【戻り値】
+    正規化したメールアドレス(ドメインを変換できない場合はそのまま)
+    """
+
+    address = address.strip()
+    local, at, domain = address.rpartition("@")
+    if not at:
+        return address
+
+    try:
+        domain = domain.lower().encode("idna").decode("ascii")
+    except UnicodeError:
+        return address
+
+    return local + "@" + domain
+
+
+def is_valid_address(address):
+    """
+    【処理内容】
+    メールアドレスの書式を検証する(正規化したもの)
+    引用符付きのローカル部・IPアドレスのドメインは受け付けない
+    【引数】
+    address：メールアドレス
+    【戻り値】
+    正しい書式の場合はTrue
+    """
+
+    return (
+        len(address) <= MAX_ADDRESS_LENGTH
+        and address.find("@") <= MAX_LOCAL_LENGTH
+        and not ADDRESS_PATTERN.fullmatch(address) is None
+    )
+
+
+def split_addresses(value):
+    """
+    【処理内容】
+    カンマ区切りの宛先を1件ずつに分ける
+    引用符("Doe, John")・山括弧・コメント((...))内のカンマでは分けない
+    【引数】
+    value：カンマ区切りの宛先
+    【戻り値】
+    宛先の文字列のリスト(前後の空白を除き、空のものは除く)
+    """
+
+    tokens, token = [], []
+    quoted, escaped, angle, comment = False, False, 0, 0
+    for char in value:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif quoted:
+            quoted = char != '"'
+        elif char == '"':
+            quoted = True
+        elif char == "(":
+            comment += 1
+        elif char == ")" and comment:
+            comment -= 1
+        elif char == "<" and not comment:
+            angle += 1
+        elif char == ">" and angle and not comment:
+            angle -= 1
+        elif char == "," and not angle and not comment:
+            tokens.append("".join(token))
+            token = []
+            continue
+        token.append(char)
+    tokens.append("".join(token))
+
+    return [token.strip() for token in tokens if token.strip()]
+
+
+def parse_address(token):
+    """
+    【処理内容】
+    1件分の宛先を(名前, メールアドレス)に解析する
+    1件のアドレスとして解析できない場合(アドレスの後に余分な文字がある、@が2つあるなど)はNoneを返す
+    【引数】
+    token：1件分の宛先(split_addressesの結果)
+    【戻り値】
+    (名前, 正規化したメールアドレス)(解析できない・書式が不正な場合はNone)
+    """
+
+    parsed = getaddresses([token])
+    if len(parsed) != 1 or not parsed[0][1]:
+        return None
+
+    name, address = parsed[0]
+    if "<" in token:
+        # "名前 <アドレス>" の形式は、山括弧の後に文字があってはならない
+        if not token.endswith(">"):
+            return None
+    elif COMMENT_PATTERN.sub("", token).strip() != address:
+        # アドレスのみの形式は、コメント以外に空白などを含んではならない
+        return None
+
+    address = normalize_address(address)
+    if not is_valid_address(address):
+        return None
+
+    return name, address
+
+
+def get_domain(address):
+    """
+    【処理内容】
+    メールアドレスのドメインを取得する
+    【引数】
+    address：メールアドレス
+    【戻り値】
+    ドメイン
+    """
+
+    return address[address.rfind("@") + 1:]
+
+
+def group_by_domain(addresses):
+    """
+    【処理内容】
+    メールアドレスをドメインごとにまとめる
+    【引数】
+    addresses：正規化したメールアドレスのイテラブル
+    【戻り値】
+    ドメインをキー、メールアドレスのリストを値とする辞書(最初に現れた順)
+    """
+
+    groups = {}
+    for address in addresses:
+        groups.setdefault(get_domain(address), []).append(address)
+
+    return groups
+
+
+def interleave_domains(groups):
+    """
+    【処理内容】
+    ドメインごとのメールアドレスを1件ずつ順番に取り出す(ラウンドロビン)
+    同じドメインへの送信が続かないようにし、受信側のサーバーによる制限を避ける
+    【引数】
+    groups：group_by_domainの結果
+    【戻り値】
+    (何巡目か, メールアドレス)のジェネレータ
+    """
+
+    queues = [iter(addresses) for addresses in groups.values()]
+    rounds = 0
+    while queues:
+        remaining = []
+        for queue in queues:
+            address = next(queue, None)
+            if not address is None:
+                yield rounds, address
+                remaining.append(queue)
+        queues = remaining
+        rounds += 1
+
+
+class RecipientListClass:
+    """
+    【クラス内容】
+    To、Cc、Bccの宛先をまとめて解析・正規化し、重複を除いて検証する
+    宛先は1件ずつ解析し、1件のアドレスとして解析できないものはそのままinvalidに記録する
+    同じアドレスが複数の項目にある場合はTo、Cc、Bccの順に優先し、後の項目から除く
+    (アドレスは大文字小文字を区別せずに比較する)
+    """
+
+    ##### 変数宣言 #####
+    duplicates = None
+    invalid = None
+    recipients = None
+    _logger = None
+
+
+    def __init__(self, to=None, cc=None, bcc=None):
+        """
+        【処理内容】
+        宛先を解析する
+        【引数】
+        to：宛先(カンマ区切りの文字列またはそのリスト)
+        cc：カーボンコピー(同上)
+        bcc：ブラインドカーボンコピー(同上)
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self.recipients = {field: [] for field in FIELDS}
+        self.invalid = []
+        self.duplicates = 0
+
+        seen = set()
+        for field, values in zip(FIELDS, (to, cc, bcc)):
+            if not values:
+                continue
+            if isinstance(values, str):
+                values = [values]
+
+            for value in values:
+                for token in split_addresses(value):
+                    parsed = parse_address(token)
+                    if parsed is None:
+                        self.invalid.append((field, token))
+                        continue
+
+                    name, address = parsed
+                    key = address.lower()
+                    if key in seen:
+                        self.duplicates += 1
+                        continue
+                    seen.add(key)
+
+                    self.recipients[field].append((name, address))
+
+        if self.invalid or self.duplicates:
+            self._logger.debug(
+                "invalid: " + str(self.invalid) + " duplicates: " + str(self.duplicates) + location()
+            )
+
+
+    def __len__(self):
+        return sum(len(recipients) for recipients in self.recipients.values())
+
+
+    def get_addresses(self, field=None):
+        """
+        【処理内容】
+        正規化したメールアドレスを取得する
+        【引数】
+        field：項目(to、cc、bcc、Noneの場合はすべてをこの順で)
+        【戻り値】
+        メールアドレスのリスト
+        """
+
+        fields = FIELDS if field is None else (field,)
+
+        return [address for field in fields for _, address in self.recipients[field]]
+
+
+    def get_header(self, field):
+        """
+        【処理内容】
+        項目のヘッダーの値を作成する(名前付きのアドレスは "名前 <アドレス>")
+        【引数】
+        field：項目(to、cc、bcc)
+        【戻り値】
+        カンマ区切りの文字列(宛先がない場合はNone)
+        """
+
+        if not self.recipients[field]:
+            return None
+
+        return ", ".join(formataddr(recipient) for recipient in self.recipients[field])
+
+
+    def group_by_domain(self):
+        """
+        【処理内容】
+        メールアドレスをドメインごとにまとめる
+        【引数】
+        なし
+        【戻り値】
+        ドメインをキー、メールアドレスのリストを値とする辞書(最初に現れた順)
+        """
+
+        return group_by_domain(self.get_addresses())
@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""
+@name           rules.py
+@author         yoshi0518
+@description    ルールに従ってメッセージのラベルを変更する処理(フィルター)のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+from email.utils import getaddresses
+import json
+import logging
+import re
+
+from .gmail import location
+from .sweep import SweepClass
+
+
+##### 定数宣言 #####
+ADDRESS_FIELDS = ("from", "to", "cc") # アドレス(完全一致、@ドメイン)で判定する項目
+TEXT_FIELDS = ("subject", "body") # キーワード(部分一致、大文字小文字を区別しない)で判定する項目
+REGEX_SUFFIX = "_regex" # 正規表現で判定する項目の接尾辞(subject_regex、body_regexなど)
+LABELS_FIELD = "labels" # ラベルで判定する項目
+ACTIONS = ("add_labels", "remove_labels", "mark_read", "archive") # 実行できる処理
+
+
+def is_supported_field(field):
+    """
+    【処理内容】
+    matchの項目が判定できるものか確認する
+    【引数】
+    field：項目
+    【戻り値】
+    判定できる項目の場合はTrue
+    """
+
+    return field in ADDRESS_FIELDS or field in TEXT_FIELDS or field == LABELS_FIELD or field.endswith(REGEX_SUFFIX)
+
+
+def validate_rules(rules):
+    """
+    【処理内容】
+    ルールを検証する
+    matchが空のルール・値が空の項目は一致することがないため受け付けない
+    【引数】
+    rules：ルールの辞書のリスト
+    【戻り値】
+    なし(不正なルールがある場合はValueError)
+    """
+
+    for rule in rules:
+        name = rule.get("name")
+
+        match = rule.get("match")
+        if not match or not isinstance(match, dict):
+            raise ValueError(f"empty match: {name}")
+        for field, values in match.items():
+            if not is_supported_field(field):
+                raise ValueError(f"unsupported field: {field} ({name})")
+            if not values:
+                raise ValueError(f"empty match values: {field} ({name})")
+
+        for action in rule.get("actions", {}):
+            if not action in ACTIONS:
+                raise ValueError(f"unsupported action: {action} ({name})")
+
+
+def load_rules(path):
+    """
+    【処理内容】
+    ルールをJSONファイルから読み込み、検証する
+    【引数】
+    path：ルールのファイル
+    【戻り値】
+    rules：ルールの辞書のリスト(不正なルールがある場合はValueError)
+    """
+
+    with open(path, "r", encoding="utf-8") as fp:
+        rules = json.load(fp)
+
+    validate_rules(rules)
+
+    return rules
+
+
+class KeywordMatcherClass:
+    """
+    【クラス内容】
+    複数のキーワードを1つの正規表現にまとめ、本文を1回走査して含まれるキーワードをすべて求める
+    各位置で先読みして最も長いキーワードを見つけ、それに含まれる短いキーワードも一致したとみなす
+    """
+
+    ##### 変数宣言 #####
+    _contained = None
+    _pattern = None
+
+
+    def __init__(self, keywords):
+        """
+        【処理内容】
+        キーワードから正規表現を作成する
+        【引数】
+        keywords：キーワードのイテラブル
+        【戻り値】
+        なし
+        """
+
+        keywords = sorted({keyword.lower() for keyword in keywords if keyword}, key=len, reverse=True)
+
+        self._contained = {}
+        self._pattern = None
+        if keywords:
+            self._pattern = re.compile("(?=(" + "|".join(re.escape(keyword) for keyword in keywords) + "))")
+
+        # キーワードごとに、それ自身に含まれるキーワードを短い順に求めておく
+        # (先頭・末尾の1文字を除いた文字列に含まれるキーワードと、それ自身)
+        for keyword in reversed(keywords):
+            self._contained[keyword] = {keyword} | self.find(keyword[:-1]) | self.find(keyword[1:])
+
+
+    def find(self, text):
+        """
+        【処理内容】
+        本文に含まれるキーワードを求める
+        【引数】
+        text：本文
+        【戻り値】
+        含まれるキーワードのセット
+        """
+
+        found = set()
+        if self._pattern is None or not text:
+            return found
+
+        for match in self._pattern.finditer(text.lower()):
+            keyword = match.group(1)
+            if not keyword in found:
+                found |= self._contained[keyword]
+
+        return found
+
+
+class RuleEngineClass:
+    """
+    【クラス内容】
+    ルールをまとめて1つの判定器にし、メッセージごとに1回ですべてのルールを判定する
+    アドレス・ラベルは辞書で引き、キーワードは項目ごとに1回の走査で判定する
+    正規表現は他の条件をすべて満たしたルールのみ判定する
+
+    ルールの例
+    {
+        "name": "invoice",
+        "match": {
+            "from": ["billing@example.com", "@example.net"],
+            "subject": ["invoice", "請求書"],
+            "labels": ["INBOX"],
+            "body_regex": ["No\\. ?\\d{6}"]
+        },
+        "actions": {"add_labels": ["Invoice"], "archive": true},
+        "stop": false
+    }
+    matchの項目はすべて満たす必要があり(AND)、項目内の値はいずれかを満たせばよい(OR)
+    matchが空のルールは受け付けない
+    stopがtrueのルールに一致した場合、以降のルールは判定しない
+    """
+
+    ##### 変数宣言 #####
+    rules = None
+    _address_index = None
+    _keyword_index = None
+    _keyword_matchers = None
+    _label_index = None
+    _label_map = None
+    _logger = None
+    _regex_only = None
+    _regexes = None
+    _required = None
+
+
+    def __init__(self, rules, label_map=None):
+        """
+        【処理内容】
+        ルールを判定器に変換する
+        【引数】
+        rules：ルールの辞書のリスト(記述した順に判定する)
+        label_map：ラベル名とラベルIDの辞書(ルールのラベル名をラベルIDに変換する)
+        【戻り値】
+        なし(不正なルールがある場合はValueError)
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._logger.debug("__init__ start" + location())
+
+        validate_rules(rules)
+
+        self.rules = rules
+        self._label_map = label_map or {}
+        self._address_index = {field: {} for field in ADDRESS_FIELDS}
+        self._keyword_index = {field: {} for field in TEXT_FIELDS}
+        self._label_index = {}
+        self._regexes = []
+        self._required = []
+        keywords = {field: set() for field in TEXT_FIELDS}
+
+        for rule_index, rule in enumerate(rules):
+            # 条件(項目)ごとに番号を振り、満たした条件の数で判定する
+            required = set()
+            regexes = []
+            for field, values in rule["match"].items():
+                if isinstance(values, str):
+                    values = [values]
+                condition = (rule_index, field)
+
+                if field in ADDRESS_FIELDS:
+                    for value in values:
+                        self._address_index[field].setdefault(value.lower(), set()).add(condition)
+                elif field in TEXT_FIELDS:
+                    for value in values:
+                        self._keyword_index[field].setdefault(value.lower(), set()).add(condition)
+                        keywords[field].add(value)
+                elif field == LABELS_FIELD:
+                    for value in values:
+                        self._label_index.setdefault(self._label_map.get(value, value), set()).add(condition)
+                else:
+                    regexes.append((field[:-len(REGEX_SUFFIX)], [re.compile(value, re.IGNORECASE) for value in values]))
+                    continue
+
+                required.add(condition)
+
+            self._required.append(required)
+            self._regexes.append(regexes)
+
+        self._keyword_matchers = {field: KeywordMatcherClass(keywords[field]) for field in TEXT_FIELDS}
+
+        # 正規表現の条件のみのルールは、常に判定の候補にする
+        self._regex_only = {
+            rule_index for rule_index in range(len(rules)) if not self._required[rule_index] and self._regexes[rule_index]
+        }
+
+        self._logger.debug("rules: " + str(len(rules)) + location())
+
+        self._logger.debug("__init__ end" + location())
+
+
+    @property
+    def needs_body(self):
+        """
+        【処理内容】
+        本文を判定するルールがあるか確認する
+        (ない場合はformat=metadataで取得すればよい)
+        【引数】
+        なし
+        【戻り値】
+        本文を判定するルールがある場合はTrue
+        """
+
+        return bool(self._keyword_index["body"]) or any(
+            field == "body" for regexes in self._regexes for field, _ in regexes
+        )
+
+
+    def match(self, message):
+        """
+        【処理内容】
+        メッセージに一致するルールを求める
+        【引数】
+        message：メッセージの辞書(parse_messageの結果など)
+        【戻り値】
+        一致したルールの辞書のリスト(ルールの順)
+        """
+
+        satisfied = set()
+
+        for field in ADDRESS_FIELDS:
+            index = self._address_index[field]
+            if not index or not message.get(field):
+                continue
+            for _, address in getaddresses([message[field]]):
+                address = address.lower()
+                satisfied |= index.get(address, set())
+                satisfied |= index.get(address[address.find("@"):], set()) if "@" in address else set()
+
+        for field in TEXT_FIELDS:
+            index = self._keyword_index[field]
+            if index:
+                for keyword in self._keyword_matchers[field].find(message.get(field)):
+                    satisfied |= index[keyword]
+
+        for label_id in message.get("label_ids", []):
+            satisfied |= self._label_index.get(label_id, set())
+
+        # 満たした条件があるルールのみ判定する
+        candidates = {rule_index for rule_index, _ in satisfied} | self._regex_only
+
+        matched = []
+        for rule_index in sorted(candidates):
+            if not self._required[rule_index] <= satisfied:
+                continue
+            if not all(
+                any(regex.search(message.get(field) or "") for regex in regexes)
+                for field, regexes in self._regexes[rule_index]
+            ):
+                continue
+
+            rule = self.rules[rule_index]
+            matched.append(rule)
+            if rule.get("stop"):
+                break
+
+        return matched
+
+
+    def get_changes(self, rules):
+        """
+        【処理内容】
+        一致したルールの処理をラベルの追加・削除にまとめる
+        同じラベルを追加・削除する場合は追加を優先する
+        【引数】
+        rules：一致したルールの辞書のリスト
+        【戻り値】
+        (追加するラベルIDのfrozenset, 削除するラベルIDのfrozenset)
+        """
+
+        add_label_ids, remove_label_ids = set(), set()
+        for rule in rules:
+            actions = rule.get("actions", {})
+            add_label_ids.update(self._label_map.get(label, label) for label in actions.get("add_labels", []))
+            remove_label_ids.update(self._label_map.get(label, label) for label in actions.get("remove_labels", []))
+            if actions.get("mark_read"):
+                remove_label_ids.add("UNREAD")
+            if actions.get("archive"):
+                remove_label_ids.add("INBOX")
+
+        return frozenset(add_label_ids), frozenset(remove_label_ids - add_label_ids)
+
+
+    def plan(self, messages):
+        """
+        【処理内容】
+        メッセージごとにルールを判定し、同じ変更をまとめる
+        変更後のラベルが変わらないメッセージは除く
+        【引数】
+        messages：メッセージの辞書のイテラブル
+        【戻り値】
+        plan：(追加するラベルIDのfrozenset, 削除するラベルIDのfrozenset)をキー、メッセージIDのリストを値とする辞書
+        matched：ルール名をキー、一致したメッセージ数を値とする辞書
+        sources：planと同じキーで、その変更のもとになったルール名のセットを値とする辞書
+        """
+
+        plan, matched, sources = {}, {}, {}
+        for message in messages:
+            rules = self.match(message)
+            if not rules:
+                continue
+
+            for rule in rules:
+                matched[rule.get("name")] = matched.get(rule.get("name"), 0) + 1
+
+            add_label_ids, remove_label_ids = self.get_changes(rules)
+            label_ids = set(message.get("label_ids", []))
+            add_label_ids = frozenset(add_label_ids - label_ids)
+            remove_label_ids = frozenset(remove_label_ids & label_ids)
+            if add_label_ids or remove_label_ids:
+                changes = (add_label_ids, remove_label_ids)
+                plan.setdefault(changes, []).append(message["id"])
+                sources.setdefault(changes, set()).update(rule.get("name") for rule in rules)
+
+        return plan, matched, sources
+
+
+    def apply(self, gmail, plan, sources=None):
+        """
+        【処理内容】
+        まとめた変更をbatchModifyで実行する
+        変更に失敗した場合は残りの変更を続け、失敗したルールとメッセージ数を記録する
+        【引数】
+        gmail：GmailClassのオブジェクト
+        plan：planの結果
+        sources：planの結果(変更のもとになったルール名)
+        【戻り値】
+        count：変更したメッセージ数
+        failed：ルール名をキー、変更に失敗したメッセージ数を値とする辞書
+        """
+
+        sources = sources or {}
+
+        count, failed = 0, {}
+        for changes, message_ids in plan.items():
+            add_label_ids, remove_label_ids = changes
+            self._logger.debug(
+                f"modify: {len(message_ids)} add: {sorted(add_label_ids)} remove: {sorted(remove_label_ids)}" + location()
+            )
+            modified = gmail.modify_labels(message_ids, add_label_ids, remove_label_ids)
+            if modified is None:
+                names = sorted(sources.get(changes, {None}), key=str)
+                self._logger.error(f"modify failed: {len(message_ids)} rules: {names}" + location())
+                for name in names:
+                    failed[name] = failed.get(name, 0) + len(message_ids)
+                continue
+
+            count += modified
+
+        return count, failed
+
+
+    def run(self, gmail, query=None, label_id=None, dry_run=False, sweep=None):
+        """
+        【処理内容】
+        検索クエリ・ラベルに一致するメッセージを取得し、ルールを判定して処理を実行する(1サイクル)
+        本文を判定するルールがなければヘッダーのみ(format=metadata)を取得する
+        【引数】
+        gmail：GmailClassのオブジェクト
+        query：検索クエリ(newer_than:1dなど)
+        label_id：ラベルID
+        dry_run：処理を実行しない
+        sweep：取得に使うSweepClassのオブジェクト(Noneの場合は作成する)
+        【戻り値】
+        結果の辞書(messages、matched、modified、failed、plan)
+        """
+
+        self._logger.debug("run start" + location())
+
+        if sweep is None:
+            sweep = SweepClass(gmail, fmt="full" if self.needs_body else "metadata")
+
+        count = 0
+
+        def messages():
+            nonlocal count
+            for message in sweep.sweep(query=query, label_id=label_id):
+                count += 1
+                yield message
+
+        plan, matched, sources = self.plan(messages())
+        modified, failed = (0, {}) if dry_run else self.apply(gmail, plan, sources)
+
+        self._logger.debug("run end" + location())
+
+        return {"messages": count, "matched": matched, "modified": modified, "failed": failed, "plan": plan}
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+"""
+@name           search.py
+@author         yoshi0518
+@description    取得したメッセージのローカル全文検索に関する処理のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import base64
+import datetime
+import email
+from email import policy
+from email.utils import parsedate_to_datetime
+import logging
+import re
+import shlex
+import sqlite3
+
+from .gmail import location
+
+
+##### 定数宣言 #####
+FTS_COLUMNS = { # 全文検索の対象カラムとメッセージのキー
+    "subject": "subject",
+    "sender": "from",
+    "recipient": "to",
+    "cc": "cc",
+    "body": "body",
+}
+OPERATORS = { # ローカルで評価できる検索演算子と全文検索のカラム
+    "from": "sender",
+    "to": "recipient",
+    "cc": "cc",
+    "subject": "subject",
+    "label": None,
+    "after": None,
+    "before": None,
+}
+DATE_PATTERN = re.compile(r"^(\d{4})[/-](\d{1,2})[/-](\d{1,2})$") # after/beforeの日付
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff66-\uff9f\uac00-\ud7af]") # 日本語・中国語・韓国語の文字
+TRIGRAM_LENGTH = 3 # trigramで検索できる最短の文字数(短い検索語はLIKEで検索する)
+GMAIL_TIMEZONE = datetime.timezone(datetime.timedelta(hours=-8), "PST") # Gmail APIがafter/beforeの日付を解釈するタイムゾーン
+
+
+def parse_date(value):
+    """
+    【処理内容】
+    after/beforeに指定された日付をUNIX時間に変換する
+    Gmail APIと同じ結果になるよう、日付は実行環境のタイムゾーンではなく太平洋標準時(PST、UTC-8固定)の0時として扱う
+    (https://developers.google.com/gmail/api/guides/filtering)
+    【引数】
+    value：YYYY/MM/DD形式の日付またはUNIX時間
+    【戻り値】
+    UNIX時間(変換できない場合はNone)
+    """
+
+    if value.isdigit():
+        return int(value)
+
+    match = DATE_PATTERN.match(value)
+    if match is None:
+        return None
+
+    year, month, day = (int(group) for group in match.groups())
+    try:
+        return int(datetime.datetime(year, month, day, tzinfo=GMAIL_TIMEZONE).timestamp())
+    except ValueError:
+        return None
+
+
+def parse_query(query):
+    """
+    【処理内容】
+    Gmailの検索クエリをローカルで評価できる条件に変換する
+    from:、to:、cc:、subject:、label:、after:、before:、キーワードに対応する
+    【引数】
+    query：検索クエリ
+        https://support.google.com/mail/answer/7190
+    【戻り値】
+    conditions：条件の辞書(fts、labels、after、before)
+    ローカルで評価できないクエリの場合はNone
+    """
+
+    try:
+        lexer = shlex.shlex(query, posix=True)
+        lexer.whitespace_split = True
+        lexer.quotes = '"'
+        tokens = list(lexer)
+    except ValueError:
+        return None
+
+    conditions = {"fts": [], "labels": [], "after": None, "before": None}
+    for token in tokens:
+        if token in ("OR", "AND") or token[:1] in ("-", "(", "{", "+", "~"):
+            return None
+
+        operator, sep, value = token.partition(":")
+        if not sep or " " in operator:
+            conditions["fts"].append((None, token))
+            continue
+
+        operator = operator.lower()
+        if not operator in OPERATORS or not value:
+            return None
+
+        if operator == "label":
+            conditions["labels"].append(value.lower())
+        elif operator in ("after", "before"):
+            timestamp = parse_date(value)
+            if timestamp is None:
+                return None
+            conditions[operator] = timestamp
+        else:
+            conditions["fts"].append((OPERATORS[operator], value))
+
+    return conditions
+
+
+def to_match_expression(terms):
+    """
+    【処理内容】
+    全文検索の条件をFTS5のMATCH式に変換する
+    【引数】
+    terms：(カラム, 検索語)のリスト
+    【戻り値】
+    MATCH式
+    """
+
+    expressions = []
+    for column, value in terms:
+        phrase = '"' + value.replace('"', '""') + '"'
+        expressions.append(f"{column} : {phrase}" if column else phrase)
+
+    return " AND ".join(expressions)
+
+
+class SearchIndexClass:
+    """
+    【クラス内容】
+    取得したメッセージをSQLite FTS5で索引付けし、ローカルで検索する
+    ローカルで評価できないクエリはGmail APIで検索する
+    日付は受信日時(internalDate、ない場合はDateヘッダー)で索引付けする
+    """
+
+    ##### 変数宣言 #####
+    _conn = None
+    _gmail = None
+    _label_names = None
+    _logger = None
+    _trigram = None
+
+
+    def __init__(self, path_db="search.db", gmail=None, tokenize="trigram"):
+        """
+        【処理内容】
+        検索インデックスを開き、テーブルがなければ作成する
+        【引数】
+        path_db：インデックスのファイル(":memory:"でメモリ上に作成)
+        gmail：GmailClassのオブジェクト(ラベル名の解決、APIでの検索に利用する)
+        tokenize：FTS5のトークナイザ
+            "trigram"は日本語も部分一致で検索できる(既存のインデックスは作成時のトークナイザを使う)
+            それ以外(unicode61など)は日本語などを分かち書きしないため、それらを含むクエリはGmail APIで検索する
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._logger.debug("__init__ start" + location())
+
+        self._gmail = gmail
+        self._conn = sqlite3.connect(path_db)
+        self._conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS messages (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                thread_id TEXT,
+                date INTEGER,
+                size INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS messages_date ON messages (date);
+            CREATE TABLE IF NOT EXISTS labels (
+                message_rowid INTEGER NOT NULL,
+                label TEXT NOT NULL,
+                PRIMARY KEY (label, message_rowid)
+            ) WITHOUT ROWID;
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                {", ".join(FTS_COLUMNS)}, tokenize="{tokenize}"
+            );
+        """)
+
+        # 既存のインデックスは作成時のトークナイザを確認する
+        sql = self._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'messages_fts'").fetchone()[0]
+        self._trigram = "trigram" in sql
+
+        self._logger.debug("__init__ end" + location())
+
+
+    def close(self):
+        """
+        【処理内容】
+        検索インデックスを閉じる
+        【引数】
+        なし
+        【戻り値】
+        なし
+        """
+
+        self._conn.close()
+
+
+    def get_label_names(self):
+        """
+        【処理内容】
+        ラベルIDとラベル名の対応を取得する
+        【引数】
+        なし
+        【戻り値】
+        ラベルIDをキー、ラベル名を値とする辞書
+        """
+
+        if self._label_names is None:
+            self._label_names = {}
+            if not self._gmail is None:
+                labels = self._gmail.get_labels() or []
+                self._label_names = {label["id"]: label["name"] for label in labels}
+
+        return self._label_names
+
+
+    def add_messages(self, messages):
+        """
+        【処理内容】
+        GmailClass.get_messagesで取得したメッセージを索引付けする
+        索引付け済みのメッセージは置き換える
+        【引数】
+        messages：メッセージのリスト
+        【戻り値】
+        count：索引付けしたメッセージ数
+        """
+
+        self._logger.debug("add_messages start" + location())
+
+        count = 0
+        with self._conn:
+            for message in messages:
+                # add_raw_messagesと同じく受信日時を使う(ない場合はDateヘッダー)
+                if "internal_date" in message:
+                    date = int(message["internal_date"]) // 1000
+                else:
+                    try:
+                        date = int(parsedate_to_datetime(message["date"]).timestamp())
+                    except (KeyError, TypeError, ValueError):
+                        date = None
+
+                self.add_message(
+                    message["id"],
+                    message.get("thread_id"),
+                    date,
+                    message.get("size"),
+                    message.get("label_ids", []),
+                    [message.get(key, "") for key in FTS_COLUMNS.values()],
+                )
+                count += 1
+
+        self._logger.debug("add_messages end" + location())
+
+        return count
+
+
+    def add_raw_messages(self, messages):
+        """
+        【処理内容】
+        GmailClass.get_raw_messagesで取得したRFC 822形式のメッセージを索引付けする
+        索引付け済みのメッセージは置き換える
+        【引数】
+        messages：メッセージのイテラブル
+        【戻り値】
+        count：索引付けしたメッセージ数
+        """
+
+        self._logger.debug("add_raw_messages start" + location())
+
+        count = 0
+        with self._conn:
+            for message in messages:
+                mime = email.message_from_bytes(base64.urlsafe_b64decode(message["raw"]), policy=policy.default)
+                part = mime.get_body(preferencelist=("plain", "html"))
+                try:
+                    body = part.get_content() if not part is None else ""
+                except (KeyError, LookupError):
+                    body = ""
+
+                self.add_message(
+                    message["id"],
+                    message.get("threadId"),
+                    int(message["internalDate"]) // 1000 if "internalDate" in message else None,
+                    message.get("sizeEstimate"),
+                    message.get("labelIds", []),
+                    [str(mime.get("subject", "")), str(mime.get("from", "")), str(mime.get("to", "")), str(mime.get("cc", "")), body],
+                )
+                count += 1
+
+        self._logger.debug("add_raw_messages end" + location())
+
+        return count
+
+
+    def add_message(self, message_id, thread_id, date, size, label_ids, fts_values):
+        """
+        【処理内容】
+        メッセージ1件を索引付けする(トランザクションは呼び出し元で管理する)
+        【引数】
+        message_id：メッセージID
+        thread_id：スレッドID
+        date：受信日時(UNIX時間)
+        size：サイズ
+        label_ids：ラベルIDのリスト
+        fts_values：全文検索の対象カラムの値のリスト
+        【戻り値】
+        なし
+        """
+
+        row = self._conn.execute("SELECT rowid FROM messages WHERE id = ?", (message_id,)).fetchone()
+        if not row is None:
+            self._conn.execute("DELETE FROM messages_fts WHERE rowid = ?", row)
+            self._conn.execute("DELETE FROM labels WHERE message_rowid = ?", row)
+            self._conn.execute("DELETE FROM messages WHERE rowid = ?", row)
+
+        rowid = self._conn.execute(
+            "INSERT INTO messages (id, thread_id, date, size) VALUES (?, ?, ?, ?)",
+            (message_id, thread_id, date, size),
+        ).lastrowid
+
+        # ラベルはIDと名前の両方で検索できるようにする
+        label_names = self.get_label_names()
+        labels = set()
+        for label_id in label_ids:
+            labels.add(label_id.lower())
+            if label_id in label_names:
+                name = label_names[label_id].lower()
+                labels.update((name, name.replace(" ", "-").replace("/", "-")))
+
+        self._conn.executemany(
+            "INSERT INTO labels (message_rowid, label) VALUES (?, ?)",
+            [(rowid, label) for label in labels],
+        )
+        self._conn.execute(
+            f"INSERT INTO messages_fts (rowid, {', '.join(FTS_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+            [rowid] + fts_values,
+        )
+
+
+    def search_local(self, query, count=100):
+        """
+        【処理内容】
+        検索インデックスからメッセージIDを検索する
+        【引数】
+        query：検索クエリ
+        count：取得数
+        【戻り値】
+        message_ids：メッセージIDのリスト(新しい順)
+        ローカルで評価できないクエリの場合はNone
+        """
+
+        self._logger.debug("search_local start" + location())
+
+        conditions = parse_query(query)
+        if conditions is None:
+            self._logger.debug("unsupported query: " + query + location())
+            return None
+
+        if not self._trigram and any(CJK_PATTERN.search(value) for _, value in conditions["fts"]):
+            # 分かち書きしないトークナイザでは日本語などを検索できない
+            self._logger.debug("unsupported tokenizer for query: " + query + location())
+            return None
+
+        sql = "SELECT m.id, m.thread_id FROM messages m"
+        where = []
+        params = []
+
+        if conditions["fts"]:
+            # trigramは3文字未満の検索語を検索できないため、LIKEで検索する
+            terms = conditions["fts"]
+            short_terms = [term for term in terms if self._trigram and len(term[1]) < TRIGRAM_LENGTH]
+            terms = [term for term in terms if not term in short_terms]
+
+            sql += " JOIN messages_fts f ON f.rowid = m.rowid"
+            if terms:
+                where.append("messages_fts MATCH ?")
+                params.append(to_match_expression(terms))
+
+            for column, value in short_terms:
+                columns = [column] if column else list(FTS_COLUMNS)
+                where.append("(" + " OR ".join(f"f.{name} LIKE ? ESCAPE '\\'" for name in columns) + ")")
+                pattern = "%" + value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                params.extend([pattern] * len(columns))
+
+        for label in conditions["labels"]:
+            where.append("EXISTS (SELECT 1 FROM labels l WHERE l.label = ? AND l.message_rowid = m.rowid)")
+            params.append(label)
+
+        if not conditions["after"] is None:
+            where.append("m.date >= ?")
+            params.append(conditions["after"])
+
+        if not conditions["before"] is None:
+            where.append("m.date < ?")
+            params.append(conditions["before"])
+
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY m.date DESC LIMIT ?"
+        params.append(count)
+
+        message_ids = [
+            {"id": message_id, "threadId": thread_id}
+            for message_id, thread_id in self._conn.execute(sql, params)
+        ]
+
+        self._logger.debug("search_local end" + location())
+
+        return message_ids
+
+
+    def search(self, query, count=100):
+        """
+        【処理内容】
+        メッセージIDを検索する
+        ローカルで評価できないクエリはGmail APIで検索する
+        【引数】
+        query：検索クエリ
+            https://support.google.com/mail/answer/7190
+        count：取得数
+        【戻り値】
+        message_ids：メッセージIDのリスト(該当なしの場合はNone)
+        """
+
+        self._logger.debug("search start" + location())
+
+        message_ids = self.search_local(query, count=count)
+
+        if message_ids is None:
+            if self._gmail is None:
+                raise ValueError("query cannot be evaluated locally: " + query)
+            self._logger.info("search by api: " + query + location())
+            return self._gmail.get_message_ids(query=query, count=count)
+
+        self._logger.debug("search end" + location())
+
+        return message_ids or None
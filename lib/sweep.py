@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+@name           sweep.py
+@author         yoshi0518
+@description    ラベル・検索クエリのメッセージを一括取得(スイープ)する処理のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+import time
+
+from apiclient import errors
+
+from .gmail import is_throttled, location, parse_message
+from .pipeline import parse_raw_message
+
+
+##### 定数宣言 #####
+FORMATS = ("full", "metadata", "raw") # 取得形式
+RESULT_OK = "ok" # 取得できた
+RESULT_RETRY = "retry" # 制限(429など)により再試行する
+RESULT_ERROR = "error" # 取得・解析できない(削除済み、文字コードの不正など)
+
+
+class SweepClass:
+    """
+    【クラス内容】
+    メッセージIDの一覧取得とメッセージの取得を重ねて実行する
+    ページNのメッセージを取得している間にページN+1の一覧を取得する
+    取得の並列数は応答時間と制限(429など)に応じて増減し(AIMD)、
+    一覧の取得待ちが発生した場合はページサイズを大きくする
+    調整した値は次のラベル・検索クエリに引き継ぐ
+    """
+
+    ##### 変数宣言 #####
+    page_size = None
+    stats = None
+    workers = None
+    _backoff = None
+    _fmt = None
+    _gmail = None
+    _latency = None
+    _latency_target = None
+    _logger = None
+    _max_page_size = None
+    _max_workers = None
+    _min_page_size = None
+    _min_workers = None
+    _pause_until = None
+    _retries = None
+    _successes = None
+
+
+    def __init__(
+        self, gmail, fmt="full", page_size=100, min_page_size=10, max_page_size=500,
+        workers=4, min_workers=1, max_workers=32, latency_target=1.0, retries=5, backoff=1.0
+    ):
+        """
+        【処理内容】
+        スイープの初期設定を行う
+        【引数】
+        gmail：GmailClassのオブジェクト
+        fmt：取得形式(full、metadata、raw)
+        page_size：1ページあたりの取得数の初期値
+        min_page_size、max_page_size：1ページあたりの取得数の範囲(最大500)
+        workers：取得の並列数の初期値
+        min_workers、max_workers：取得の並列数の範囲
+        latency_target：1件あたりの応答時間の目安(秒、超えている間は並列数を増やさない)
+        retries：制限された場合の再試行回数
+        backoff：制限された場合の待機秒数(連続するごとに2倍)
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._logger.debug("__init__ start" + location())
+
+        if not fmt in FORMATS:
+            raise ValueError(f"unsupported format: {fmt}")
+
+        self._gmail = gmail
+        self._fmt = fmt
+        self.page_size = page_size
+        self._min_page_size = min_page_size
+        self._max_page_size = min(max_page_size, 500)
+        self.workers = workers
+        self._min_workers = min_workers
+        self._max_workers = max_workers
+        self._latency_target = latency_target
+        self._retries = retries
+        self._backoff = backoff
+        self._latency = None
+        self._pause_until = 0.0
+        self._successes = 0
+        self.stats = {"pages": 0, "messages": 0, "errors": 0, "throttled": 0, "list_waits": 0}
+
+        self._logger.debug("__init__ end" + location())
+
+
+    def sweep(self, query=None, label_id=None):
+        """
+        【処理内容】
+        検索クエリ・ラベルに一致するメッセージをすべて取得する
+        【引数】
+        query：検索クエリ
+            https://support.google.com/mail/answer/7190
+        label_id：ラベルID
+        【戻り値】
+        メッセージの辞書のジェネレータ(取得できた順、GmailClass.get_messagesと同じ形式)
+        """
+
+        for _, message in self.sweep_all([(query, label_id)]):
+            yield message
+
+
+    def sweep_labels(self, label_ids, query=None):
+        """
+        【処理内容】
+        ラベルごとにメッセージをすべて取得する
+        次のラベルの最初のページは、前のラベルの最後のページを取得している間に一覧を取得する
+        【引数】
+        label_ids：ラベルIDのリスト
+        query：検索クエリ
+        【戻り値】
+        (ラベルID, メッセージの辞書)のジェネレータ
+        """
+
+        for (_, label_id), message in self.sweep_all([(query, label_id) for label_id in label_ids]):
+            yield label_id, message
+
+
+    def sweep_all(self, targets):
+        """
+        【処理内容】
+        検索クエリ・ラベルの組ごとにメッセージをすべて取得する
+        【引数】
+        targets：(検索クエリ, ラベルID)のリスト
+        【戻り値】
+        ((検索クエリ, ラベルID), メッセージの辞書)のジェネレータ
+        """
+
+        self._logger.debug("sweep_all start" + location())
+
+        targets = deque(targets)
+        if not targets:
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as lister, ThreadPoolExecutor(max_workers=self._max_workers) as fetcher:
+            target = targets.popleft()
+            page_future = lister.submit(self.list_page, target, None, self.page_size)
+
+            while not page_future is None:
+                if not page_future.done():
+                    # 一覧の取得待ちが発生したため、次からは1回でより多く取得する
+                    self.stats["list_waits"] += 1
+                    self.page_size = min(self._max_page_size, self.page_size * 2)
+
+                res = page_future.result()
+                current = target
+
+                # 取得を始める前に次のページの一覧の取得を始める
+                if "nextPageToken" in res:
+                    page_future = lister.submit(self.list_page, target, res["nextPageToken"], self.page_size)
+                elif targets:
+                    target = targets.popleft()
+                    page_future = lister.submit(self.list_page, target, None, self.page_size)
+                else:
+                    page_future = None
+
+                message_ids = [message_id["id"] for message_id in res.get("messages", [])]
+                self.stats["pages"] += 1
+                self._logger.debug(
+                    f"page: {self.stats['pages']} messages: {len(message_ids)}"
+                    f" page_size: {self.page_size} workers: {self.workers}" + location()
+                )
+
+                for message in self.fetch_page(message_ids, fetcher):
+                    yield current, message
+
+        self._logger.debug("sweep_all end" + location())
+
+
+    def list_page(self, target, page_token, page_size):
+        """
+        【処理内容】
+        メッセージIDを1ページ取得する
+        制限された場合は待機して再試行し、ページサイズを小さくする
+        【引数】
+        target：(検索クエリ, ラベルID)
+        page_token：ページトークン(最初のページはNone)
+        page_size：1ページあたりの取得数
+        【戻り値】
+        messages().listの結果
+        """
+
+        query, label_id = target
+
+        for attempt in range(self._retries + 1):
+            try:
+                return self._gmail.list_messages(query, label_id, page_token, page_size)
+            except errors.HttpError as error:
+                if attempt == self._retries or not is_throttled(error):
+                    raise
+
+                self.stats["throttled"] += 1
+                self.page_size = max(self._min_page_size, self.page_size // 2)
+                page_size = self.page_size
+                self._logger.warning(f"list retry {attempt + 1}/{self._retries}: {error}" + location())
+                time.sleep(self._backoff * 2 ** attempt)
+
+
+    def fetch(self, message_id):
+        """
+        【処理内容】
+        メッセージを1件取得する
+        ワーカースレッドで実行する
+        【引数】
+        message_id：メッセージID
+        【戻り値】
+        (結果の種類, メッセージの辞書またはエラー, 応答時間)
+        """
+
+        start = time.monotonic()
+        try:
+            message_detail = self._gmail.get_message(message_id, fmt=self._fmt)
+        except errors.HttpError as error:
+            return (RESULT_RETRY if is_throttled(error) else RESULT_ERROR), error, time.monotonic() - start
+
+        # 1件の解析の失敗(文字コードの不正など)でスイープ全体が止まらないよう、取得できないものとして扱う
+        try:
+            message = parse_raw_message(message_detail) if self._fmt == "raw" else parse_message(message_detail)
+        except Exception as error:
+            return RESULT_ERROR, error, time.monotonic() - start
+
+        return RESULT_OK, message, time.monotonic() - start
+
+
+    def fetch_page(self, message_ids, fetcher):
+        """
+        【処理内容】
+        1ページ分のメッセージを、調整した並列数で取得する
+        【引数】
+        message_ids：メッセージIDのリスト
+        fetcher：取得に使うThreadPoolExecutor
+        【戻り値】
+        メッセージの辞書のジェネレータ(取得できた順)
+        """
+
+        pending = deque(message_ids)
+        attempts = {}
+        futures = {}
+
+        while pending or futures:
+            while pending and len(futures) < self.workers:
+                wait_seconds = self._pause_until - time.monotonic()
+                if wait_seconds > 0 and futures:
+                    break
+                if wait_seconds > 0:
+                    time.sleep(wait_seconds)
+
+                message_id = pending.popleft()
+                futures[fetcher.submit(self.fetch, message_id)] = message_id
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                message_id = futures.pop(future)
+                result, value, latency = future.result()
+
+                if result == RESULT_OK:
+                    self.on_success(latency)
+                    self.stats["messages"] += 1
+                    yield value
+
+                elif result == RESULT_RETRY and attempts.get(message_id, 0) < self._retries:
+                    attempts[message_id] = attempts.get(message_id, 0) + 1
+                    self.on_throttle(attempts[message_id])
+                    pending.append(message_id)
+
+                else:
+                    self.stats["errors"] += 1
+                    self._logger.warning("failed to get message: " + message_id + f" {value}" + location())
+
+
+    def on_success(self, latency):
+        """
+        【処理内容】
+        取得できた場合に並列数を調整する
+        並列数と同じ件数を取得するごとに1増やす(応答時間が目安を超えている間は増やさず、2倍を超えたら1減らす)
+        【引数】
+        latency：応答時間(秒)
+        【戻り値】
+        なし
+        """
+
+        self._latency = latency if self._latency is None else self._latency * 0.8 + latency * 0.2
+
+        self._successes += 1
+        if self._successes < self.workers:
+            return
+        self._successes = 0
+
+        if self._latency > self._latency_target * 2:
+            self.workers = max(self._min_workers, self.workers - 1)
+        elif self._latency <= self._latency_target:
+            self.workers = min(self._max_workers, self.workers + 1)
+
+
+    def on_throttle(self, attempt):
+        """
+        【処理内容】
+        制限された場合に並列数を半分にし、取得を一時停止する
+        【引数】
+        attempt：そのメッセージの再試行回数
+        【戻り値】
+        なし
+        """
+
+        self.stats["throttled"] += 1
+        self.workers = max(self._min_workers, self.workers // 2)
+        self._successes = 0
+        self._pause_until = max(self._pause_until, time.monotonic() + self._backoff * 2 ** (attempt - 1))
+
+        self._logger.debug("throttled: workers: " + str(self.workers) + location())
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+@name           template.py
+@author         yoshi0518
+@description    大量送信向けのメッセージテンプレートに関する処理のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import base64
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import logging
+from string import Template
+import uuid
+
+from .gmail import location
+
+
+class MessageTemplateClass:
+    """
+    【クラス内容】
+    宛先ごとに変わらないMIMEパートを事前にエンコードしておき、宛先ごとのメッセージを高速に作成する
+    件名、本文は string.Template の $name 形式で差し込みができる
+    """
+
+    ##### 変数宣言 #####
+    _body = None
+    _boundary = None
+    _encoded_tail = None
+    _enc = "utf-8"
+    _gmail = None
+    _logger = None
+    _sender = None
+    _subject = None
+    _text_part = None
+
+
+    def __init__(self, gmail, subject, body, sender, files=None):
+        """
+        【処理内容】
+        テンプレートを作成し、添付ファイルのMIMEパートを事前にエンコードする
+        【引数】
+        gmail：GmailClassのオブジェクト
+        subject：件名(差し込み可)
+        body：本文(差し込み可)
+        sender：送信元
+        files：添付ファイルのリスト
+        【戻り値】
+        なし
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._logger.debug("__init__ start" + location())
+
+        self._gmail = gmail
+        self._subject = Template(subject)
+        self._body = Template(body)
+        self._sender = sender
+
+        if files:
+            self._boundary = "=" * 15 + uuid.uuid4().hex + "=="
+
+            # 差し込みがない本文のパートは使い回す
+            if self._body.pattern.search(body) is None:
+                self._text_part = MIMEText(body.encode(self._enc), _charset=self._enc)
+
+            # 添付ファイルのパートは終端の区切りまで含めてbase64エンコードしておく
+            parts = []
+            for index, file in enumerate(files):
+                self._logger.debug("file" + str(index + 1) + ": " + file + location())
+                parts.append(self._gmail.get_attachment(file).as_bytes())
+
+            delimiter = b"\n--" + self._boundary.encode()
+            tail = (delimiter + b"\n").join(parts) + delimiter + b"--\n"
+
+            self._encoded_tail = base64.urlsafe_b64encode(tail).decode()
+
+        self._logger.debug("__init__ end" + location())
+
+
+    def render(self, to, cc=None, bcc=None, **values):
+        """
+        【処理内容】
+        宛先ごとのメッセージを作成し、base64エンコードする
+        【引数】
+        to：宛先
+        cc：カーボンコピー
+        bcc：ブラインドカーボンコピー
+        values：件名、本文に差し込む値
+        【戻り値】
+        エンコードしたMIMEText
+        """
+
+        if self._encoded_tail is None:
+            message = MIMEText(self._body.safe_substitute(values).encode(self._enc), _charset=self._enc)
+        else:
+            message = MIMEMultipart(boundary=self._boundary)
+
+        message["subject"] = self._subject.safe_substitute(values)
+        message["from"] = self._sender
+        message["to"] = to
+
+        if cc:
+            message["cc"] = cc
+
+        if bcc:
+            message["bcc"] = bcc
+
+        if self._encoded_tail is None:
+            return {"raw": base64.urlsafe_b64encode(message.as_bytes()).decode()}
+
+        if self._text_part is None:
+            message.attach(MIMEText(self._body.safe_substitute(values).encode(self._enc), _charset=self._enc))
+        else:
+            message.attach(self._text_part)
+
+        # 本文パートまでを作成し、終端の区切りを次のパートの区切りに置き換える
+        head = message.as_bytes()
+        head = head[:-len(self._boundary) - 5] + b"--" + self._boundary.encode() + b"\n"
+
+        # 3バイト単位に揃えると、base64エンコード済みの添付ファイルをそのまま連結できる
+        # 揃えるための余白はMIMEのプリアンブル(読み飛ばされる領域)に入れる
+        padding = (b"", b"\n", b" \n")[-len(head) % 3]
+        if padding:
+            separator = head.index(b"\n\n") + 2
+            head = head[:separator] + padding + head[separator:]
+
+        return {"raw": base64.urlsafe_b64encode(head).decode() + self._encoded_tail}
+
+
+    def send(self, to, cc=None, bcc=None, validate=True, **values):
+        """
+        【処理内容】
+        宛先ごとのメッセージを作成し、送信する
+        【引数】
+        to：宛先
+        cc：カーボンコピー
+        bcc：ブラインドカーボンコピー
+        validate：宛先を検証する(不正なアドレスがある場合はValueError)
+        values：件名、本文に差し込む値
+        【戻り値】
+        message_id：メッセージID
+        """
+
+        self._logger.debug("send start" + location())
+
+        if validate:
+            to, cc, bcc = self._gmail.validate_recipients(to, cc, bcc)
+
+        message_id = self._gmail.send_encoded_message(self.render(to, cc=cc, bcc=bcc, **values))
+
+        self._logger.debug("send end" + location())
+
+        return message_id
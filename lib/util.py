@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+@name           util.py
+@author         yoshi0518
+@description    外部ライブラリに依存しない共通処理のモジュール
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import inspect
+import os
+
+
+def location():
+    """
+    【処理内容】
+    location関数を実行したファイル名、行数を取得する
+    【引数】
+    なし
+    【戻り値】
+    ファイル名、行数
+    """
+
+    frame = inspect.currentframe().f_back
+    fname = os.path.basename(frame.f_code.co_filename)
+    line = frame.f_lineno
+    return f" ({fname}:{line})"
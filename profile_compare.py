@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+@name           profile_compare.py
+@author         yoshi0518
+@description    処理時間のレポート(gmail_cli.py -P、lib.gmail.profile)を比較する
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import logging
+from optparse import OptionParser
+
+import lib.profiler
+import lib.util
+
+
+##### 定数宣言 #####
+LOG_LEVEL = logging.INFO
+# LOG_LEVEL = logging.DEBUG
+LOG_MESSAGE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+def main():
+
+    usage = """
+  %prog "base.json" "current.json" """
+
+    parser = OptionParser(usage=usage)
+
+    # 引数を取得
+    _, args = parser.parse_args()
+
+    if len(args) != 2:
+        parser.error("two report files are required")
+
+    base = lib.profiler.load_report(args[0])
+    current = lib.profiler.load_report(args[1])
+
+    logger.debug("base: " + args[0] + " current: " + args[1] + lib.util.location())
+
+    logger.info(f"{'phase':<20}{'base':>10}{'current':>10}{'diff':>10}{'ratio':>8}" + lib.util.location())
+    for name, base_seconds, current_seconds, diff, ratio in lib.profiler.compare_reports(base, current):
+        ratio = "-" if ratio is None else f"{ratio:.2f}x"
+        logger.info(
+            f"{name:<20}{base_seconds:>10.3f}{current_seconds:>10.3f}{diff:>+10.3f}{ratio:>8}" + lib.util.location()
+        )
+
+
+if __name__ == "__main__":
+
+    # ロギング準備
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format=LOG_MESSAGE_FORMAT,
+        datefmt=LOG_DATE_FORMAT
+    )
+    logger = logging.getLogger(__name__)
+
+    # 処理開始
+    logger.info(__file__ + " start" + lib.util.location())
+
+    main()
+
+    # 処理終了
+    logger.info(__file__ + " end" + lib.util.location())
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+@name           search_messages.py
+@author         yoshi0518
+@description    メッセージをローカルの検索インデックスで検索する
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import logging
+
+import lib.gmail
+import lib.search
+
+
+##### 定数宣言 #####
+LOG_LEVEL = logging.INFO
+# LOG_LEVEL = logging.DEBUG
+LOG_MESSAGE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+if __name__ == "__main__":
+
+    # ロギング準備
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format=LOG_MESSAGE_FORMAT,
+        datefmt=LOG_DATE_FORMAT
+    )
+    logger = logging.getLogger(__name__)
+
+    # 処理開始
+    logger.info(__file__ + " start" + lib.gmail.location())
+
+    # Gmailオブジェクトを取得
+    gmail = lib.gmail.GmailClass()
+
+    # 検索インデックスを取得
+    index = lib.search.SearchIndexClass("./config/search.db", gmail=gmail)
+
+    # メッセージを取得して索引付け
+    message_ids = gmail.get_message_ids(count=100)
+    if message_ids is None:
+        logger.warning("no result data!")
+    else:
+        messages = gmail.get_messages([message_id["id"] for message_id in message_ids])
+        count = index.add_messages(messages)
+        logger.info("indexed: " + str(count) + lib.gmail.location())
+
+    # ローカルで検索(評価できないクエリはGmail APIで検索)
+    for query in ["from:from@example.com", "subject:report after:2020/11/01", "label:inbox 請求書", "has:attachment"]:
+        message_ids = index.search(query)
+        logger.info("query: " + query + " message_ids: " + str(message_ids) + lib.gmail.location())
+
+    index.close()
+
+    # 処理終了
+    logger.info(__file__ + " end" + lib.gmail.location())
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+@name           send_drafts.py
+@author         yoshi0518
+@description    下書きを事前に作成し、まとめて送信する
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import logging
+
+import lib.gmail
+import lib.template
+
+
+##### 定数宣言 #####
+LOG_LEVEL = logging.INFO
+# LOG_LEVEL = logging.DEBUG
+LOG_MESSAGE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+if __name__ == "__main__":
+
+    # ロギング準備
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format=LOG_MESSAGE_FORMAT,
+        datefmt=LOG_DATE_FORMAT
+    )
+    logger = logging.getLogger(__name__)
+
+    # 処理開始
+    logger.info(__file__ + " start" + lib.gmail.location())
+
+    # Gmailオブジェクトを取得
+    gmail = lib.gmail.GmailClass(path_json="./config/credentials.json")
+
+    # テンプレートを作成
+    template = lib.template.MessageTemplateClass(
+        gmail,
+        "$name 様 月次レポート",
+        "$name 様\n\n月次レポートを送付します。\n",
+        "from@example.com",
+        files=["./attach/sample.pdf", "./attach/sample.xlsx"],
+    )
+
+    # 宛先リスト
+    recipients = [
+        ("to1@example.com", "山田"),
+        ("to2@example.com", "鈴木"),
+        ("to3@example.com", "佐藤"),
+    ]
+
+    # 下書きを作成(承認前に作成しておく)
+    # 結果は宛先リストと同じ順(作成に失敗した宛先はNone)
+    draft_ids = gmail.create_drafts(template.render(to, name=name) for to, name in recipients)
+    for (to, _), draft_id in zip(recipients, draft_ids):
+        logger.info("to: " + to + " draft_id: " + str(draft_id) + lib.gmail.location())
+    draft_ids = [draft_id for draft_id in draft_ids if not draft_id is None]
+
+    # 下書きを確認
+    drafts = gmail.get_drafts()
+    logger.info("drafts: " + str(drafts) + lib.gmail.location())
+
+    # 下書きを送信(1秒あたり5件まで)
+    sent = gmail.send_drafts(draft_ids, workers=4, rate=5)
+    for draft_id, message_id in sent.items():
+        logger.info("draft_id: " + draft_id + " message_id: " + str(message_id) + lib.gmail.location())
+
+    # 処理終了
+    logger.info(__file__ + " end" + lib.gmail.location())
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+@name           send_outbox.py
+@author         yoshi0518
+@description    送信待ちに追加したメッセージを送信ワーカーで送信する
+@created        2026/10/19
+@modified       2026/10/19
+"""
+
+import logging
+
+import lib.gmail
+import lib.ledger
+import lib.outbox
+
+
+##### 定数宣言 #####
+LOG_LEVEL = logging.INFO
+# LOG_LEVEL = logging.DEBUG
+LOG_MESSAGE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+if __name__ == "__main__":
+
+    # ロギング準備
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format=LOG_MESSAGE_FORMAT,
+        datefmt=LOG_DATE_FORMAT
+    )
+    logger = logging.getLogger(__name__)
+
+    # 処理開始
+    logger.info(__file__ + " start" + lib.gmail.location())
+
+    # Gmailオブジェクトを取得
+    gmail = lib.gmail.GmailClass(path_json="./config/credentials.json")
+
+    # 送信待ちのキューと台帳を開く
+    outbox = lib.outbox.OutboxClass("./config/outbox.db")
+    ledger = lib.ledger.SendLedgerClass("./config/send_ledger.db")
+
+    # 送信待ちに追加(すぐに戻る)
+    # 冪等キーを指定しているため、再実行しても二重に追加しない
+    for to in ["to1@example.com", "to2@example.com", "to3@example.com"]:
+        item_id = gmail.send_message("subject", "body", "from@example.com", to, outbox=outbox, key="sample-" + to)
+        logger.info("item_id: " + str(item_id) + lib.gmail.location())
+
+    # 宛先ごとに1通ずつ、ドメインが交互になるように追加(同じドメインへは10秒間隔、不正なアドレスは追加しない)
+    recipients = "to1@example.com, to2@example.net, to3@example.com, invalid"
+    item_ids, invalid = outbox.enqueue_bulk(
+        "bulk subject", "bulk body", "from@example.com", recipients, domain_interval=10, key="sample-bulk"
+    )
+    logger.info("item_ids: " + str(item_ids) + " invalid: " + str(invalid) + lib.gmail.location())
+
+    # 送信待ちがなくなるまで送信(4スレッド、1秒あたり5件まで)
+    # 途中で終了しても、再実行すると送信中だったメッセージから再開する
+    worker = lib.outbox.OutboxWorkerClass(gmail, outbox, ledger, workers=4, rate=5)
+    counts = worker.run()
+    logger.info("counts: " + str(counts) + lib.gmail.location())
+
+    # デッドレターを確認
+    for item in outbox.get_items(lib.outbox.STATUS_DEAD):
+        logger.info("dead: " + str(item["id"]) + " " + str(item["error"]) + lib.gmail.location())
+
+    outbox.close()
+    ledger.close()
+
+    # 処理終了
+    logger.info(__file__ + " end" + lib.gmail.location())